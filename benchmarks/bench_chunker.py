@@ -0,0 +1,80 @@
+'''
+Times `TranscriptChunker` on multi-megabyte synthetic transcriptions and checks its cut points:
+    - the spans cover the whole transcription, tail included;
+    - no chunk is larger than the token budget;
+    - without overlap, consecutive spans are contiguous; with overlap, each span still moves forward;
+    - cuts fall on sentence boundaries whenever the sentence fits in a chunk.
+
+Usage:
+    python benchmarks/bench_chunker.py --sizes 1 4 16
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from chunker import TranscriptChunker
+
+WORDS = ["the", "video", "shows", "how", "a", "model", "learns", "from", "data", "and", "then", "we", "talk", "about", "results"]
+PUNCTUATION = [".", ".", "?", "!"]
+
+
+def make_transcription(size_bytes: int, seed: int = 0, punctuated: bool = True) -> str:
+    '''Builds a random transcription of roughly `size_bytes` characters.'''
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size_bytes:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+        if punctuated:
+            sentence += rng.choice(PUNCTUATION)
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(parts)
+
+
+def check_spans(chunker: TranscriptChunker, transcription: str, spans: list):
+    assert spans[0][0] == 0, "the first chunk does not start at the beginning of the transcription"
+    assert spans[-1][1] == len(transcription), "the tail of the transcription is missing"
+    for start, end in spans:
+        assert end - start <= chunker.max_chars, f"chunk {start}:{end} is larger than {chunker.max_chars} chars"
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        assert start < next_start <= end < next_end, f"chunks {start}:{end} and {next_start}:{next_end} do not move forward"
+        if chunker.overlap_chars == 0:
+            assert next_start == end, f"chunks {start}:{end} and {next_start}:{next_end} are not contiguous"
+
+
+def check_sentence_cuts(transcription: str, spans: list):
+    for _, end in spans[:-1]:
+        assert transcription[:end].rstrip()[-1] in ".?!", f"cut at {end} is not on a sentence boundary"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and check the transcription chunker.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="Sizes of the synthetic transcriptions, in MB.")
+    parser.add_argument("--max_tokens", type=int, default=2000, help="Token budget of each chunk.")
+    parser.add_argument("--overlap_tokens", type=int, nargs="+", default=[0, 50], help="Overlap values to check.")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        for punctuated in (True, False):
+            transcription = make_transcription(int(size * 1024 * 1024), punctuated=punctuated)
+            for overlap_tokens in args.overlap_tokens:
+                chunker = TranscriptChunker(args.max_tokens, overlap_tokens, "llama-3.1-70b-versatile")
+                start = time.perf_counter()
+                spans = chunker.split_spans(transcription)
+                elapsed = time.perf_counter() - start
+
+                check_spans(chunker, transcription, spans)
+                if punctuated:
+                    check_sentence_cuts(transcription, spans)
+                print(f"{size:>6.1f} MB punctuated={punctuated!s:<5} overlap={overlap_tokens:<4} chunks={len(spans):<6} "
+                      f"time={elapsed:.3f}s ({size / elapsed:.1f} MB/s)")
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+'''
+Measures the cold start of the entry points: every target is run `--repeats` times in a fresh interpreter with `-X importtime`, and the
+median wall time, the median cumulative import time and the slowest top-level imports are reported. It also checks that the SDKs of the
+backends (groq, openai, gtts, pytubefix, faster_whisper) are not imported before a backend is used, see `backends.py`.
+
+Targets:
+    - main: `import main`;
+    - pipeline: `import main` and `PolySummaryYT()`, without running any step;
+    - cli: `inference_cli.py --help`;
+    - app: `import app` (the Gradio UI, needs gradio installed).
+
+Usage:
+    python benchmarks/bench_imports.py --targets main pipeline cli --repeats 5
+'''
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC_FOLDER = os.path.join(ROOT_FOLDER, 'src')
+
+LAZY_MODULES = ["groq", "openai", "gtts", "pytubefix", "faster_whisper"]
+CHECK_LAZY = f"import sys; print('LAZY_IMPORTED', [m for m in {LAZY_MODULES!r} if m in sys.modules], file=sys.stderr)"
+
+TARGETS = {
+    "main": ["-c", f"import main; {CHECK_LAZY}"],
+    "pipeline": ["-c", f"import main; main.PolySummaryYT(); {CHECK_LAZY}"],
+    "cli": [os.path.join(ROOT_FOLDER, "inference_cli.py"), "--help"],
+    "app": ["-c", "import app"],
+}
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_target(target: str, cwd: str) -> dict:
+    '''Runs a target in a fresh interpreter and returns its wall time, its import times and the lazy modules it imported.'''
+    env = dict(os.environ, PYTHONPATH=SRC_FOLDER, TRACES_PATH="")
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", *TARGETS[target]], cwd=cwd, env=env, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"target {target} failed:\n{process.stderr[-2000:]}")
+
+    top_level_imports = {}
+    lazy_imported = None
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match and len(match.group(3)) == 1:
+            top_level_imports[match.group(4)] = int(match.group(2)) / 1e6
+        elif line.startswith("LAZY_IMPORTED"):
+            lazy_imported = line[len("LAZY_IMPORTED "):]
+    return {"wall_seconds": wall_seconds, "imports": top_level_imports, "lazy_imported": lazy_imported}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the entry points.")
+    parser.add_argument("--targets", type=str, nargs="+", default=["main", "pipeline", "cli"], choices=list(TARGETS), help="The entry points to measure.")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs of each target; the medians are reported.")
+    parser.add_argument("--top", type=int, default=8, help="Number of slowest top-level imports to show.")
+    args = parser.parse_args()
+
+    # every run starts in an empty folder, so that the caches and databases are created from scratch as in a new container
+    with tempfile.TemporaryDirectory() as folder:
+        for target in args.targets:
+            runs = [run_target(target, folder) for _ in range(args.repeats)]
+            wall_seconds = statistics.median(run["wall_seconds"] for run in runs)
+            import_seconds = statistics.median(sum(run["imports"].values()) for run in runs)
+            print(f"{target:>9}: wall {wall_seconds * 1000:8.1f} ms | imports {import_seconds * 1000:8.1f} ms")
+
+            slowest = sorted(runs[-1]["imports"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+            for module, seconds in slowest:
+                print(f"{'':>11}{module:<30} {seconds * 1000:8.1f} ms")
+            if runs[-1]["lazy_imported"] is not None:
+                print(f"{'':>11}backend SDKs imported: {runs[-1]['lazy_imported']}")
+                assert runs[-1]["lazy_imported"] == "[]", f"target {target} imports backend SDKs before using them"
+
+
+if __name__ == "__main__":
+    main()
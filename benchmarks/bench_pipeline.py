@@ -0,0 +1,191 @@
+'''
+End-to-end benchmark of `PolySummaryYT` with every remote service replaced by the local fakes of `fakes.py`.
+
+Three workloads are measured, each in a fresh cache folder:
+    - single: `summarize_video` on many videos, `--concurrency` requests at a time;
+    - multi: `summarize_video_multi` on many videos, every video in all the `--languages`;
+    - batch: `BatchPipeline.run` on all the videos and languages.
+For each workload the throughput (results per second) and the p50/p95/p99 latency of the results are reported, with the mean time
+of every pipeline stage and the bytes uploaded for the transcription. With `--warm` each workload is run a second time on the same caches,
+to measure the cached path. The audio is transcribed while it is downloaded (the default path of the pipeline, it needs ffmpeg) unless
+`--no_stream` is given.
+
+Usage:
+    python benchmarks/bench_pipeline.py --videos 8 --languages italian english --llm_latency 0.5 --error_rate 0.02 --warm
+'''
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# the traces of the fake requests are not worth keeping
+os.environ.setdefault('TRACES_PATH', '')
+
+from audiopreprocessor import AudioPreprocessor
+from batch import BatchPipeline
+from checkpoints import CheckpointStore
+from fakes import FakeService, Fake_VideoDownloader, Fake_Transcriptor, Fake_Translator, Fake_TTSGenerator
+from main import PolySummaryYT
+from metrics import METRICS
+from ratelimiter import RateLimiter
+from stagecache import StageCache
+from summarymemo import SummaryMemo
+
+WORKLOADS = ["single", "multi", "batch"]
+
+
+def percentile(values: list, q: float) -> float:
+    '''Nearest-rank percentile of `values` (q in [0, 100]).'''
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def build_summarizer(args, folder: str) -> PolySummaryYT:
+    '''Builds a `PolySummaryYT` whose steps all use the fakes, with the caches in `folder`.'''
+    def service(latency, seconds_per_mb = 0.0, seed = 0):
+        return FakeService(latency, args.jitter, args.error_rate, seconds_per_mb, seed)
+
+    rate_limiter = None
+    if args.llm_rpm or args.llm_tpm:
+        rate_limiter = RateLimiter("fake_llm", args.llm_rpm, args.llm_tpm)
+    tts_generators = {name: Fake_TTSGenerator(os.path.join(folder, "translated_audio"), service(args.tts_latency, seed=3), generator_name=name)
+                      for name in ("openai", "gtts")}
+    return PolySummaryYT(
+        stage_cache = StageCache(os.path.join(folder, "stage_cache.sqlite")),
+        videodownloader = Fake_VideoDownloader(os.path.join(folder, "download_audio"), service(args.download_latency, 0.05, seed=0),
+                                               int(args.audio_mb * 1024**2), supports_streaming=not args.no_stream),
+        videotranscriptor = Fake_Transcriptor(service(args.transcription_latency, 0.2, seed=1), args.words_per_mb,
+                                              captions_rate=args.captions_rate, captions_service=service(args.captions_latency, seed=4)),
+        translator = Fake_Translator(service(args.llm_latency, seed=2), max_workers=args.chunk_workers, rate_limiter=rate_limiter,
+                                     target_summary_chars=args.target_summary_chars, content_defined_chunks=args.content_defined_chunks,
+                                     summary_memo=SummaryMemo(os.path.join(folder, "summary_memo.sqlite"))),
+        tts_generators = tts_generators,
+        checkpoint_store = CheckpointStore(os.path.join(folder, "checkpoints.sqlite")),
+        audio_preprocessor = AudioPreprocessor(os.path.join(folder, "preprocessed_audio")),
+    )
+
+
+def run_single(summarizer, urls, languages, args):
+    language = languages[0]
+
+    def summarize(url):
+        start = time.perf_counter()
+        summarizer.summarize_video(url, language)
+        return time.perf_counter() - start
+
+    latencies, failures = [], 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(summarize, url) for url in urls]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                failures += 1
+    return latencies, failures
+
+
+def run_multi(summarizer, urls, languages, args):
+    def summarize(url):
+        start = time.perf_counter()
+        summarizer.summarize_video_multi(url, languages)
+        return time.perf_counter() - start
+
+    latencies, failures = [], 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(summarize, url) for url in urls]
+        for future in futures:
+            try:
+                # a video is a single request producing one result per language
+                latencies += [future.result()] * len(languages)
+            except Exception:
+                failures += len(languages)
+    return latencies, failures
+
+
+def run_batch(summarizer, urls, languages, args):
+    manifest_path = os.path.join(os.path.dirname(summarizer.stage_cache.db_path), "manifest.jsonl")
+    records = BatchPipeline(summarizer).run(urls, languages, manifest_path)
+    latencies = [record["elapsed_seconds"] for record in records if record["status"] == "ok"]
+    return latencies, len(records) - len(latencies)
+
+
+def stage_means() -> dict:
+    '''Mean seconds of every stage recorded in the metrics, keyed by stage.'''
+    means = {}
+    for histogram in METRICS.to_dict()["histograms"]:
+        if histogram["name"] == "polysummary_stage_seconds" and histogram["labels"]["status"] == "ok" and histogram["count"]:
+            means[histogram["labels"]["stage"]] = (histogram["sum"] / histogram["count"], histogram["count"])
+    return means
+
+
+def upload_bytes() -> int:
+    '''Bytes uploaded for the transcription, recorded in the metrics.'''
+    return sum(counter["value"] for counter in METRICS.to_dict()["counters"] if counter["name"] == "polysummary_upload_bytes_total")
+
+
+def report(workload, latencies, failures, wall_seconds):
+    n_results = len(latencies)
+    print(f"{workload:<14} results {n_results:>4}  failed {failures:>3}  wall {wall_seconds:8.2f}s  "
+          f"throughput {n_results / wall_seconds:7.2f}/s  "
+          f"p50 {percentile(latencies, 50):7.2f}s  p95 {percentile(latencies, 95):7.2f}s  p99 {percentile(latencies, 99):7.2f}s")
+    print("    stages: " + ", ".join(f"{stage} {mean:.2f}s x{count}" for stage, (mean, count) in sorted(stage_means().items())))
+    print(f"    transcription upload: {upload_bytes() / 1024**2:.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline end to end against local fake services.")
+    parser.add_argument("--workloads", type=str, nargs="+", choices=WORKLOADS, default=WORKLOADS, help="The workloads to run.")
+    parser.add_argument("--videos", type=int, default=8, help="Number of distinct videos of each workload.")
+    parser.add_argument("--languages", type=str, nargs="+", default=["italian", "english"], help="Destination languages (single uses the first one).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at the same time in the single and multi workloads.")
+    parser.add_argument("--chunk_workers", type=int, default=4, help="max_workers of the translator.")
+    parser.add_argument("--audio_mb", type=float, default=4, help="Size of the fake audio of each video, in MB.")
+    parser.add_argument("--words_per_mb", type=int, default=2000, help="Words of fake transcription for each MB of audio.")
+    parser.add_argument("--captions_rate", type=float, default=0.0, help="Fraction of the videos with usable captions (no download nor transcription needed).")
+    parser.add_argument("--captions_latency", type=float, default=0.3, help="Base latency of a captions request, in seconds.")
+    parser.add_argument("--download_latency", type=float, default=0.5, help="Base latency of a download, in seconds.")
+    parser.add_argument("--transcription_latency", type=float, default=1.0, help="Base latency of a transcription request, in seconds.")
+    parser.add_argument("--llm_latency", type=float, default=0.5, help="Base latency of a chat completion, in seconds.")
+    parser.add_argument("--llm_rpm", type=float, default=None, help="Requests per minute of the rate limiter of the chat completions (no limiter by default).")
+    parser.add_argument("--llm_tpm", type=float, default=None, help="Tokens per minute of the rate limiter of the chat completions.")
+    parser.add_argument("--target_summary_chars", type=int, default=None, help="Enable the tree reduce of the summaries with this target length.")
+    parser.add_argument("--content_defined_chunks", action="store_true", help="Cut the transcriptions at content-defined boundaries, so the memo serves the passages shared by different videos.")
+    parser.add_argument("--tts_latency", type=float, default=0.3, help="Base latency of the synthesis of a TTS segment, in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Max random latency added to every fake request, in seconds.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Probability that a fake request fails.")
+    parser.add_argument("--no_stream", action="store_true", help="Download the whole audio before transcribing it, instead of streaming it.")
+    parser.add_argument("--warm", action="store_true", help="Run every workload a second time on the same caches.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the pipeline.")
+    args = parser.parse_args()
+
+    runners = {"single": run_single, "multi": run_multi, "batch": run_batch}
+    for workload in args.workloads:
+        urls = [f"https://www.youtube.com/watch?v={workload}{idx:06d}" for idx in range(args.videos)]
+        with tempfile.TemporaryDirectory() as folder:
+            previous_folder = os.getcwd()
+            # the pipeline writes some files relative to the working directory
+            os.chdir(folder)
+            try:
+                summarizer = build_summarizer(args, folder)
+                for run in (["cold", "warm"] if args.warm else ["cold"]):
+                    METRICS.reset()
+                    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+                    start = time.perf_counter()
+                    with output:
+                        latencies, failures = runners[workload](summarizer, urls, args.languages, args)
+                    report(f"{workload} ({run})", latencies, failures, time.perf_counter() - start)
+            finally:
+                os.chdir(previous_folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+'''
+Measures the speedup of the concurrent summarization in `Groq_Translator.multiple_translation`.
+
+A local fake GROQ endpoint answers every chat completion after a fixed delay, so the wall time of a
+long transcription can be compared between sequential (max_workers=1) and concurrent runs.
+
+Usage:
+    python benchmarks/bench_translation.py --delay 0.5 --chunks 20 --workers 1 4 8
+'''
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# the fake endpoint sends no rate-limit headers: without these the client-side limiter (read at import, see `ratelimiter.py`)
+# would pace the requests at the default GROQ limits and the benchmark would measure the limiter, not the concurrency
+os.environ.setdefault('GROQ_REQUESTS_PER_MINUTE', '1000000')
+os.environ.setdefault('GROQ_TOKENS_PER_MINUTE', '1000000000')
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    '''Answers OpenAI-compatible chat completion requests after `server.delay` seconds.'''
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        request = json.loads(body or b'{}')
+        time.sleep(self.server.delay)
+
+        prompt = request.get('messages', [{}])[-1].get('content', '')
+        response = {
+            "id": "fake-completion",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get('model', 'fake-model'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"summary of {len(prompt)} chars"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 5, "total_tokens": len(prompt) // 4 + 5},
+        }
+        payload = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_groq(delay: float) -> ThreadingHTTPServer:
+    '''Starts the fake endpoint on a free local port and points the GROQ client to it.'''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGroqHandler)
+    server.delay = delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['GROQ_BASE_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    os.environ.setdefault('GROQ_API_KEY', 'fake-key')
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent chunk summarization against a fake GROQ endpoint.")
+    parser.add_argument("--delay", type=float, default=0.5, help="Latency of the fake endpoint for each request, in seconds.")
+    parser.add_argument("--chunks", type=int, default=20, help="Approximate number of chunks of the fake transcription.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="Values of max_workers to compare.")
+    parser.add_argument("--merge", action="store_true", help="Enable the final reduce step that merges the partial summaries.")
+    args = parser.parse_args()
+
+    from translator import Groq_Translator
+
+    server = start_fake_groq(args.delay)
+    sentence = "This is a sentence of a very long fake transcription used for benchmarking. "
+    transcription = sentence * (args.chunks * Groq_Translator(memoize_summaries=False).chunker.max_chars // len(sentence))
+
+    baseline = None
+    for max_workers in args.workers:
+        # the chunks of the fake transcription are all the same: without the memo every one of them is a request
+        translator = Groq_Translator(max_workers=max_workers, merge_summaries=args.merge, memoize_summaries=False)
+        n_chunks = len(translator.split_transcription(transcription))
+        start = time.perf_counter()
+        translator.translate_transcription(transcription, "fake title", "english")
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"max_workers={max_workers:<3} chunks={n_chunks:<4} wall time={elapsed:.2f}s speedup={baseline / elapsed:.2f}x")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+'''
+Local stand-ins for the services called by the pipeline (YouTube, GROQ transcription and chat completions, TTS), used by the benchmarks.
+
+Each fake implements the base class of its step (`VideoDownloader`, `VideoTranscriptor`, `Translator`, `TTSGenerator`) and can be
+injected in `PolySummaryYT`. Every call to the fake "service" sleeps for a configurable latency (with jitter), fails with a configurable
+probability and produces a payload of configurable size, so the chunking, concurrency and caching code of the repo runs unchanged
+while the network is replaced by a predictable model.
+'''
+import os
+import random
+import threading
+import time
+
+from metrics import record
+from videodownloader import VideoDownloader
+from videotranscriptor import VideoTranscriptor
+from translator import Groq_Translator
+from ratelimiter import RateLimiter
+from ttsgenerator import TTSGenerator
+from utils import get_video_id
+
+# an MPEG-1 Layer III frame (128 kbps, 44.1 kHz) of silence: the fake audio files are made of these, so ffmpeg can still concatenate them
+MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+MP3_FRAME_SECONDS = 1152 / 44100
+
+SENTENCE_WORDS = ["the", "speaker", "explains", "how", "the", "model", "is", "trained", "on", "new", "data", "and", "why", "it", "matters"]
+
+
+class FakeServiceError(Exception):
+    '''Raised by a fake service to simulate a failed request (as a retryable server error).'''
+    status_code = 503
+
+
+class FakeService():
+    '''
+    Latency and failure model of a remote service.
+
+    Attributes:
+        latency (float): The base latency of a request, in seconds.
+        jitter (float): The max random latency added to each request, in seconds.
+        error_rate (float): The probability that a request fails with `FakeServiceError`.
+        seconds_per_mb (float): The latency added for each MB of payload (uploaded or downloaded).
+    '''
+
+    def __init__(self, latency: float = 0.1, jitter: float = 0.0, error_rate: float = 0.0, seconds_per_mb: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seconds_per_mb = seconds_per_mb
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.calls = 0
+
+    def call(self, name: str, payload_bytes: int = 0):
+        """
+        Simulates a request: sleeps for its latency, then fails with probability `error_rate`.
+
+        Args:
+            name (str): The name of the request, used in the error message.
+            payload_bytes (int, optional): The size of the payload transferred by the request.
+        """
+        with self.random_lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0, self.jitter) + self.seconds_per_mb * payload_bytes / 1024**2
+            failed = self.random.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            raise FakeServiceError(f"fake {name} request failed")
+
+
+def make_mp3(size_bytes: int) -> bytes:
+    '''Returns silent MP3 data of about `size_bytes` bytes (at least one frame).'''
+    return MP3_FRAME * max(1, size_bytes // len(MP3_FRAME))
+
+
+def make_text(n_words: int, seed: int = 0) -> str:
+    '''Returns a fake transcription of `n_words` words, split in sentences of 8 to 20 words.'''
+    rng = random.Random(seed)
+    sentences = []
+    while n_words > 0:
+        length = min(n_words, rng.randint(8, 20))
+        words = [rng.choice(SENTENCE_WORDS) for _ in range(length)]
+        sentences.append(" ".join(words).capitalize() + ".")
+        n_words -= length
+    return " ".join(sentences)
+
+
+class Fake_VideoDownloader(VideoDownloader):
+    '''
+    Downloads nothing: writes `audio_bytes` of silent MP3 for each video, after the latency of `service`. Downloads are cached like the real ones.
+    Like the real downloader it supports streaming: with `on_chunk` the audio is written (and passed to `on_chunk`) in `chunk_bytes` chunks,
+    the latency being spread over the chunks.
+    '''
+
+    def __init__(self, output_folder: str, service: FakeService = None, audio_bytes: int = 4 * 1024**2, supports_streaming: bool = True,
+                 chunk_bytes: int = 1024**2):
+        super().__init__(output_folder)
+        self.service = service if service is not None else FakeService(latency=0.5, seconds_per_mb=0.05)
+        self.audio_bytes = audio_bytes
+        self.supports_streaming = supports_streaming
+        self.chunk_bytes = chunk_bytes
+
+    def download_audio(self, url: str, on_chunk = None) -> dict:
+        video_id = get_video_id(url)
+        video_name = video_id + ".mp3"
+        video_path = os.path.join(self.output_folder, video_name)
+        if not self.check_existing_download(video_name):
+            audio = make_mp3(self.audio_bytes)
+            temporary_path = f"{video_path}.{threading.get_ident()}.part"
+            with open(temporary_path, "wb") as audio_file:
+                if on_chunk is None:
+                    self.service.call("download", self.audio_bytes)
+                    audio_file.write(audio)
+                else:
+                    for offset in range(0, len(audio), self.chunk_bytes):
+                        chunk = audio[offset:offset + self.chunk_bytes]
+                        self.service.call("download", len(chunk))
+                        audio_file.write(chunk)
+                        on_chunk(chunk)
+            os.replace(temporary_path, video_path)
+            self.disk_cache.add(video_name)
+        return {"video_title": f"Benchmark video {video_id}",
+                "video_path": video_path}
+
+
+class Fake_Transcriptor(VideoTranscriptor):
+    '''
+    Returns a fake transcription of about `words_per_mb` words for each MB of audio, after the latency of `service` (which grows with the upload size).
+    A fraction `captions_rate` of the videos has captions, returned by `transcript_url` after the latency of `captions_service`.
+    '''
+
+    def __init__(self, service: FakeService = None, words_per_mb: int = 2000, model_name: str = "fake-whisper", captions_rate: float = 0.0,
+                 captions_service: FakeService = None, captions_words: int = 8000):
+        self.model = model_name
+        self.service = service if service is not None else FakeService(latency=1.0, seconds_per_mb=0.2)
+        self.words_per_mb = words_per_mb
+        self.captions_rate = captions_rate
+        self.captions_service = captions_service if captions_service is not None else FakeService(latency=0.3)
+        self.captions_words = captions_words
+
+    def transcript_url(self, input_url):
+        video_id = get_video_id(input_url)
+        self.captions_service.call("captions")
+        # the same videos have captions at every run
+        if random.Random(video_id).random() >= self.captions_rate:
+            return None
+        return {"text": make_text(self.captions_words, seed=len(video_id)), "video_title": f"Benchmark video {video_id}"}
+
+    def transcript_video(self, audio_path, groq_api_key = None, checkpoint = None):
+        audio_bytes = os.path.getsize(audio_path)
+        record("polysummary_upload_bytes_total", audio_bytes, service="fake_transcription")
+        self.service.call("transcription", audio_bytes)
+        return make_text(max(1, int(self.words_per_mb * audio_bytes / 1024**2)), seed=audio_bytes)
+
+
+class Fake_Translator(Groq_Translator):
+    '''
+    `Groq_Translator` with the chat completions answered locally: the chunking, the concurrent map and the merge step are the real ones.
+    Each completion takes the latency of `service` and returns `summary_chars` characters; streamed completions are yielded in pieces of `stream_piece_chars`.
+    If a `rate_limiter` is given, the completions are paced and retried by it like the real ones.
+    '''
+
+    def __init__(self, service: FakeService = None, summary_chars: int = 600, stream_piece_chars: int = 20, rate_limiter: RateLimiter = None,
+                 **translator_kwargs):
+        translator_kwargs.setdefault("model_name", "fake-llm")
+        super().__init__(**translator_kwargs)
+        self.service = service if service is not None else FakeService(latency=0.5, jitter=0.5)
+        self.summary_chars = summary_chars
+        self.stream_piece_chars = stream_piece_chars
+        self.rate_limiter = rate_limiter
+
+    def call_service(self, assistant_prompt, translate_prompt):
+        request = lambda: self.service.call("chat completion", len(assistant_prompt) + len(translate_prompt))
+        if self.rate_limiter is None:
+            return request()
+        return self.rate_limiter.call(request, self.request_tokens(assistant_prompt, translate_prompt))
+
+    def fake_summary(self, translate_prompt):
+        summary = make_text(self.summary_chars // 5, seed=len(translate_prompt))
+        return summary[:self.summary_chars]
+
+    def translate_completion(self, assistant_prompt: str, translate_prompt: str, groq_api_key:str = None) -> str:
+        self.call_service(assistant_prompt, translate_prompt)
+        return self.fake_summary(translate_prompt)
+
+    def stream_completion(self, assistant_prompt: str, translate_prompt: str, groq_api_key:str = None):
+        self.call_service(assistant_prompt, translate_prompt)
+        summary = self.fake_summary(translate_prompt)
+        for start in range(0, len(summary), self.stream_piece_chars):
+            yield summary[start:start + self.stream_piece_chars]
+
+
+class Fake_TTSGenerator(TTSGenerator):
+    '''Synthesizes each segment as `audio_bytes_per_char` bytes of silent MP3 per character, after the latency of `service`. Uses the real segment cache and concatenation.'''
+
+    def __init__(self, output_folder: str, service: FakeService = None, audio_bytes_per_char: int = 400, generator_name: str = "fake"):
+        self.translated_folder = output_folder
+        self.segments_folder = os.path.join(output_folder, "segments")
+        self.service = service if service is not None else FakeService(latency=0.3, jitter=0.2)
+        self.audio_bytes_per_char = audio_bytes_per_char
+        self.generator_name = generator_name
+
+    def generate_audio(self, text: str, destination_language: str = None, input_url: str = None, openai_key: str = None) -> str:
+        translated_path = self.translated_path_check(input_url, destination_language, self.generator_name, text)
+
+        if not self.translated_cache().lookup(os.path.basename(translated_path)):
+            def synthesize_segment(segment_text, segment_path):
+                audio = make_mp3(len(segment_text) * self.audio_bytes_per_char)
+                self.service.call("tts", len(audio))
+                with open(segment_path, "wb") as segment_file:
+                    segment_file.write(audio)
+
+            self.synthesize_segmented(text, translated_path, f"{self.generator_name}_{destination_language}", synthesize_segment)
+        return translated_path
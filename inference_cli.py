@@ -1,21 +1,93 @@
 import argparse
+import json
 import sys
 sys.path.append('src')
-from main import PolySummaryYT
+from main import PolySummaryYT, normalize_language
+from backends import backend_names, build_backend
+from metrics import METRICS
+from batch import BatchPipeline, DEFAULT_STAGE_LIMITS, read_url_file, expand_playlist, expand_channel
 
 if __name__ == "__main__":
     print('-'*200)
     parser = argparse.ArgumentParser(description="Summarize a video to a specified language.")
 
-    parser.add_argument("input_url", type=str, help="The URL of the video to translate.")
-    parser.add_argument("language", type=str, default="italian", help="['italian', 'english', 'francais', 'spanish', 'deutsch'] - The target language for translation.")
+    parser.add_argument("input_url", type=str, nargs="?", default=None, help="The URL of the video to translate.")
+    parser.add_argument("language", type=str, nargs="?", default="italian", help="['italian', 'english', 'francais', 'spanish', 'deutsch'] - The target language for translation.")
     parser.add_argument("--groq_key_input", type=str, default=None, help="The GROQ API key (optional). If not provided, the environment variable GROQ_API_KEY will be used")
     parser.add_argument("--openai_key", type=str, default=None, help="The OpenAI API key (optional). If not provided, the environment variable OPENAI_API_KEY will be used")
-    
+    parser.add_argument("--cache_stats", action="store_true", help="Print size and hit rate of the audio caches and exit.")
+    parser.add_argument("--stream", action="store_true", help="Print the summary while it is generated (single video and language only).")
+    parser.add_argument("--transcription_backend", type=str, choices=backend_names("transcriptor"), default=None, help="The backend transcribing the videos without captions: the GROQ API or a local CPU Whisper model (faster-whisper). Defaults to the environment variable TRANSCRIPTION_BACKEND, or groq.")
+    parser.add_argument("--summary_seconds", type=float, default=None, help="Target reading time of the summary, in seconds. Long videos are summarized hierarchically so that the summary (and its audio) stays within it.")
+    parser.add_argument("--metrics_format", type=str, choices=["json", "prometheus"], default=None, help="Print the collected metrics (stage latencies, tokens, bytes, cache hits) at the end of the run. The per-request traces are appended to metrics/traces.jsonl (env TRACES_PATH).")
+
+    batch_group = parser.add_argument_group("batch mode", "Process many videos in many languages with a pipelined scheduler.")
+    batch_group.add_argument("--batch_file", type=str, default=None, help="A text file with one video URL per line.")
+    batch_group.add_argument("--playlist", type=str, nargs="+", default=[], help="One or more YouTube playlist URLs.")
+    batch_group.add_argument("--channel", type=str, nargs="+", default=[], help="One or more YouTube channel URLs.")
+    batch_group.add_argument("--languages", type=str, nargs="+", default=None, help="The target languages (also for a single video). Defaults to the positional language.")
+    batch_group.add_argument("--manifest", type=str, default="batch_manifest.jsonl", help="The JSONL file where the results are appended.")
+    for stage, limit in DEFAULT_STAGE_LIMITS.items():
+        batch_group.add_argument(f"--{stage}_workers", type=int, default=limit, help=f"Max number of concurrent {stage} steps (default: {limit}).")
+
     args = parser.parse_args()
 
-    # Assuming you have instantiated your class that contains translate_video method
-    translator = PolySummaryYT()  # Replace with the actual class name
-    result = translator.summarize_video(args.input_url, args.language, args.groq_key_input, args.openai_key)
-    print(result)
-    print(f'summarized and translated audio, file stored at: {result['audio_path']}')
+    if args.cache_stats:
+        from diskcache import get_disk_cache, format_stats
+        from videodownloader import DOWNLOAD_CACHE_MAX_BYTES
+        from ttsgenerator import TTSGenerator
+        from audiopreprocessor import PREPROCESSED_CACHE_MAX_BYTES
+        for folder, max_bytes in [("download_audio", DOWNLOAD_CACHE_MAX_BYTES),
+                                  ("preprocessed_audio", PREPROCESSED_CACHE_MAX_BYTES),
+                                  (TTSGenerator.translated_folder, TTSGenerator.max_cache_bytes),
+                                  (TTSGenerator.segments_folder, TTSGenerator.max_segments_cache_bytes)]:
+            print(format_stats(get_disk_cache(folder, max_bytes).stats()))
+        sys.exit(0)
+
+    summary_translator = build_backend("translator", "groq", target_reading_seconds=args.summary_seconds) if args.summary_seconds is not None else None
+    translator = PolySummaryYT(translator=summary_translator, transcription_backend=args.transcription_backend)
+
+    if args.batch_file or args.playlist or args.channel:
+        urls = [args.input_url] if args.input_url else []
+        if args.batch_file:
+            urls += read_url_file(args.batch_file)
+        for playlist_url in args.playlist:
+            urls += expand_playlist(playlist_url)
+        for channel_url in args.channel:
+            urls += expand_channel(channel_url)
+        urls = list(dict.fromkeys(urls))
+        languages = [normalize_language(language) for language in (args.languages or [args.language])]
+
+        stage_limits = {stage: getattr(args, f"{stage}_workers") for stage in DEFAULT_STAGE_LIMITS}
+        translator.warmup()
+        print(f'batch of {len(urls)} videos in {len(languages)} languages')
+        records = BatchPipeline(translator, stage_limits).run(urls, languages, args.manifest, args.groq_key_input, args.openai_key)
+        n_failed = sum(record["status"] != "ok" for record in records)
+        print(f'batch completed: {len(records) - n_failed} succeeded, {n_failed} failed - manifest stored at: {args.manifest}')
+    else:
+        if args.input_url is None:
+            parser.error("input_url is required when no batch source (--batch_file, --playlist, --channel) is given")
+        if args.languages and len(args.languages) > 1:
+            results = translator.summarize_video_multi(args.input_url, args.languages, args.groq_key_input, args.openai_key)
+            for language, result in results.items():
+                print(language, result)
+                print(f"summarized and translated audio in {language}, file stored at: {result['audio_path']}")
+        else:
+            language = args.languages[0] if args.languages else args.language
+            if args.stream:
+                streamed_text = ""
+                for result in translator.summarize_video_stream(args.input_url, language, args.groq_key_input, args.openai_key):
+                    streamed_text += result["delta"]
+                    print(result["delta"], end="", flush=True)
+                print()
+                if result["text"] != streamed_text:
+                    print('merged summary:', result["text"])
+            else:
+                result = translator.summarize_video(args.input_url, language, args.groq_key_input, args.openai_key)
+                print(result)
+            print(f"summarized and translated audio, file stored at: {result['audio_path']}")
+
+    if args.metrics_format == "json":
+        print(json.dumps(METRICS.to_dict(), indent=2))
+    elif args.metrics_format == "prometheus":
+        print(METRICS.to_prometheus())
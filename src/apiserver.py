@@ -0,0 +1,153 @@
+'''
+HTTP/JSON API of the summarization jobs, for other services calling the pipeline at high request rates.
+
+The API is an async FastAPI app (FastAPI and uvicorn are installed with gradio) on top of a `JobManager`: a request only submits or
+looks up jobs, while the jobs run on the bounded worker pool of the manager. All the requests share one warm `PolySummaryYT`, hence its
+pooled API clients and its caches, so no request pays the start of a process or the construction of the pipeline.
+`app.py` serves the API next to the Gradio UI, on the same manager; `python src/apiserver.py` serves the API alone.
+
+Endpoints (under /v1):
+    POST /jobs                  {"url", "language", "groq_key"?, "openai_key"?} -> the state of the new (or merged) job
+    POST /batches               {"urls", "languages", "groq_key"?, "openai_key"?} -> {"batch_id", "job_ids"}
+    GET  /jobs/{job_id}         -> the state of the job, with the summary generated so far
+    GET  /jobs/{job_id}/result  ?wait=<seconds> -> the summary and the audio URL, 202 while the job is running
+    GET  /jobs/{job_id}/audio   -> the audio of the summary
+    GET  /batches/{batch_id}    -> the state of the jobs of the batch
+    GET  /health, GET /metrics  -> liveness and Prometheus metrics
+'''
+import argparse
+import asyncio
+import os
+import time
+from jobs import JobManager
+from metrics import METRICS
+
+API_PREFIX = "/v1"
+POLLING_SECONDS = 0.25
+MAX_WAIT_SECONDS = 60
+MAX_BATCH_JOBS = int(os.environ.get("API_MAX_BATCH_JOBS", 500))
+
+
+def job_response(job_status: dict) -> dict:
+    '''The state of a job as returned by the API: the local audio path is replaced by the URL of the audio endpoint.'''
+    response = {key: value for key, value in job_status.items() if key != "audio_path"}
+    if job_status.get("audio_path") is not None:
+        response["audio_url"] = f"{API_PREFIX}/jobs/{job_status['job_id']}/audio"
+    return response
+
+
+def create_api(job_manager: JobManager):
+    """
+    Builds the FastAPI app of the API.
+
+    Args:
+        job_manager (JobManager): The manager running the jobs, shared with the other users of the pipeline (e.g. the Gradio UI).
+
+    Returns:
+        FastAPI: The app, with the routes under `API_PREFIX`.
+    """
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+    from pydantic import BaseModel, Field
+
+    class JobRequest(BaseModel):
+        url: str
+        language: str = "italian"
+        groq_key: str | None = None
+        openai_key: str | None = None
+
+    class BatchRequest(BaseModel):
+        urls: list[str] = Field(min_length=1)
+        languages: list[str] = Field(default=["italian"], min_length=1)
+        groq_key: str | None = None
+        openai_key: str | None = None
+
+    def get_job_status(job_id):
+        try:
+            return job_manager.status(job_id)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    api = FastAPI(title="PolySummaryYT API")
+
+    @api.get(f"{API_PREFIX}/health")
+    async def health():
+        return {"status": "ok"}
+
+    @api.get(f"{API_PREFIX}/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return METRICS.to_prometheus()
+
+    @api.post(f"{API_PREFIX}/jobs", status_code=202)
+    async def submit_job(request: JobRequest):
+        try:
+            job_id = job_manager.submit(request.url, request.language, request.groq_key, request.openai_key)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return job_response(get_job_status(job_id))
+
+    @api.post(f"{API_PREFIX}/batches", status_code=202)
+    async def submit_batch(request: BatchRequest):
+        if len(request.urls) * len(request.languages) > MAX_BATCH_JOBS:
+            raise HTTPException(status_code=413, detail=f"A batch can have at most {MAX_BATCH_JOBS} jobs (videos x languages)")
+        try:
+            batch_id = job_manager.submit_batch(request.urls, request.languages, request.groq_key, request.openai_key)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        batch_status = job_manager.batch_status(batch_id)
+        return {"batch_id": batch_id, "job_ids": [job_status["job_id"] for job_status in batch_status["jobs"]]}
+
+    @api.get(f"{API_PREFIX}/batches/{{batch_id}}")
+    async def get_batch(batch_id: str):
+        try:
+            batch_status = job_manager.batch_status(batch_id)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return {**batch_status, "jobs": [job_response(job_status) for job_status in batch_status["jobs"]]}
+
+    @api.get(f"{API_PREFIX}/jobs/{{job_id}}")
+    async def get_job(job_id: str):
+        return job_response(get_job_status(job_id))
+
+    @api.get(f"{API_PREFIX}/jobs/{{job_id}}/result")
+    async def get_job_result(job_id: str, wait: float = 0):
+        # the wait is a polling loop on the event loop, so a waiting client does not hold a thread
+        deadline = time.monotonic() + min(max(wait, 0), MAX_WAIT_SECONDS)
+        job_status = get_job_status(job_id)
+        while job_status["status"] not in ("done", "error") and time.monotonic() < deadline:
+            await asyncio.sleep(POLLING_SECONDS)
+            job_status = get_job_status(job_id)
+
+        if job_status["status"] == "error":
+            raise HTTPException(status_code=500, detail=f"Job {job_id} failed: {job_status['error']}")
+        if job_status["status"] != "done":
+            return JSONResponse(job_response(job_status), status_code=202)
+        return {"job_id": job_id, "text": job_status["text"], "audio_url": job_response(job_status).get("audio_url")}
+
+    @api.get(f"{API_PREFIX}/jobs/{{job_id}}/audio")
+    async def get_job_audio(job_id: str):
+        job_status = get_job_status(job_id)
+        if job_status["status"] != "done" or job_status["audio_path"] is None or not os.path.isfile(job_status["audio_path"]):
+            raise HTTPException(status_code=404, detail=f"No audio for job {job_id}")
+        return FileResponse(job_status["audio_path"], filename=os.path.basename(job_status["audio_path"]))
+
+    return api
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the summarization jobs over HTTP/JSON, without the Gradio UI.")
+    parser.add_argument("--host", type=str, default=os.environ.get("API_HOST", "127.0.0.1"), help="The address to listen on.")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("API_PORT", 8000)), help="The port to listen on.")
+    parser.add_argument("--workers", type=int, default=8, help="The max number of jobs running at the same time.")
+    args = parser.parse_args()
+
+    import uvicorn
+    from main import PolySummaryYT
+
+    summarizer = PolySummaryYT()
+    summarizer.warmup()
+    job_manager = JobManager(summarizer, max_workers=args.workers)
+    try:
+        uvicorn.run(create_api(job_manager), host=args.host, port=args.port)
+    finally:
+        job_manager.shutdown(wait=False)
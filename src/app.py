@@ -1,13 +1,30 @@
+import asyncio
+import os
 import gradio as gr
-from main import PolySummaryYT
-from utils_app import button_timer, update_button
+from main import PolySummaryYT, LANGUAGES_DICT
+from jobs import JobManager
+from apiserver import create_api
+from utils_app import update_button
 
-TRANSLATOR = PolySummaryYT()
-LANGUAGES_LIST = TRANSLATOR.get_languages()
+# built in `main`, not at import: the spawned worker processes of the local transcription backend import this module again
+TRANSLATOR = None
+JOB_MANAGER = None
+LANGUAGES_LIST = list(LANGUAGES_DICT.keys())
+POLLING_SECONDS = 0.5
 
-def translate_click_start(youtube_url, language, groq_key, openai_key):
-    result_translation = TRANSLATOR.summarize_video(youtube_url, language, groq_key, openai_key)
-    return result_translation["audio_path"], result_translation["text"]
+async def translate_click_start(youtube_url, language, groq_key, openai_key):
+    # the request runs as a background job: this handler only polls its progress, showing the summary while it is generated.
+    # It runs on the event loop, so a waiting user holds no worker thread
+    job_id = JOB_MANAGER.submit(youtube_url, language, groq_key, openai_key)
+    job_status = JOB_MANAGER.status(job_id)
+    while job_status["status"] not in ("done", "error"):
+        yield None, job_status["text"] or f"Processing ({job_status['stage'] or job_status['status']})..."
+        await asyncio.sleep(POLLING_SECONDS)
+        job_status = JOB_MANAGER.status(job_id)
+
+    if job_status["status"] == "error":
+        raise gr.Error(f"Processing failed: {job_status['error']}")
+    yield job_status["audio_path"], job_status["text"]
 
 def toggle_api_config(is_visible):
     return gr.update(visible=not is_visible), not is_visible
@@ -97,107 +114,123 @@ custom_css = """
 }
 """
 
-with gr.Blocks(css=custom_css) as iface:
-    with gr.Column(elem_id="app-container"):
-        gr.HTML(
-            """
-            <div id="header">
-                <h1>🌐 PolySummaryYT</h1>
-                <p>Transform YouTube videos into multilingual summaries with ease</p>
-            </div>
-            """
-        )
-
-        with gr.Row():
-            with gr.Column(elem_classes="input-section"):
-                api_config_visible = gr.State(False)
-                api_config_toggle = gr.Button("Show API Configuration", elem_id="api-config-toggle")
+def build_interface():
+    '''Builds the Gradio UI, whose requests are submitted to `JOB_MANAGER`.'''
+    with gr.Blocks(css=custom_css) as iface:
+        with gr.Column(elem_id="app-container"):
+            gr.HTML(
+                """
+                <div id="header">
+                    <h1>🌐 PolySummaryYT</h1>
+                    <p>Transform YouTube videos into multilingual summaries with ease</p>
+                </div>
+                """
+            )
+
+            with gr.Row():
+                with gr.Column(elem_classes="input-section"):
+                    api_config_visible = gr.State(False)
+                    api_config_toggle = gr.Button("Show API Configuration", elem_id="api-config-toggle")
                 
-                with gr.Column(visible=False) as api_config_content:
-                    gr.Markdown("### 🔑 API Configuration")
-                    groq_key_input = gr.Textbox(
-                        label="GROQ API Key",
-                        placeholder="Enter your GROQ API key",
-                        type="password",
-                        info="Used for transcription and translation"
+                    with gr.Column(visible=False) as api_config_content:
+                        gr.Markdown("### 🔑 API Configuration")
+                        groq_key_input = gr.Textbox(
+                            label="GROQ API Key",
+                            placeholder="Enter your GROQ API key",
+                            type="password",
+                            info="Used for transcription and translation"
+                        )
+                        openai_key_input = gr.Textbox(
+                            label="OpenAI API Key used for Text-to-Speech ",
+                            placeholder="Enter your OPENAI API KEY here! (Used for Text-to-Speech)",
+                            type="password",
+                            info="- leave it empty for free text to speech model usage"
+                        )
+
+                    gr.Markdown("### 🎥 Video Input")
+                    youtube_url = gr.Textbox(
+                        label="YouTube URL",
+                        placeholder="https://www.youtube.com/watch?v=...",
+                        info="Paste the full YouTube video URL here"
                     )
-                    openai_key_input = gr.Textbox(
-                        label="OpenAI API Key used for Text-to-Speech ",
-                        placeholder="Enter your OPENAI API KEY here! (Used for Text-to-Speech)",
-                        type="password",
-                        info="- leave it empty for free text to speech model usage"
+                
+                    language = gr.Dropdown(
+                        choices=LANGUAGES_LIST,
+                        label="Target Language",
+                        value=LANGUAGES_LIST[0],
+                        interactive=True,
+                        info="Select the language for the summary"
                     )
+                    translate_btn = gr.Button("Summarize and Translate", elem_id="translate-btn")
 
-                gr.Markdown("### 🎥 Video Input")
-                youtube_url = gr.Textbox(
-                    label="YouTube URL",
-                    placeholder="https://www.youtube.com/watch?v=...",
-                    info="Paste the full YouTube video URL here"
-                )
-                
-                language = gr.Dropdown(
-                    choices=LANGUAGES_LIST,
-                    label="Target Language",
-                    value=LANGUAGES_LIST[0],
-                    interactive=True,
-                    info="Select the language for the summary"
-                )
-                translate_btn = gr.Button("Summarize and Translate", elem_id="translate-btn")
-
-        with gr.Row(elem_classes="output-section"):
-            with gr.Column():
-                gr.Markdown("### 🔊 Audio Summary")
-                audio_output = gr.Audio(label="Translated Audio", elem_id="audio-output")
-                video_embed = gr.HTML(elem_id="video-embed")
+            with gr.Row(elem_classes="output-section"):
+                with gr.Column():
+                    gr.Markdown("### 🔊 Audio Summary")
+                    audio_output = gr.Audio(label="Translated Audio", elem_id="audio-output")
+                    video_embed = gr.HTML(elem_id="video-embed")
             
-            with gr.Column():
-                gr.Markdown("### 📝 Text Summary")
-                result_text = gr.Textbox(
-                    label="Translation Result",
-                    interactive=False,
-                    elem_id="result-text",
-                    lines=10
-                )
-
-        youtube_url.change(
-            fn=embed_youtube_video,
-            inputs=[youtube_url],
-            outputs=[video_embed]
-        )
-
-        api_config_toggle.click(
-            toggle_api_config,
-            inputs=[api_config_visible],
-            outputs=[api_config_content, api_config_visible]
-        ).then(
-            lambda x: "Hide API Configuration" if x else "Show API Configuration",
-            inputs=[api_config_visible],
-            outputs=[api_config_toggle]
-        )
-
-        language.change(
-            update_button,
-            inputs=language,
-            outputs=translate_btn
-        )
-
-        translate_btn.click(
-            fn=lambda: gr.update(interactive=False, value="Processing..."),
-            inputs=None,
-            outputs=translate_btn
-        ).then(
-            fn=translate_click_start,
-            inputs=[youtube_url, language, groq_key_input, openai_key_input],
-            outputs=[audio_output, result_text]
-        ).then(
-            fn=button_timer,
-            inputs=None,
-            outputs=None
-        ).then(
-            fn=lambda: gr.update(interactive=True, value="Summarize and Translate"),
-            inputs=None,
-            outputs=translate_btn
-        )
+                with gr.Column():
+                    gr.Markdown("### 📝 Text Summary")
+                    result_text = gr.Textbox(
+                        label="Translation Result",
+                        interactive=False,
+                        elem_id="result-text",
+                        lines=10
+                    )
+
+            youtube_url.change(
+                fn=embed_youtube_video,
+                inputs=[youtube_url],
+                outputs=[video_embed]
+            )
+
+            api_config_toggle.click(
+                toggle_api_config,
+                inputs=[api_config_visible],
+                outputs=[api_config_content, api_config_visible]
+            ).then(
+                lambda x: "Hide API Configuration" if x else "Show API Configuration",
+                inputs=[api_config_visible],
+                outputs=[api_config_toggle]
+            )
+
+            language.change(
+                update_button,
+                inputs=language,
+                outputs=translate_btn
+            )
+
+            translate_btn.click(
+                fn=lambda: gr.update(interactive=False, value="Processing..."),
+                inputs=None,
+                outputs=translate_btn
+            ).then(
+                fn=translate_click_start,
+                inputs=[youtube_url, language, groq_key_input, openai_key_input],
+                outputs=[audio_output, result_text],
+                # the async handler only polls the job, the real work is bounded by the JOB_MANAGER worker pool
+                concurrency_limit=None
+            ).then(
+                fn=lambda: gr.update(interactive=True, value="Summarize and Translate"),
+                inputs=None,
+                outputs=translate_btn
+            )
+
+    return iface
+
+
+def main():
+    global TRANSLATOR, JOB_MANAGER
+    TRANSLATOR = PolySummaryYT()
+    TRANSLATOR.warmup()
+    JOB_MANAGER = JobManager(TRANSLATOR)
+    iface = build_interface()
+
+    # the HTTP/JSON API (see apiserver.py) is served on the same port as the UI, by the same JOB_MANAGER
+    import uvicorn
+    api = gr.mount_gradio_app(create_api(JOB_MANAGER), iface, path="/")
+    uvicorn.run(api, host=os.environ.get("GRADIO_SERVER_NAME", "127.0.0.1"), port=int(os.environ.get("GRADIO_SERVER_PORT", 7860)))
+
 
 if __name__ == "__main__":
-    iface.launch(share=False)
\ No newline at end of file
+    main()
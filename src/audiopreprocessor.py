@@ -0,0 +1,241 @@
+import hashlib
+import os
+import subprocess
+import uuid
+from audiosegmenter import ffmpeg_available, get_audio_duration, detect_silences
+from diskcache import get_disk_cache
+from metrics import record, stage_timer
+from utils import single_flight
+
+PREPROCESSED_CACHE_MAX_BYTES = int(os.environ.get("PREPROCESSED_CACHE_MAX_BYTES", 512 * 1024**2))
+SAMPLE_RATE = 16000
+
+
+class AudioPreprocessor():
+    '''
+    Prepares a downloaded audio for speech recognition before it is uploaded: the audio is downmixed to mono, resampled to 16 kHz
+    and compressed to low-bitrate Opus (FLAC if ffmpeg has no libopus encoder), and the leading and trailing silence and the long
+    sections without speech are cut. The sections without speech are found with the Silero VAD of faster-whisper when it is installed
+    (it also drops music-only intros and breaks), otherwise with the ffmpeg `silencedetect` filter (silence only).
+    The outputs are cached in `output_folder`, within a byte budget like the other audio caches.
+    '''
+
+    def __init__(self, output_folder: str = "preprocessed_audio", codec: str = "opus", bitrate: str = "24k",
+                 max_cache_bytes: int = PREPROCESSED_CACHE_MAX_BYTES, min_gap_seconds: float = 20, padding_seconds: float = 0.5, noise_db: int = -35):
+        """
+        Args:
+            output_folder (str, optional): The cache folder of the preprocessed audio files.
+            codec (str, optional): "opus" (Ogg Opus at `bitrate`) or "flac" (lossless).
+            bitrate (str, optional): The bitrate of the Opus encoder.
+            max_cache_bytes (int, optional): The byte budget of `output_folder`.
+            min_gap_seconds (float, optional): The sections without speech at least this long are cut; shorter pauses are kept.
+            padding_seconds (float, optional): The audio kept around each speech section, so that no word is cut.
+            noise_db (int, optional): The volume (in dB) under which the audio is silent, used without the VAD.
+        """
+        if codec not in ("opus", "flac"):
+            raise ValueError(f"Unknown codec: {codec} - use 'opus' or 'flac'")
+        self.output_folder = output_folder
+        self.codec = codec
+        self.bitrate = bitrate
+        self.max_cache_bytes = max_cache_bytes
+        self.min_gap_seconds = min_gap_seconds
+        self.padding_seconds = padding_seconds
+        self.noise_db = noise_db
+        self.opus_available = None
+
+    def disk_cache(self):
+        return get_disk_cache(self.output_folder, self.max_cache_bytes)
+
+    def output_codec(self) -> str:
+        '''Returns the codec actually used: Opus only if the ffmpeg build has the libopus encoder.'''
+        if self.codec == "opus" and self.opus_available is None:
+            result = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True)
+            self.opus_available = "libopus" in result.stdout
+        return "opus" if self.codec == "opus" and self.opus_available else "flac"
+
+    def output_name(self, audio_path: str, codec: str) -> str:
+        '''The cached filename of a preprocessed audio: it changes with the source file and with every setting changing the output.'''
+        settings = f"{codec}|{self.bitrate}|{self.min_gap_seconds}|{self.padding_seconds}|{self.noise_db}|{os.path.getsize(audio_path)}"
+        settings_hash = hashlib.sha256(settings.encode("utf-8")).hexdigest()[:12]
+        extension = "ogg" if codec == "opus" else "flac"
+        return f"{os.path.splitext(os.path.basename(audio_path))[0]}.{settings_hash}.{extension}"
+
+    def preprocess(self, audio_path: str) -> str:
+        """
+        Returns the preprocessed version of an audio file, producing it if it is not cached. Only one worker (thread or process)
+        produces a given file, the others wait and then find it cached. Without ffmpeg, or if ffmpeg fails, the original file is returned.
+
+        Args:
+            audio_path (str): The path of the downloaded audio.
+
+        Returns:
+            str: The path of the audio to be transcribed.
+        """
+        if not ffmpeg_available():
+            return audio_path
+
+        codec = self.output_codec()
+        output_name = self.output_name(audio_path, codec)
+        output_path = os.path.join(self.output_folder, output_name)
+        if self.disk_cache().lookup(output_name):
+            return output_path
+
+        with single_flight(os.path.join(self.output_folder, ".locks"), output_name):
+            if self.disk_cache().lookup(output_name, record_stats=False):
+                return output_path
+            temporary_path = os.path.join(self.output_folder, f"{output_name}.{uuid.uuid4().hex}.part")
+            try:
+                with stage_timer("audio_preprocess", codec=codec):
+                    kept_seconds, duration = self.transcode(audio_path, temporary_path, codec)
+                os.replace(temporary_path, output_path)
+            except (subprocess.CalledProcessError, ValueError) as e:
+                print(f'audio preprocessing failed, the original audio is used: {e}')
+                return audio_path
+            finally:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+            self.disk_cache().add(output_name)
+
+        input_bytes, output_bytes = os.path.getsize(audio_path), os.path.getsize(output_path)
+        record("polysummary_preprocess_bytes_total", input_bytes, kind="input")
+        record("polysummary_preprocess_bytes_total", output_bytes, kind="output")
+        print(f'audio preprocessed: {input_bytes / 1024**2:.1f} MB -> {output_bytes / 1024**2:.1f} MB, {kept_seconds:.0f} of {duration:.0f} seconds kept')
+        return output_path
+
+    def preprocess_segment(self, segment_path: str) -> str:
+        """
+        Preprocesses a segment of an audio being streamed (see `streaming.py`): same output as `preprocess`, written next to the segment
+        and not cached, since the segment is deleted once transcribed. If ffmpeg fails, the segment itself is returned.
+
+        Args:
+            segment_path (str): The path of the segment.
+
+        Returns:
+            str: The path of the audio to be transcribed.
+        """
+        codec = self.output_codec()
+        output_path = f"{os.path.splitext(segment_path)[0]}.preprocessed.{'ogg' if codec == 'opus' else 'flac'}"
+        try:
+            with stage_timer("audio_preprocess", codec=codec, streaming=True):
+                self.transcode(segment_path, output_path, codec)
+        except (subprocess.CalledProcessError, ValueError) as e:
+            print(f'audio segment preprocessing failed, the original segment is used: {e}')
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return segment_path
+        record("polysummary_preprocess_bytes_total", os.path.getsize(segment_path), kind="input")
+        record("polysummary_preprocess_bytes_total", os.path.getsize(output_path), kind="output")
+        return output_path
+
+    def transcode(self, audio_path: str, output_path: str, codec: str) -> tuple:
+        """
+        Writes the mono 16 kHz compressed audio, without the sections without speech.
+
+        Args:
+            audio_path (str): The path of the source audio.
+            output_path (str): The path of the output.
+            codec (str): "opus" or "flac".
+
+        Returns:
+            tuple: The (kept_seconds, duration) of the audio.
+        """
+        duration = get_audio_duration(audio_path)
+        kept_intervals = self.plan_kept_intervals(self.speech_intervals(audio_path, duration), duration)
+        kept_seconds = sum(end - start for start, end in kept_intervals)
+
+        filters = []
+        if duration - kept_seconds > 1:
+            selection = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in kept_intervals)
+            filters = ["-af", f"aselect='{selection}',asetpts=N/SR/TB"]
+        if codec == "opus":
+            codec_args = ["-c:a", "libopus", "-b:a", self.bitrate, "-application", "voip", "-f", "ogg"]
+        else:
+            codec_args = ["-c:a", "flac", "-f", "flac"]
+        subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", audio_path, "-vn", *filters,
+             "-ac", "1", "-ar", str(SAMPLE_RATE), *codec_args, output_path],
+            check=True,
+        )
+        return kept_seconds, duration
+
+    def speech_intervals(self, audio_path: str, duration: float) -> list:
+        '''Returns the (start, end) intervals with speech, in seconds: from the VAD if faster-whisper is installed, between the silences otherwise.'''
+        try:
+            return vad_speech_intervals(audio_path)
+        except ImportError:
+            pass
+        silences = detect_silences(audio_path, self.noise_db, self.min_gap_seconds, duration)
+        intervals = []
+        start = 0.0
+        for silence_start, silence_end in silences:
+            if silence_start > start:
+                intervals.append((start, silence_start))
+            start = max(start, silence_end)
+        if start < duration:
+            intervals.append((start, duration))
+        return intervals
+
+    def plan_kept_intervals(self, speech_intervals: list, duration: float) -> list:
+        """
+        Computes the sections of the audio to keep: the speech intervals padded by `self.padding_seconds`, joined when the gap between
+        them is shorter than `self.min_gap_seconds`. The whole audio is kept if no speech is found.
+
+        Args:
+            speech_intervals (list): The (start, end) intervals with speech, in seconds.
+            duration (float): The duration of the audio, in seconds.
+
+        Returns:
+            list: The (start, end) intervals to keep, in seconds, in order.
+        """
+        kept_intervals = []
+        for start, end in sorted(speech_intervals):
+            start, end = max(0.0, start - self.padding_seconds), min(duration, end + self.padding_seconds)
+            if end <= start:
+                continue
+            if kept_intervals and start - kept_intervals[-1][1] < self.min_gap_seconds:
+                kept_intervals[-1] = (kept_intervals[-1][0], max(kept_intervals[-1][1], end))
+            else:
+                kept_intervals.append((start, end))
+        return kept_intervals or [(0.0, duration)]
+
+
+def vad_speech_intervals(audio_path: str, window_seconds: float = 600) -> list:
+    """
+    Finds the speech in an audio file with the Silero VAD shipped with faster-whisper. The audio is decoded by ffmpeg as 16 kHz mono PCM
+    and analyzed one window at a time, so that at most one window is in memory.
+
+    Args:
+        audio_path (str): The path of the audio file.
+        window_seconds (float, optional): The length of the analyzed windows, in seconds.
+
+    Returns:
+        list: The (start, end) intervals with speech, in seconds.
+
+    Raises:
+        ImportError: If faster-whisper (hence numpy and the VAD) is not installed.
+    """
+    import numpy as np
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    vad_options = VadOptions(min_silence_duration_ms=2000)
+    window_bytes = int(window_seconds * SAMPLE_RATE) * 2
+    process = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", audio_path, "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        stdout=subprocess.PIPE,
+    )
+    intervals = []
+    offset = 0.0
+    try:
+        while True:
+            data = process.stdout.read(window_bytes)
+            if not data:
+                break
+            audio = np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0
+            for timestamp in get_speech_timestamps(audio, vad_options):
+                intervals.append((offset + timestamp["start"] / SAMPLE_RATE, offset + timestamp["end"] / SAMPLE_RATE))
+            offset += len(audio) / SAMPLE_RATE
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+    return intervals
@@ -0,0 +1,185 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+SILENCE_START_PATTERN = re.compile(r'silence_start: (-?[\d.]+)')
+SILENCE_END_PATTERN = re.compile(r'silence_end: (-?[\d.]+)')
+WORD_NORMALIZE_PATTERN = re.compile(r'[^\w]+')
+
+
+def ffmpeg_available() -> bool:
+    '''Returns True if both ffmpeg and ffprobe are available in the PATH.'''
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def get_audio_duration(audio_path: str) -> float:
+    """
+    Reads the duration of an audio file using ffprobe.
+
+    Args:
+        audio_path (str): The path of the audio file.
+
+    Returns:
+        float: The duration of the audio, in seconds.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", audio_path],
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip())
+
+
+def detect_silences(audio_path: str, noise_db: int = -35, min_silence_seconds: float = 0.5, duration: float = None) -> list:
+    """
+    Finds the silent intervals of an audio file using the ffmpeg `silencedetect` filter.
+
+    Args:
+        audio_path (str): The path of the audio file.
+        noise_db (int, optional): The volume (in dB) under which the audio is considered silent.
+        min_silence_seconds (float, optional): The minimum length of a silent interval.
+        duration (float, optional): The duration of the audio. If given, a silence lasting until the end of the audio (which ffmpeg does not close) is included.
+
+    Returns:
+        list: A list of (start, end) tuples, in seconds.
+    """
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", audio_path, "-af", f"silencedetect=noise={noise_db}dB:d={min_silence_seconds}", "-f", "null", "-"],
+        capture_output=True, text=True,
+    )
+    starts = [float(value) for value in SILENCE_START_PATTERN.findall(result.stderr)]
+    ends = [float(value) for value in SILENCE_END_PATTERN.findall(result.stderr)]
+    if duration is not None and len(starts) > len(ends):
+        ends.append(duration)
+    return list(zip(starts, ends))
+
+
+def plan_segments(duration: float, segment_seconds: float, overlap_seconds: float = 0, silences: list = None,
+                  search_window_seconds: float = None) -> list:
+    """
+    Computes the time windows used to split a long audio. Each cut is moved to the middle of the latest silence found
+    in the `search_window_seconds` before the target cut, and consecutive windows share `overlap_seconds` of audio.
+
+    Args:
+        duration (float): The duration of the audio, in seconds.
+        segment_seconds (float): The max length of each window, in seconds.
+        overlap_seconds (float, optional): The audio shared by consecutive windows, in seconds.
+        silences (list, optional): The silent intervals of the audio, see `detect_silences`.
+        search_window_seconds (float, optional): How far before the target cut a silence is searched. Defaults to 20% of `segment_seconds`.
+
+    Returns:
+        list: A list of (start, end) tuples, in seconds, covering the whole audio.
+    """
+    if search_window_seconds is None:
+        search_window_seconds = segment_seconds * 0.2
+    silence_midpoints = sorted((start + end) / 2 for start, end in (silences or []))
+
+    segments = []
+    start = 0.0
+    while start < duration:
+        target_end = start + segment_seconds
+        if target_end >= duration:
+            segments.append((start, duration))
+            break
+
+        end = target_end
+        candidates = [midpoint for midpoint in silence_midpoints if target_end - search_window_seconds <= midpoint < target_end and midpoint > start + overlap_seconds]
+        if candidates:
+            end = candidates[-1]
+        segments.append((start, end))
+        start = max(end - overlap_seconds, start + 1)
+    return segments
+
+
+def extract_segment(audio_path: str, start: float, end: float, output_path: str, codec_args: list = None) -> str:
+    """
+    Extracts a time window of an audio file, converting it to 16 kHz mono FLAC (enough for speech recognition).
+    An audio already preprocessed (see `AudioPreprocessor`) can be cut without re-encoding, with `codec_args=["-c:a", "copy"]`.
+
+    Args:
+        audio_path (str): The path of the source audio file.
+        start (float): The start of the window, in seconds.
+        end (float): The end of the window, in seconds.
+        output_path (str): The path of the extracted segment, with .flac extension (or the extension of the source, when copied).
+        codec_args (list, optional): The ffmpeg output options of the segment. Defaults to 16 kHz mono FLAC.
+
+    Returns:
+        str: The path of the extracted segment.
+    """
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", audio_path,
+         *(codec_args or ["-ac", "1", "-ar", "16000", "-c:a", "flac"]), output_path],
+        check=True,
+    )
+    return output_path
+
+
+def _normalize_word(word: str) -> str:
+    return WORD_NORMALIZE_PATTERN.sub("", word.lower())
+
+
+def merge_overlapping_texts(previous_text: str, next_text: str, max_overlap_words: int = 40, max_skip_words: int = 3) -> str:
+    """
+    Joins the transcriptions of two consecutive overlapping segments, removing from the second one the words
+    already present at the end of the first one. The first words of the second segment can be skipped before
+    the match (up to `max_skip_words`), since a word cut by the window start is often transcribed wrongly.
+
+    Args:
+        previous_text (str): The transcription of the first segment.
+        next_text (str): The transcription of the second segment.
+        max_overlap_words (int, optional): The max number of duplicated words searched.
+        max_skip_words (int, optional): The max number of words skipped at the start of the second segment.
+
+    Returns:
+        str: The joined transcription.
+    """
+    previous_words = previous_text.split()
+    next_words = next_text.split()
+    previous_normalized = [_normalize_word(word) for word in previous_words[-max_overlap_words:]]
+    next_normalized = [_normalize_word(word) for word in next_words[:max_overlap_words + max_skip_words]]
+
+    for length in range(min(len(previous_normalized), len(next_normalized)), 0, -1):
+        tail = previous_normalized[-length:]
+        for skip in range(0, max_skip_words + 1):
+            # short matches are accepted only at the very start of the second segment
+            if skip > 0 and length < 2:
+                break
+            if next_normalized[skip:skip + length] == tail:
+                next_words = next_words[skip + length:]
+                return " ".join(previous_words + next_words)
+
+    return " ".join(previous_words + next_words)
+
+
+def concatenate_audio(audio_paths: list, output_path: str) -> str:
+    """
+    Joins audio files encoded with the same codec (e.g. the MP3 segments of a TTS) into a single file.
+    The ffmpeg concat demuxer is used when available, so that the output has consistent headers; otherwise the MP3 frames are concatenated byte-wise, which players handle as a single stream.
+
+    Args:
+        audio_paths (list): The paths of the audio files, in order.
+        output_path (str): The path of the joined file.
+
+    Returns:
+        str: The path of the joined file.
+    """
+    if ffmpeg_available() and len(audio_paths) > 1:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+            for audio_path in audio_paths:
+                list_file.write(f"file '{os.path.abspath(audio_path)}'\n")
+        try:
+            subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_file.name,
+                 "-c", "copy", "-f", "mp3", output_path],
+                check=True,
+            )
+        finally:
+            os.remove(list_file.name)
+        return output_path
+
+    with open(output_path, "wb") as output_file:
+        for audio_path in audio_paths:
+            with open(audio_path, "rb") as audio_file:
+                shutil.copyfileobj(audio_file, output_file)
+    return output_path
@@ -0,0 +1,124 @@
+'''
+Registry of the backends of each step of the pipeline: downloaders, transcriptors, translators and TTS generators.
+
+A backend is registered by name with the import path of its class, so that its module (and the SDK behind it: pytubefix, groq, openai,
+gtts, faster_whisper) is imported only when the backend is built for the first time. A run using only gTTS never imports openai, and a
+short CLI job or a freshly scaled container does not pay for the backends it does not use.
+'''
+import importlib
+import threading
+
+# backend kind -> backend name -> ("module:Class", default keyword arguments)
+BACKENDS = {
+    "downloader": {
+        "pytubefix": ("videodownloader:PytubeFix_VideoDownloader", {}),
+    },
+    "transcriptor": {
+        "groq": ("videotranscriptor:Groq_Transcriptor", {"model_name": "whisper-large-v3-turbo"}),
+        "local": ("videotranscriptor:Local_Transcriptor", {}),
+    },
+    "translator": {
+        "groq": ("translator:Groq_Translator", {}),
+    },
+    "tts": {
+        "openai": ("ttsgenerator:OpenAI_TTSGenerator", {}),
+        "gtts": ("ttsgenerator:g_TTSGenerator", {}),
+    },
+}
+
+_backends_lock = threading.Lock()
+
+
+def register_backend(kind: str, name: str, class_path: str, **kwargs):
+    """
+    Registers (or replaces) a backend.
+
+    Args:
+        kind (str): The kind of backend, a key of `BACKENDS` ("downloader", "transcriptor", "translator" or "tts").
+        name (str): The name of the backend.
+        class_path (str): The import path of the class, as "module:Class". The module is imported only when the backend is built.
+        **kwargs: The default keyword arguments of the class.
+    """
+    with _backends_lock:
+        BACKENDS.setdefault(kind, {})[name] = (class_path, kwargs)
+
+
+def backend_names(kind: str) -> list:
+    '''Returns the names of the backends registered for a kind.'''
+    return list(BACKENDS.get(kind, {}))
+
+
+def load_backend(kind: str, name: str) -> type:
+    """
+    Imports the module of a backend and returns its class.
+
+    Args:
+        kind (str): The kind of backend.
+        name (str): The name of the backend.
+
+    Returns:
+        type: The class of the backend.
+    """
+    if name not in BACKENDS.get(kind, {}):
+        raise ValueError(f"Unknown {kind} backend: {name} - use one of {backend_names(kind)}")
+    class_path, _ = BACKENDS[kind][name]
+    module_name, class_name = class_path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def build_backend(kind: str, name: str, **kwargs):
+    """
+    Builds a backend, importing its module on first use.
+
+    Args:
+        kind (str): The kind of backend.
+        name (str): The name of the backend.
+        **kwargs: Keyword arguments overriding the registered defaults.
+
+    Returns:
+        The backend instance.
+    """
+    backend_class = load_backend(kind, name)
+    return backend_class(**{**BACKENDS[kind][name][1], **kwargs})
+
+
+class LazyBackend():
+    '''A backend built on first use by `get`, once even if many threads ask for it at the same time.'''
+
+    def __init__(self, build, instance = None):
+        """
+        Args:
+            build (callable): Builds the backend, called without arguments.
+            instance (optional): An already built backend; if given, `build` is never called.
+        """
+        self.build = build
+        self.instance = instance
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.instance is None:
+            with self.lock:
+                if self.instance is None:
+                    self.instance = self.build()
+        return self.instance
+
+
+class LazyBackends(dict):
+    '''A dict of backends keyed by name (e.g. the TTS generators), each built by `build_backend` the first time it is looked up.'''
+
+    def __init__(self, kind: str, names: list = None):
+        super().__init__()
+        self.kind = kind
+        self.names = list(names) if names is not None else backend_names(kind)
+        self.lock = threading.Lock()
+
+    def __missing__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        with self.lock:
+            if not dict.__contains__(self, name):
+                self[name] = build_backend(self.kind, name)
+            return dict.__getitem__(self, name)
+
+    def __contains__(self, name):
+        return name in self.names
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import json
+import threading
+import time
+from utils import get_video_id
+from metrics import start_trace, submit_with_context
+
+DEFAULT_STAGE_LIMITS = {
+    "download": 2,
+    "transcript": 2,
+    "summary": 4,
+    "tts": 2,
+}
+
+
+def read_url_file(file_path: str) -> list:
+    """
+    Reads a list of video URLs from a text file, one URL per line. Empty lines and lines starting with # are ignored.
+
+    Args:
+        file_path (str): The path of the file.
+
+    Returns:
+        list: The URLs, in file order.
+    """
+    with open(file_path, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip() and not line.strip().startswith("#")]
+
+
+def expand_playlist(playlist_url: str) -> list:
+    '''Returns the URLs of the videos of a YouTube playlist.'''
+    from pytubefix import Playlist
+    return list(Playlist(playlist_url).video_urls)
+
+
+def expand_channel(channel_url: str) -> list:
+    '''Returns the URLs of the videos of a YouTube channel.'''
+    from pytubefix import Channel
+    return list(Channel(channel_url).video_urls)
+
+
+def transcript_stages(summarizer, input_url: str, video_id: str) -> tuple:
+    '''The stages of the transcript step of a video: also the download when the audio is downloaded while transcribed (see `streaming.py`).'''
+    return ("download", "transcript") if summarizer.transcript_downloads(input_url, video_id) else ("transcript",)
+
+
+class StageLimiter():
+    '''
+    Per-stage concurrency limits of the pipeline: every stage has its own semaphore, so that e.g. at most `limits["download"]`
+    downloads run at the same time whatever the number of jobs in flight.
+    '''
+
+    def __init__(self, stage_limits: dict = None):
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS, **(stage_limits or {}))
+        self.stage_semaphores = {stage: threading.BoundedSemaphore(limit) for stage, limit in self.stage_limits.items()}
+
+    def run(self, stage, function, *args):
+        """
+        Runs `function(*args)` holding a slot of the given stage.
+
+        Args:
+            stage (str | tuple): The stage of the pipeline, one of `DEFAULT_STAGE_LIMITS`, or a tuple of stages for a step doing the work of
+                several stages (e.g. a transcription streaming the download). The slots are always taken in the order of `DEFAULT_STAGE_LIMITS`.
+            function (callable): The step to be run.
+            *args: The arguments of the step.
+
+        Returns:
+            The result of the step.
+        """
+        stages = [stage] if isinstance(stage, str) else sorted(stage, key=list(self.stage_limits).index)
+        with ExitStack() as stack:
+            for held_stage in stages:
+                stack.enter_context(self.stage_semaphores[held_stage])
+            return function(*args)
+
+    def slot(self, stage: str):
+        '''Returns the semaphore of the stage, to be used as a context manager for steps that cannot be wrapped in a single call (e.g. generators).'''
+        return self.stage_semaphores[stage]
+
+
+class BatchPipeline():
+    '''
+    Processes many videos in many languages with the steps of `PolySummaryYT` running as overlapping pipeline stages.
+    Every video runs in its own job, and each stage (download, transcript, summary, tts) is guarded by its own concurrency limit,
+    so the download of a video happens while the previous ones are being transcribed or summarized.
+    Every (video, language) result is appended to a JSONL manifest as soon as it is available.
+    '''
+
+    def __init__(self, summarizer, stage_limits: dict = None):
+        self.summarizer = summarizer
+        self.stage_limiter = StageLimiter(stage_limits)
+        self.manifest_lock = threading.Lock()
+
+    def run(self, urls: list, languages: list, manifest_path: str, groq_key_input: str = None, openai_key: str = None) -> list:
+        """
+        Runs the pipeline on all the videos and languages.
+
+        Args:
+            urls (list): The URLs of the videos.
+            languages (list): The destination languages; every video is summarized in each of them.
+            manifest_path (str): The path of the JSONL manifest; records are appended to it.
+            groq_key_input (str, optional): The GROQ API key.
+            openai_key (str, optional): The OpenAI API key, used for the TTS if provided.
+
+        Returns:
+            list: The manifest records, one for each (video, language).
+        """
+        records = []
+        # each video job holds at most one stage slot at a time, so this many jobs are enough to keep every stage busy
+        max_jobs = sum(self.stage_limiter.stage_limits.values())
+        with open(manifest_path, "a", encoding="utf-8") as manifest_file:
+            def write_record(record):
+                with self.manifest_lock:
+                    records.append(record)
+                    manifest_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    manifest_file.flush()
+
+            with ThreadPoolExecutor(max_workers=max_jobs) as video_executor, ThreadPoolExecutor(max_workers=max_jobs) as language_executor:
+                futures = [video_executor.submit(self.process_video, url, languages, groq_key_input, openai_key, language_executor, write_record)
+                           for url in urls]
+                for future in futures:
+                    future.result()
+        return records
+
+    def process_video(self, url, languages, groq_key_input, openai_key, language_executor, write_record):
+        with start_trace(url=url, languages=languages, batch=True):
+            self._process_video(url, languages, groq_key_input, openai_key, language_executor, write_record)
+
+    def _process_video(self, url, languages, groq_key_input, openai_key, language_executor, write_record):
+        start = time.perf_counter()
+        try:
+            video_id = get_video_id(url)
+            self.stage_limiter.run("download", self.summarizer.fetch_step, url, video_id)
+            transcript_result = self.stage_limiter.run(transcript_stages(self.summarizer, url, video_id), self.summarizer.transcript_step,
+                                                       url, video_id, groq_key_input)
+            # the transcription is split once and shared by all the languages
+            transcription_chunks = self.summarizer.translator.split_transcription(transcript_result["text"])
+        except Exception as e:
+            print(f"failed processing {url}: {e}")
+            for language in languages:
+                write_record({"url": url, "language": language, "status": "error", "error": str(e),
+                              "elapsed_seconds": round(time.perf_counter() - start, 3)})
+            return
+
+        language_futures = [submit_with_context(language_executor, self.process_language, url, video_id, language, transcription_chunks,
+                                                         groq_key_input, openai_key, start, write_record)
+                            for language in languages]
+        for future in language_futures:
+            future.result()
+
+    def process_language(self, url, video_id, language, transcription_chunks, groq_key_input, openai_key, start, write_record):
+        record = {"url": url, "video_id": video_id, "language": language}
+        try:
+            text = self.stage_limiter.run("summary", self.summarizer.summary_step, url, video_id, language, groq_key_input, transcription_chunks)
+            audio_path = self.stage_limiter.run("tts", self.summarizer.tts_step, text, url, video_id, language, openai_key)
+            record.update({"status": "ok", "text": text, "audio_path": audio_path})
+        except Exception as e:
+            print(f"failed processing {url} in {language}: {e}")
+            record.update({"status": "error", "error": str(e)})
+        record["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+        write_record(record)
@@ -0,0 +1,102 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+
+
+class CheckpointStore():
+    '''
+    Persistent store of the intermediate results of the long steps (the transcription of each audio segment, the summary of each part
+    of a transcription), stored in a SQLite database. Every result is written as soon as it is completed, so that a step interrupted
+    by a crash, a redeploy or a rate-limit abort resumes from the completed chunks instead of starting over.
+    The checkpoints of a step are deleted once the step is completed and its result is in the `StageCache`.
+    '''
+
+    def __init__(self, db_path: str = os.path.join("cache", "checkpoints.sqlite"), max_age_seconds: float = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS chunk_checkpoints (
+                    video_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    chunk_key TEXT NOT NULL,
+                    chunk_idx INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, stage, model, language, chunk_key)
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def checkpoint(self, video_id: str, stage: str, model: str, language: str = "") -> "ChunkCheckpoint":
+        """
+        Returns the checkpoint of a step, to be passed to the transcriptor or the translator.
+
+        Args:
+            video_id (str): The id of the YouTube video.
+            stage (str): The step, e.g. "transcript" or "summary".
+            model (str): The model producing the chunks.
+            language (str, optional): The destination language (and any other setting changing the chunks, e.g. the prompt version).
+
+        Returns:
+            ChunkCheckpoint: The checkpoint of the step.
+        """
+        return ChunkCheckpoint(self, video_id, stage, model, language)
+
+    def load(self, video_id: str, stage: str, model: str, language: str = "") -> dict:
+        '''Returns the completed chunks of a step, keyed by chunk key. Checkpoints older than `max_age_seconds` are ignored.'''
+        with self._connect() as connection:
+            rows = connection.execute(
+                """SELECT chunk_key, value FROM chunk_checkpoints
+                   WHERE video_id = ? AND stage = ? AND model = ? AND language = ? AND created_at >= ?""",
+                (video_id, stage, model, language, time.time() - self.max_age_seconds),
+            ).fetchall()
+        return dict(rows)
+
+    def save(self, video_id: str, stage: str, model: str, language: str, chunk_key: str, chunk_idx: int, value: str):
+        '''Stores (or replaces) the result of a chunk.'''
+        with self._connect() as connection:
+            connection.execute(
+                """INSERT OR REPLACE INTO chunk_checkpoints (video_id, stage, model, language, chunk_key, chunk_idx, value, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (video_id, stage, model, language, chunk_key, chunk_idx, value, time.time()),
+            )
+
+    def clear(self, video_id: str, stage: str, model: str, language: str = ""):
+        '''Deletes the checkpoints of a step, and the expired checkpoints of any step.'''
+        with self._connect() as connection:
+            connection.execute("DELETE FROM chunk_checkpoints WHERE video_id = ? AND stage = ? AND model = ? AND language = ?",
+                               (video_id, stage, model, language))
+            connection.execute("DELETE FROM chunk_checkpoints WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+
+
+class ChunkCheckpoint():
+    '''The checkpoints of a single step (video, stage, model and language) of a `CheckpointStore`.'''
+
+    def __init__(self, store: CheckpointStore, video_id: str, stage: str, model: str, language: str = ""):
+        self.store = store
+        self.fields = (video_id, stage, model, language)
+
+    def load(self) -> dict:
+        '''Returns the completed chunks, keyed by chunk key.'''
+        return self.store.load(*self.fields)
+
+    def save(self, chunk_key: str, chunk_idx: int, value: str):
+        '''Stores the result of a chunk as soon as it is completed.'''
+        self.store.save(*self.fields, chunk_key, chunk_idx, value)
+
+    def clear(self):
+        '''Deletes the checkpoints, once the step is completed.'''
+        self.store.clear(*self.fields)
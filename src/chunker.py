@@ -0,0 +1,170 @@
+import math
+import re
+import zlib
+
+# Average number of characters per token for the model families used with GROQ.
+# The values are rough estimates, good enough to size the chunks without loading a tokenizer.
+CHARS_PER_TOKEN = {
+    "llama": 4.0,
+    "mixtral": 3.8,
+    "gemma": 3.8,
+}
+DEFAULT_CHARS_PER_TOKEN = 4.0
+
+SENTENCE_PATTERN = re.compile(r'[^.!?。！？]+(?:[.!?。！？]+["\'»”)\]]*\s*|$)|[.!?。！？]+\s*')
+WORD_PATTERN = re.compile(r'\S+\s*|\s+')
+NORMALIZE_PATTERN = re.compile(r'[^\w]+')
+
+
+def chars_per_token(model_name: str = None) -> float:
+    """
+    Returns the estimated number of characters per token for the given model.
+
+    Args:
+        model_name (str, optional): The name of the model, e.g. "llama-3.1-70b-versatile".
+
+    Returns:
+        float: The estimated number of characters per token.
+    """
+    if model_name:
+        for family, ratio in CHARS_PER_TOKEN.items():
+            if family in model_name.lower():
+                return ratio
+    return DEFAULT_CHARS_PER_TOKEN
+
+
+def estimate_tokens(text: str, model_name: str = None) -> int:
+    """
+    Estimates the number of tokens of a text for the given model, without tokenizing it.
+
+    Args:
+        text (str): The text to be measured.
+        model_name (str, optional): The name of the model that will receive the text.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return math.ceil(len(text) / chars_per_token(model_name))
+
+
+def split_sentences(text: str) -> list:
+    """
+    Splits a text into sentences, keeping the trailing punctuation and whitespace of each sentence.
+    Joining the returned list gives back the original text.
+
+    Args:
+        text (str): The text to be split.
+
+    Returns:
+        list: The sentences of the text.
+    """
+    return [match.group() for match in SENTENCE_PATTERN.finditer(text) if match.group()]
+
+
+class TranscriptChunker():
+    '''
+    Splits a transcription into chunks sized by estimated tokens for the target model.
+    The cuts are placed on sentence boundaries when possible, falling back to word boundaries (and to raw characters
+    for words longer than a chunk) only when a single sentence does not fit. Consecutive chunks can share
+    `overlap_tokens` tokens of context. The whole text is always covered, including the final partial chunk,
+    and the split runs in linear time over the length of the transcription.
+
+    With `content_defined`, a chunk longer than `min_fraction` of the max length is also cut after any sentence whose normalized text
+    hashes to a boundary (one sentence in `boundary_divisor`). The cuts then depend on the sentences around them and not on the position
+    in the transcription, so the same passage (a reused intro, outro or sponsor segment, a re-upload with a different start) is cut
+    into the same chunks in every transcription, and their summaries can be memoized.
+    '''
+
+    def __init__(self, max_tokens: int = 2000, overlap_tokens: int = 0, model_name: str = None, content_defined: bool = False,
+                 min_fraction: float = 0.5, boundary_divisor: int = 24):
+        if overlap_tokens >= max_tokens:
+            raise ValueError(f"overlap_tokens ({overlap_tokens}) must be smaller than max_tokens ({max_tokens})")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_chars = int(max_tokens * chars_per_token(model_name))
+        self.overlap_chars = int(overlap_tokens * chars_per_token(model_name))
+        self.content_defined = content_defined
+        # a chunk made only of the overlap of the previous one is never cut
+        self.min_chars = max(int(self.max_chars * min_fraction), self.overlap_chars + 1)
+        self.boundary_divisor = boundary_divisor
+
+    def split(self, transcription: str) -> list:
+        """
+        Splits the transcription into chunks.
+
+        Args:
+            transcription (str): The full transcription text.
+
+        Returns:
+            list: The chunks as strings, in order, with surrounding whitespace stripped.
+        """
+        chunks = []
+        for start, end in self.split_spans(transcription):
+            chunk = transcription[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def split_spans(self, transcription: str) -> list:
+        """
+        Computes the cut points of the transcription.
+
+        Args:
+            transcription (str): The full transcription text.
+
+        Returns:
+            list: A list of (start, end) character offsets, one for each chunk. The spans cover the whole text;
+            a span starts before the end of the previous one only when overlap is enabled.
+        """
+        units = self._split_units(transcription)
+        if not units:
+            return []
+
+        spans = []
+        chunk_first = 0
+        for idx, (unit_start, unit_end) in enumerate(units):
+            if idx > chunk_first and unit_end - units[chunk_first][0] > self.max_chars:
+                chunk_first = self._cut(spans, units, chunk_first, idx)
+            if (self.content_defined and idx + 1 < len(units) and unit_end - units[chunk_first][0] >= self.min_chars
+                    and self._is_boundary(transcription[unit_start:unit_end])):
+                chunk_first = self._cut(spans, units, chunk_first, idx + 1)
+
+        spans.append((units[chunk_first][0], units[-1][1]))
+        return spans
+
+    def _cut(self, spans: list, units: list, chunk_first: int, next_idx: int) -> int:
+        '''Ends the current chunk before the unit `next_idx` and returns the first unit of the next chunk.'''
+        previous_end = units[next_idx - 1][1]
+        spans.append((units[chunk_first][0], previous_end))
+
+        # move the start of the next chunk back to include the overlap, without going past the current chunk start
+        first = next_idx
+        while first - 1 > chunk_first and previous_end - units[first - 1][0] <= self.overlap_chars:
+            first -= 1
+        # the overlap must never prevent the new unit from fitting in the chunk
+        while first < next_idx and units[next_idx][1] - units[first][0] > self.max_chars:
+            first += 1
+        return first
+
+    def _is_boundary(self, unit_text: str) -> bool:
+        '''True if a content-defined cut goes after this unit: its normalized text (as in the summary memo) hashes to a boundary.'''
+        normalized = " ".join(NORMALIZE_PATTERN.sub(" ", unit_text.lower()).split())
+        return bool(normalized) and zlib.crc32(normalized.encode("utf-8")) % self.boundary_divisor == 0
+
+    def _split_units(self, transcription: str) -> list:
+        '''Returns the (start, end) offsets of the smallest pieces that will never be cut: sentences, or words/characters for oversized sentences.'''
+        units = []
+        for sentence in SENTENCE_PATTERN.finditer(transcription):
+            start, end = sentence.span()
+            if start == end:
+                continue
+            if end - start <= self.max_chars:
+                units.append((start, end))
+                continue
+            for word in WORD_PATTERN.finditer(transcription, start, end):
+                word_start, word_end = word.span()
+                while word_end - word_start > self.max_chars:
+                    units.append((word_start, word_start + self.max_chars))
+                    word_start += self.max_chars
+                units.append((word_start, word_end))
+        return units
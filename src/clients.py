@@ -0,0 +1,156 @@
+'''
+Registry of the API clients shared by all the steps of the pipeline.
+
+Building a `Groq` or `OpenAI` client for every request means a new connection pool, hence a new TCP/TLS handshake for every chunk.
+The clients returned here are built once for each API key and reuse pooled keep-alive connections. The sync clients are safe to
+share between threads; the async clients are bound to the event loop that created them, so one set of clients is kept for each loop,
+and it is dropped with the loop when the loop is garbage collected (`close_async_clients` closes them before the loop is closed).
+The retries of the SDKs are disabled: failed requests are retried by the shared `RateLimiter` of `ratelimiter.py`, which also paces them.
+'''
+import asyncio
+import os
+import threading
+import weakref
+
+CLIENTS_CONFIG = {
+    "max_connections": int(os.environ.get("CLIENTS_MAX_CONNECTIONS", 32)),
+    "max_keepalive_connections": int(os.environ.get("CLIENTS_MAX_KEEPALIVE_CONNECTIONS", 16)),
+    "keepalive_expiry": float(os.environ.get("CLIENTS_KEEPALIVE_EXPIRY", 60)),
+    "timeout": float(os.environ.get("CLIENTS_TIMEOUT", 120)),
+    "connect_timeout": float(os.environ.get("CLIENTS_CONNECT_TIMEOUT", 10)),
+}
+
+_clients = {}
+# event loop -> {(service, api key): async client}, the entry of a loop disappears with the loop
+_async_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def configure_clients(**config):
+    """
+    Updates the connection pool size and timeouts of the clients. The clients already built are forgotten, so that the next calls build them with the new
+    configuration; they are not closed, since other threads may be in the middle of a request with them, and their connections are released once
+    the last request using them is done and they are garbage collected.
+
+    Args:
+        **config: Any of the keys of `CLIENTS_CONFIG` (max_connections, max_keepalive_connections, keepalive_expiry, timeout, connect_timeout).
+    """
+    unknown_keys = set(config) - set(CLIENTS_CONFIG)
+    if unknown_keys:
+        raise ValueError(f"Unknown clients configuration keys: {sorted(unknown_keys)}")
+    with _clients_lock:
+        CLIENTS_CONFIG.update(config)
+        _clients.clear()
+        _async_clients.clear()
+
+
+def _http_client_options():
+    import httpx
+    return {
+        "limits": httpx.Limits(max_connections=CLIENTS_CONFIG["max_connections"],
+                               max_keepalive_connections=CLIENTS_CONFIG["max_keepalive_connections"],
+                               keepalive_expiry=CLIENTS_CONFIG["keepalive_expiry"]),
+        "timeout": httpx.Timeout(CLIENTS_CONFIG["timeout"], connect=CLIENTS_CONFIG["connect_timeout"]),
+    }
+
+
+def _get_client(registry_key, build_client, registry = None):
+    registry = _clients if registry is None else registry
+    client = registry.get(registry_key)
+    if client is None:
+        with _clients_lock:
+            client = registry.get(registry_key)
+            if client is None:
+                client = build_client()
+                registry[registry_key] = client
+    return client
+
+
+def _loop_clients():
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        return _async_clients.setdefault(loop, {})
+
+
+def get_groq_client(api_key: str):
+    """
+    Returns the shared sync GROQ client for the given API key.
+
+    Args:
+        api_key (str): The GROQ API key.
+
+    Returns:
+        Groq: The client, reusing pooled connections.
+    """
+    import httpx
+    from groq import Groq
+    return _get_client(("groq", api_key),
+                       lambda: Groq(api_key=api_key, max_retries=0, http_client=httpx.Client(**_http_client_options())))
+
+
+def get_openai_client(api_key: str):
+    """
+    Returns the shared sync OpenAI client for the given API key.
+
+    Args:
+        api_key (str): The OpenAI API key.
+
+    Returns:
+        OpenAI: The client, reusing pooled connections.
+    """
+    import httpx
+    from openai import OpenAI
+    return _get_client(("openai", api_key),
+                       lambda: OpenAI(api_key=api_key, max_retries=0, http_client=httpx.Client(**_http_client_options())))
+
+
+def get_async_groq_client(api_key: str):
+    """
+    Returns the shared async GROQ client for the given API key and the running event loop.
+
+    Args:
+        api_key (str): The GROQ API key.
+
+    Returns:
+        AsyncGroq: The client, reusing pooled connections.
+    """
+    import httpx
+    from groq import AsyncGroq
+    return _get_client(("groq", api_key),
+                       lambda: AsyncGroq(api_key=api_key, max_retries=0, http_client=httpx.AsyncClient(**_http_client_options())),
+                       _loop_clients())
+
+
+def get_async_openai_client(api_key: str):
+    """
+    Returns the shared async OpenAI client for the given API key and the running event loop.
+
+    Args:
+        api_key (str): The OpenAI API key.
+
+    Returns:
+        AsyncOpenAI: The client, reusing pooled connections.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    return _get_client(("openai", api_key),
+                       lambda: AsyncOpenAI(api_key=api_key, max_retries=0, http_client=httpx.AsyncClient(**_http_client_options())),
+                       _loop_clients())
+
+
+async def close_async_clients():
+    '''Closes and forgets the async clients of the running event loop. To be awaited before the loop is closed, once its requests are done.'''
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = list(_async_clients.pop(loop, {}).values())
+    for client in clients:
+        await client.close()
+
+
+def close_clients():
+    '''Closes and forgets all the sync clients of the registry. To be called at shutdown, once no request is using them.'''
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+import time
+
+# files that are part of the cache machinery and not cached entries
+IGNORED_SUFFIXES = (".sqlite", ".part", ".tmp", ".lock", ".json")
+
+
+class DiskCacheManager():
+    '''
+    Keeps the size of a cache folder (e.g. `download_audio` or `translated_audio`) within a byte budget.
+    The cached files are tracked in a SQLite index in the folder, one row per file with its size, last access time and number of hits,
+    so that lookups never list the folder and a hit updates only its own row. When the total size exceeds `max_bytes`, the least recently
+    used (policy "lru") or least frequently used (policy "lfu") files are deleted. Hits and misses are counted in the index too, see `stats`.
+    SQLite serializes the writes, so the manager can be shared by threads and processes.
+    '''
+
+    def __init__(self, folder: str, max_bytes: int, policy: str = "lru", index_name: str = ".cache_index.sqlite"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {policy} - use 'lru' or 'lfu'")
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.index_path = os.path.join(folder, index_name)
+        os.makedirs(folder, exist_ok=True)
+        index_exists = os.path.isfile(self.index_path)
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS cache_entries (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL
+                )"""
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            connection.execute("INSERT OR IGNORE INTO cache_counters (name, value) VALUES ('hits', 0), ('misses', 0)")
+        if not index_exists:
+            self.rebuild_index()
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def rebuild_index(self):
+        """
+        Adds to the index the files already in the folder (only the top level, hidden and machinery files excluded).
+        It is the only operation that lists the folder, and runs only when the index does not exist.
+        """
+        rows = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(IGNORED_SUFFIXES):
+                stat = entry.stat()
+                rows.append((entry.name, stat.st_size, stat.st_mtime))
+        with self._connect() as connection:
+            connection.executemany("INSERT OR IGNORE INTO cache_entries (name, size, last_access, hits) VALUES (?, ?, ?, 0)", rows)
+
+    def lookup(self, name: str, record_stats: bool = True) -> bool:
+        """
+        Checks if a file is cached, updating its last access time and the hit/miss counters.
+
+        Args:
+            name (str): The filename, relative to the cache folder.
+            record_stats (bool, optional): If False, the lookup does not change the counters nor the access time (e.g. for double-checks under a lock).
+
+        Returns:
+            bool: True if the file is cached.
+        """
+        with self._connect() as connection:
+            cached = connection.execute("SELECT 1 FROM cache_entries WHERE name = ?", (name,)).fetchone() is not None
+            if cached and not os.path.isfile(os.path.join(self.folder, name)):
+                # deleted by hand: forget it
+                connection.execute("DELETE FROM cache_entries WHERE name = ?", (name,))
+                cached = False
+            if record_stats:
+                if cached:
+                    connection.execute("UPDATE cache_entries SET last_access = ?, hits = hits + 1 WHERE name = ?", (time.time(), name))
+                connection.execute("UPDATE cache_counters SET value = value + 1 WHERE name = ?", ("hits" if cached else "misses",))
+        return cached
+
+    def add(self, name: str):
+        """
+        Registers a file just written in the cache folder, then evicts other files if the budget is exceeded.
+
+        Args:
+            name (str): The filename, relative to the cache folder.
+        """
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO cache_entries (name, size, last_access, hits) VALUES (?, ?, ?, 0)",
+                               (name, os.path.getsize(os.path.join(self.folder, name)), time.time()))
+            self._evict(connection, keep = name)
+
+    def evict(self):
+        '''Deletes files until the total size fits in `self.max_bytes`.'''
+        with self._connect() as connection:
+            self._evict(connection)
+
+    def _evict(self, connection, keep = None):
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        order = "last_access" if self.policy == "lru" else "hits, last_access"
+        evicted = []
+        for name, size in connection.execute(f"SELECT name, size FROM cache_entries ORDER BY {order}").fetchall():
+            if total_size <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            evicted.append((name,))
+            print(f'evicted {name} from {self.folder}')
+        connection.executemany("DELETE FROM cache_entries WHERE name = ?", evicted)
+
+    def stats(self) -> dict:
+        """
+        Returns the usage of the cache.
+
+        Returns:
+            dict: The folder, number of files, total and max bytes, hits, misses and hit rate.
+        """
+        with self._connect() as connection:
+            files, total_bytes = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+            counters = dict(connection.execute("SELECT name, value FROM cache_counters").fetchall())
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "folder": self.folder,
+            "policy": self.policy,
+            "files": files,
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "hit_rate": counters["hits"] / lookups if lookups else None,
+        }
+
+
+_disk_caches = {}
+_disk_caches_lock = threading.Lock()
+
+
+def get_disk_cache(folder: str, max_bytes: int, policy: str = "lru") -> DiskCacheManager:
+    """
+    Returns the `DiskCacheManager` of a folder, building it at the first call, so that all the users of the folder in the process share it.
+
+    Args:
+        folder (str): The cache folder.
+        max_bytes (int): The byte budget of the folder (used only when the manager is built).
+        policy (str, optional): The eviction policy, "lru" or "lfu" (used only when the manager is built).
+
+    Returns:
+        DiskCacheManager: The manager of the folder.
+    """
+    with _disk_caches_lock:
+        if folder not in _disk_caches:
+            _disk_caches[folder] = DiskCacheManager(folder, max_bytes, policy)
+        return _disk_caches[folder]
+
+
+def format_stats(stats: dict) -> str:
+    '''Formats the result of `DiskCacheManager.stats` on a single line.'''
+    hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "n/a"
+    return (f"{stats['folder']}: {stats['files']} files, {stats['total_bytes'] / 1024**2:.1f} / {stats['max_bytes'] / 1024**2:.1f} MB "
+            f"({stats['policy']}), hits {stats['hits']}, misses {stats['misses']}, hit rate {hit_rate}")
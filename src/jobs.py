@@ -0,0 +1,240 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+import time
+import uuid
+from batch import StageLimiter, transcript_stages
+from main import normalize_language
+from utils import get_video_id, single_flight
+from metrics import start_trace
+
+
+class Job():
+    '''State of a summarization request handled by the `JobManager`.'''
+
+    def __init__(self, job_id, input_url, video_id, destination_language, use_openai_tts):
+        self.job_id = job_id
+        self.input_url = input_url
+        self.video_id = video_id
+        self.destination_language = destination_language
+        self.use_openai_tts = use_openai_tts
+        self.status = "queued"  # queued -> running -> done | error
+        self.stage = None
+        self.text = ""
+        self.audio_path = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.finished_event = threading.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "input_url": self.input_url,
+            "video_id": self.video_id,
+            "language": self.destination_language,
+            "status": self.status,
+            "stage": self.stage,
+            "text": self.text,
+            "audio_path": self.audio_path,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def credentials_hash(*api_keys) -> str:
+    '''Identifies a set of API keys without keeping them in memory in clear.'''
+    return hashlib.sha256("\x1f".join(api_key or "" for api_key in api_keys).encode("utf-8")).hexdigest()
+
+
+class JobManager():
+    '''
+    Runs the summarization requests as background jobs on a bounded worker pool, instead of inside the caller (e.g. the Gradio click handler).
+    Each stage of a job (download, transcript, summary, tts) takes a slot of its own `StageLimiter` limit, so many users are served
+    concurrently without overloading any single service. Identical requests in flight (same video, language, TTS backend and API keys)
+    are merged into a single job, and the jobs of the same video in different languages fetch and transcribe it only once.
+    The summary text of a running job is updated while it is streamed, so callers can poll the progress.
+    Many requests can be submitted at once as a batch (see `submit_batch`), whose jobs are then followed together.
+    '''
+
+    def __init__(self, summarizer, max_workers: int = 8, stage_limits: dict = None, max_finished_jobs: int = 1000,
+                 lock_folder: str = os.path.join("cache", ".locks")):
+        self.summarizer = summarizer
+        self.lock_folder = lock_folder
+        self.stage_limiter = StageLimiter(stage_limits)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self.inflight_jobs = {}
+        self.batches = {}
+        self.jobs_lock = threading.Lock()
+
+    def submit(self, input_url: str, destination_language: str, groq_key_input: str = None, openai_key: str = None) -> str:
+        """
+        Submits a summarization request. If an identical request is already queued or running, its job is returned instead of starting a new one.
+
+        Args:
+            input_url (str): The URL of the video.
+            destination_language (str): The destination language.
+            groq_key_input (str, optional): The GROQ API key.
+            openai_key (str, optional): The OpenAI API key, used for the TTS if provided.
+
+        Returns:
+            str: The id of the job.
+        """
+        video_id = get_video_id(input_url)
+        destination_language = normalize_language(destination_language)
+        use_openai_tts = openai_key is not None and len(openai_key) > 2
+        # requests with different keys are never merged, so that a job never runs (or fails) on the keys of another caller
+        inflight_key = (video_id, destination_language, use_openai_tts, credentials_hash(groq_key_input, openai_key))
+
+        with self.jobs_lock:
+            job_id = self.inflight_jobs.get(inflight_key)
+            if job_id is not None:
+                print(f'merging request into job {job_id}')
+                return job_id
+
+            job = Job(uuid.uuid4().hex, input_url, video_id, destination_language, use_openai_tts)
+            self.jobs[job.job_id] = job
+            self.inflight_jobs[inflight_key] = job.job_id
+            self._forget_finished_jobs()
+
+        self.executor.submit(self._run_job, job, inflight_key, groq_key_input, openai_key)
+        return job.job_id
+
+    def submit_batch(self, input_urls: list, destination_languages: list, groq_key_input: str = None, openai_key: str = None) -> str:
+        """
+        Submits a job for every video in every language. All the URLs are checked before any job is submitted.
+
+        Args:
+            input_urls (list): The URLs of the videos.
+            destination_languages (list): The destination languages.
+            groq_key_input (str, optional): The GROQ API key.
+            openai_key (str, optional): The OpenAI API key, used for the TTS if provided.
+
+        Returns:
+            str: The id of the batch, see `batch_status`.
+        """
+        for input_url in input_urls:
+            get_video_id(input_url)
+        job_ids = [self.submit(input_url, destination_language, groq_key_input, openai_key)
+                   for input_url in input_urls for destination_language in destination_languages]
+
+        batch_id = uuid.uuid4().hex
+        with self.jobs_lock:
+            self.batches[batch_id] = job_ids
+            # the batches are forgotten in submission order, like the finished jobs they refer to
+            for old_batch_id in list(self.batches)[:max(0, len(self.batches) - self.max_finished_jobs)]:
+                del self.batches[old_batch_id]
+        return batch_id
+
+    def batch_status(self, batch_id: str) -> dict:
+        """
+        Returns the current state of the jobs of a batch.
+
+        Args:
+            batch_id (str): The id of the batch.
+
+        Returns:
+            dict: {"batch_id", "status": "running" or "done", "counts": <number of jobs by status>, "jobs": <state of each job, see `Job.to_dict`>}.
+            The jobs already forgotten (see `max_finished_jobs`) have status "expired".
+        """
+        with self.jobs_lock:
+            job_ids = self.batches.get(batch_id)
+            jobs = [self.jobs.get(job_id) for job_id in job_ids] if job_ids is not None else None
+        if jobs is None:
+            raise KeyError(f"Unknown batch id: {batch_id}")
+
+        job_statuses = [job.to_dict() if job is not None else {"job_id": job_id, "status": "expired"} for job_id, job in zip(job_ids, jobs)]
+        counts = {}
+        for job_status in job_statuses:
+            counts[job_status["status"]] = counts.get(job_status["status"], 0) + 1
+        finished = all(job_status["status"] in ("done", "error", "expired") for job_status in job_statuses)
+        return {"batch_id": batch_id, "status": "done" if finished else "running", "counts": counts, "jobs": job_statuses}
+
+    def status(self, job_id: str) -> dict:
+        """
+        Returns the current state of a job, including the summary text generated so far.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            dict: The state of the job, see `Job.to_dict`.
+        """
+        return self._get_job(job_id).to_dict()
+
+    def result(self, job_id: str, timeout: float = None) -> dict:
+        """
+        Waits for a job to finish and returns its result.
+
+        Args:
+            job_id (str): The id of the job.
+            timeout (float, optional): The max number of seconds to wait. Waits forever by default.
+
+        Returns:
+            dict: {"audio_path": <path>, "text": <summary>}, as returned by `PolySummaryYT.summarize_video`.
+        """
+        job = self._get_job(job_id)
+        if not job.finished_event.wait(timeout):
+            raise TimeoutError(f"Job {job_id} not finished after {timeout} seconds")
+        if job.status == "error":
+            raise Exception(f"Job {job_id} failed: {job.error}")
+        return {"audio_path": job.audio_path, "text": job.text}
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+    def _get_job(self, job_id):
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job id: {job_id}")
+        return job
+
+    def _forget_finished_jobs(self):
+        finished_jobs = sorted((job for job in self.jobs.values() if job.finished_at is not None), key=lambda job: job.finished_at)
+        for job in finished_jobs[:max(0, len(finished_jobs) - self.max_finished_jobs)]:
+            del self.jobs[job.job_id]
+
+    def _run_job(self, job, inflight_key, groq_key_input, openai_key):
+        job.status = "running"
+        with start_trace(url=job.input_url, video_id=job.video_id, languages=[job.destination_language], job_id=job.job_id):
+            self._run_job_stages(job, inflight_key, groq_key_input, openai_key)
+
+    def _run_job_stages(self, job, inflight_key, groq_key_input, openai_key):
+        summarizer = self.summarizer
+        try:
+            # the other jobs of the video wait here, then find its transcription in the stage cache
+            with single_flight(self.lock_folder, job.video_id):
+                job.stage = "download"
+                self.stage_limiter.run("download", summarizer.fetch_step, job.input_url, job.video_id)
+                job.stage = "transcript"
+                self.stage_limiter.run(transcript_stages(summarizer, job.input_url, job.video_id), summarizer.transcript_step,
+                                       job.input_url, job.video_id, groq_key_input)
+
+            job.stage = "summary"
+            with self.stage_limiter.slot("summary"):
+                streamed_text = ""
+                for event in summarizer.summary_stream_step(job.input_url, job.video_id, job.destination_language, groq_key_input):
+                    if event["type"] == "delta":
+                        streamed_text += event["text"]
+                        job.text = streamed_text
+                    else:
+                        job.text = event["text"]
+
+            job.stage = "tts"
+            job.audio_path = self.stage_limiter.run("tts", summarizer.tts_step, job.text, job.input_url, job.video_id,
+                                                    job.destination_language, openai_key)
+            job.status = "done"
+        except Exception as e:
+            print(f'job {job.job_id} failed: {e}')
+            job.error = str(e)
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+            with self.jobs_lock:
+                self.inflight_jobs.pop(inflight_key, None)
+            job.finished_event.set()
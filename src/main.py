@@ -1,7 +1,14 @@
-from videodownloader import PytubeFix_VideoDownloader
-from videotranscriptor import Groq_Transcriptor
-from translator import Groq_Translator
-from ttsgenerator import g_TTSGenerator, OpenAI_TTSGenerator
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+from backends import LazyBackend, LazyBackends, backend_names, build_backend
+from stagecache import StageCache
+from checkpoints import CheckpointStore
+from audiopreprocessor import AudioPreprocessor
+from streaming import stream_transcript
+from audiosegmenter import ffmpeg_available
+from utils import get_video_id
+from metrics import start_trace, stage_timer, submit_with_context
 
 LANGUAGES_DICT = {
         "🇮🇹 Italian": "italian",
@@ -12,58 +19,331 @@ LANGUAGES_DICT = {
         }
 
 
+def normalize_language(destination_language):
+    '''Maps the display names of the UI (e.g. "🇮🇹 Italian") to the language names used by the pipeline (e.g. "italian").'''
+    if len(destination_language) > 2:
+        destination_language = LANGUAGES_DICT.get(destination_language, destination_language)
+    return destination_language
+
+
 class PolySummaryYT():
-    '''This class is the main class of all the repo - it manages all the steps from the youtube URL to the generation of the translated audio.'''
+    '''This class is the main class of all the repo - it manages all the steps from the youtube URL to the generation of the translated audio.
+    The result of each step is stored in a `StageCache`, so that a step already computed for the same video (and model, language, prompt version) is skipped.
+    The default backends of the steps are built (and their modules imported) only when first used, see `backends.py`.'''
+
+    def __init__(self, stage_cache: StageCache = None, videodownloader: "VideoDownloader" = None, videotranscriptor: "VideoTranscriptor" = None,
+                 translator: "Translator" = None, tts_generators: dict = None, transcription_backend: str = None, stream_transcription: bool = True,
+                 checkpoint_store: CheckpointStore = None, audio_preprocessor: AudioPreprocessor = None, preprocess_audio: bool = True):
+        """
+        Args:
+            stage_cache (StageCache, optional): The cache of the step results. Defaults to `StageCache()`.
+            videodownloader (VideoDownloader, optional): Defaults to `PytubeFix_VideoDownloader()`.
+            videotranscriptor (VideoTranscriptor, optional): Defaults to the YouTube captions, with the `transcription_backend` for the videos without captions.
+            translator (Translator, optional): Defaults to `Groq_Translator()`.
+            tts_generators (dict, optional): The TTS generators keyed by name, "openai" (used when an OpenAI key is given) and "gtts".
+                Defaults to the "tts" backends of `backends.py`, `OpenAI_TTSGenerator()` and `g_TTSGenerator()`.
+            transcription_backend (str, optional): The name of the backend transcribing the audio, a "transcriptor" backend of `backends.py` ("groq" or "local").
+                Defaults to the environment variable TRANSCRIPTION_BACKEND, or "groq". Ignored if `videotranscriptor` is given.
+            stream_transcription (bool, optional): If True, the audio is transcribed segment by segment while it is downloaded (see `streaming.py`),
+                when the downloader supports it and ffmpeg is available.
+            checkpoint_store (CheckpointStore, optional): The store of the per-chunk results of the long steps, used to resume them. Defaults to `CheckpointStore()`.
+            audio_preprocessor (AudioPreprocessor, optional): Compresses the downloaded audio and cuts the sections without speech before the transcription.
+                Defaults to `AudioPreprocessor()`.
+            preprocess_audio (bool, optional): If False, the downloaded audio is transcribed as it is.
+        """
+        self._videodownloader = LazyBackend(lambda: build_backend("downloader", "pytubefix"), videodownloader)
+        if videotranscriptor is None:
+            transcription_backend = transcription_backend or os.environ.get("TRANSCRIPTION_BACKEND", "groq")
+            if transcription_backend not in backend_names("transcriptor"):
+                raise ValueError(f"Unknown transcription backend: {transcription_backend} - use one of {backend_names('transcriptor')}")
+        self._videotranscriptor = LazyBackend(lambda: self.build_caption_transcriptor(transcription_backend), videotranscriptor)
+        self.stream_transcription = stream_transcription
+        self._translator = LazyBackend(lambda: build_backend("translator", "groq"), translator)
+        self.tts_generators = tts_generators if tts_generators is not None else LazyBackends("tts", ["openai", "gtts"])
+        self.stage_cache = stage_cache if stage_cache is not None else StageCache()
+        self.checkpoint_store = checkpoint_store if checkpoint_store is not None else CheckpointStore()
+        if audio_preprocessor is None and preprocess_audio:
+            audio_preprocessor = AudioPreprocessor()
+        self.audio_preprocessor = audio_preprocessor
+
+    @property
+    def videodownloader(self):
+        return self._videodownloader.get()
+
+    @property
+    def videotranscriptor(self):
+        return self._videotranscriptor.get()
+
+    @property
+    def translator(self):
+        return self._translator.get()
 
-    def __init__(self):
-        self.videodownloader = PytubeFix_VideoDownloader()
-        self.videotranscriptor = Groq_Transcriptor("whisper-large-v3-turbo")
-        self.translator = Groq_Translator()
+    def build_caption_transcriptor(self, transcription_backend):
+        '''Builds the default transcriptor: the YouTube captions, read from the `YouTube` objects of the downloader, with the `transcription_backend`
+        for the videos without captions.'''
+        from videotranscriptor import Caption_Transcriptor
+        return Caption_Transcriptor(build_backend("transcriptor", transcription_backend), videodownloader=self.videodownloader)
+
+    def warmup(self):
+        '''Prepares the backends before the first request (e.g. loads the local transcription model), to avoid a latency spike on the first request.'''
+        self.videotranscriptor.warmup()
 
     def get_languages(self):
         return list(LANGUAGES_DICT.keys())
 
     def summarize_video(self, input_url, destination_language, groq_key_input = None, openai_key = None):
-        if len(destination_language) > 2:
-            destination_language = LANGUAGES_DICT[destination_language]
+        destination_language = normalize_language(destination_language)
         print('selected language:', destination_language)
         print('url:', input_url)
+        video_id = get_video_id(input_url)
+
+        with start_trace(url=input_url, video_id=video_id, languages=[destination_language]):
+            # Translation step (it runs the download and transcript steps only if the transcription is not cached):
+            translated_text = self.summary_step(input_url, video_id, destination_language, groq_key_input)
+
+            # TTS step:
+            translated_audio_path = self.tts_step(translated_text, input_url, video_id, destination_language, openai_key)
 
-        # Download step:
-        download_result = self.videodownloader.download_audio(input_url)
-        original_audio_path = download_result['video_path']
-
-        # Transcript step:
-        transcripted_text = self.videotranscriptor.transcript_video(original_audio_path, 
-                                                                    groq_key_input)
-        
-        # Translation step:
-        translated_text = self.translator.translate_transcription(transcripted_text,
-                                                                   download_result['video_title'],
-                                                                   destination_language,
-                                                                   groq_key_input
-                                                                    )
-        
-        # TTS step:
-        if len(openai_key) > 2:
-            print('using openai tts since api key is not none')
-            self.TTSGenerator = OpenAI_TTSGenerator()
-            translated_audio_path = self.TTSGenerator.generate_audio(translated_text,
-                                                                    destination_language,
-                                                                    input_url,
-                                                                    openai_key)
-        else:
-            print('using g tts since api key is none')
-            self.TTSGenerator = g_TTSGenerator()
-            translated_audio_path = self.TTSGenerator.generate_audio(translated_text, 
-                                                                destination_language,
-                                                                input_url)
-        
         return {
             "audio_path": translated_audio_path,
             "text": translated_text
         }
-    
-    
-    
-    
\ No newline at end of file
+
+    def summarize_video_stream(self, input_url, destination_language, groq_key_input = None, openai_key = None):
+        """
+        Streaming version of `summarize_video`: the summary is yielded while it is being generated, before the TTS step starts.
+
+        Args:
+            input_url (str): The URL of the video.
+            destination_language (str): The destination language.
+            groq_key_input (str, optional): The GROQ API key.
+            openai_key (str, optional): The OpenAI API key, used for the TTS if provided.
+
+        Yields:
+            dict: {"delta": <new text>, "text": <summary so far>, "audio_path": None} while the summary is generated,
+            then a last {"delta": "", "text": <final summary>, "audio_path": <path>} once the audio is ready.
+        """
+        destination_language = normalize_language(destination_language)
+        print('selected language:', destination_language)
+        print('url:', input_url)
+        video_id = get_video_id(input_url)
+
+        with start_trace(url=input_url, video_id=video_id, languages=[destination_language], streaming=True):
+            streamed_text = ""
+            for event in self.summary_stream_step(input_url, video_id, destination_language, groq_key_input):
+                if event["type"] == "delta":
+                    streamed_text += event["text"]
+                    yield {"delta": event["text"], "text": streamed_text, "audio_path": None}
+                else:
+                    translated_text = event["text"]
+
+            translated_audio_path = self.tts_step(translated_text, input_url, video_id, destination_language, openai_key)
+        yield {"delta": "", "text": translated_text, "audio_path": translated_audio_path}
+
+    def summarize_video_multi(self, input_url, destination_languages, groq_key_input = None, openai_key = None):
+        """
+        Summarizes a video in many languages at once: the video is downloaded, transcribed and split in chunks only once,
+        then the summary and TTS steps of every language run concurrently.
+
+        Args:
+            input_url (str): The URL of the video.
+            destination_languages (list): The destination languages.
+            groq_key_input (str, optional): The GROQ API key.
+            openai_key (str, optional): The OpenAI API key, used for the TTS if provided.
+
+        Returns:
+            dict: The result of each language, keyed by language, with the same format as `summarize_video`.
+
+        Raises:
+            ValueError: If no destination language is given.
+        """
+        destination_languages = list(dict.fromkeys(normalize_language(language) for language in destination_languages))
+        if not destination_languages:
+            raise ValueError("At least one destination language is required")
+        print('selected languages:', destination_languages)
+        print('url:', input_url)
+        video_id = get_video_id(input_url)
+
+        with start_trace(url=input_url, video_id=video_id, languages=destination_languages):
+            return self._summarize_languages(input_url, video_id, destination_languages, groq_key_input, openai_key)
+
+    def _summarize_languages(self, input_url, video_id, destination_languages, groq_key_input, openai_key):
+        transcript_result = self.transcript_step(input_url, video_id, groq_key_input)
+        transcription_chunks = self.translator.split_transcription(transcript_result["text"])
+
+        def summarize_language(destination_language):
+            translated_text = self.summary_step(input_url, video_id, destination_language, groq_key_input, transcription_chunks)
+            translated_audio_path = self.tts_step(translated_text, input_url, video_id, destination_language, openai_key)
+            return {
+                "audio_path": translated_audio_path,
+                "text": translated_text
+            }
+
+        with ThreadPoolExecutor(max_workers=len(destination_languages)) as executor:
+            futures = [submit_with_context(executor, summarize_language, destination_language) for destination_language in destination_languages]
+            results = [future.result() for future in futures]
+
+        return dict(zip(destination_languages, results))
+
+    def download_step(self, input_url, video_id, record_cache = True):
+        cached_download = self.stage_cache.get("download", video_id, record=record_cache)
+        if cached_download is not None:
+            print('download loaded from cache')
+            return cached_download
+
+        with stage_timer("download"):
+            download_result = self.videodownloader.download_audio(input_url)
+        download_result["files"] = [download_result['video_path']]
+        self.stage_cache.put("download", video_id, download_result)
+        return download_result
+
+    def transcript_step(self, input_url, video_id, groq_key_input = None):
+        cached_transcript = self.stage_cache.get("transcript", video_id, self.videotranscriptor.model)
+        if cached_transcript is not None:
+            print('transcription loaded from cache')
+            return cached_transcript
+
+        transcript_result = self.caption_step(input_url, video_id)
+        if transcript_result is None and self.can_stream(video_id):
+            transcript_result = self.streaming_transcript_step(input_url, video_id, groq_key_input)
+        if transcript_result is None:
+            download_result = self.download_step(input_url, video_id)
+            audio_path = download_result['video_path']
+            if self.audio_preprocessor is not None:
+                audio_path = self.audio_preprocessor.preprocess(audio_path)
+            checkpoint = self.checkpoint_store.checkpoint(video_id, "transcript", self.videotranscriptor.model)
+            with stage_timer("transcription"):
+                transcripted_text = self.videotranscriptor.transcript_video(audio_path,
+                                                                            groq_key_input,
+                                                                            checkpoint)
+            transcript_result = {"text": transcripted_text,
+                                 "video_title": download_result['video_title']}
+            checkpoint.clear()
+        self.stage_cache.put("transcript", video_id, transcript_result, self.videotranscriptor.model)
+        return transcript_result
+
+    def caption_step(self, input_url, video_id, record_cache = True):
+        '''Returns the transcription of the video without its audio (see `VideoTranscriptor.transcript_url`), or None. Negative results are cached too.
+        With `record_cache` False the cache lookup is not counted in the metrics, for the callers that only prepare the transcript step.'''
+        cached_captions = self.stage_cache.get("captions", video_id, self.videotranscriptor.model, record=record_cache)
+        if cached_captions is not None:
+            return cached_captions if cached_captions["text"] is not None else None
+
+        with stage_timer("captions"):
+            transcript_result = self.videotranscriptor.transcript_url(input_url)
+        self.stage_cache.put("captions", video_id, transcript_result or {"text": None}, self.videotranscriptor.model)
+        return transcript_result
+
+    def fetch_step(self, input_url, video_id):
+        """
+        Fetches what the transcript step needs from YouTube: the captions when usable, the audio otherwise. Nothing if the transcription is cached,
+        and nothing either if the audio can be streamed, since the transcript step then downloads it while transcribing.
+        Its cache lookups are not counted in the metrics: the transcript step, which uses what is fetched here, counts them once.
+        """
+        if self.stage_cache.contains("transcript", video_id, self.videotranscriptor.model):
+            return
+        if self.caption_step(input_url, video_id, record_cache=False) is None and not self.can_stream(video_id):
+            self.download_step(input_url, video_id, record_cache=False)
+
+    def transcript_downloads(self, input_url, video_id):
+        '''True if the transcript step downloads the audio while transcribing it: the transcription is not cached, the video has no usable captions and the audio can be streamed.'''
+        return (not self.stage_cache.contains("transcript", video_id, self.videotranscriptor.model)
+                and self.caption_step(input_url, video_id, record_cache=False) is None and self.can_stream(video_id))
+
+    def can_stream(self, video_id):
+        '''True if the audio of the video is not downloaded yet and can be transcribed while it is downloaded.'''
+        return (self.stream_transcription and self.videodownloader.supports_streaming and ffmpeg_available()
+                and not self.stage_cache.contains("download", video_id))
+
+    def streaming_transcript_step(self, input_url, video_id, groq_key_input = None):
+        '''Downloads and transcribes the audio at the same time (see `streaming.stream_transcript`). Returns None if the downloaded file must be transcribed as usual.'''
+        checkpoint = self.checkpoint_store.checkpoint(video_id, "transcript", self.videotranscriptor.model)
+        with stage_timer("streaming_transcription"):
+            transcript_result, download_result = stream_transcript(self.videodownloader, self.videotranscriptor, input_url, groq_key_input,
+                                                                   audio_preprocessor=self.audio_preprocessor, checkpoint=checkpoint)
+        if transcript_result is not None:
+            checkpoint.clear()
+        download_result["files"] = [download_result['video_path']]
+        self.stage_cache.put("download", video_id, download_result)
+        return transcript_result
+
+    def summary_step(self, input_url, video_id, destination_language, groq_key_input = None, transcription_chunks = None):
+        cache_fields = (self.translator.model, destination_language, self.translator.summary_version())
+        cached_summary = self.stage_cache.get("summary", video_id, *cache_fields)
+        if cached_summary is not None:
+            print('summary loaded from cache')
+            return cached_summary["text"]
+
+        transcript_result = self.transcript_step(input_url, video_id, groq_key_input)
+        checkpoint = self.summary_checkpoint(video_id, cache_fields)
+        with stage_timer("summary", language=destination_language):
+            translated_text = self.translator.translate_transcription(transcript_result["text"],
+                                                                       transcript_result['video_title'],
+                                                                       destination_language,
+                                                                       groq_key_input,
+                                                                       transcription_chunks,
+                                                                       checkpoint = checkpoint
+                                                                        )
+        self.stage_cache.put("summary", video_id, {"text": translated_text}, *cache_fields)
+        checkpoint.clear()
+        return translated_text
+
+    def summary_stream_step(self, input_url, video_id, destination_language, groq_key_input = None, transcription_chunks = None):
+        """
+        Streaming version of `summary_step`, yielding the events of `Groq_Translator.translate_transcription_stream`.
+        A cached summary is yielded as a single delta.
+        """
+        cache_fields = (self.translator.model, destination_language, self.translator.summary_version())
+        cached_summary = self.stage_cache.get("summary", video_id, *cache_fields)
+        if cached_summary is not None:
+            print('summary loaded from cache')
+            yield {"type": "delta", "text": cached_summary["text"]}
+            yield {"type": "final", "text": cached_summary["text"]}
+            return
+
+        transcript_result = self.transcript_step(input_url, video_id, groq_key_input)
+        checkpoint = self.summary_checkpoint(video_id, cache_fields)
+        with stage_timer("summary", language=destination_language, streaming=True):
+            for event in self.translator.translate_transcription_stream(transcript_result["text"],
+                                                                        transcript_result['video_title'],
+                                                                        destination_language,
+                                                                        groq_key_input,
+                                                                        transcription_chunks,
+                                                                        checkpoint = checkpoint):
+                if event["type"] == "final":
+                    self.stage_cache.put("summary", video_id, {"text": event["text"]}, *cache_fields)
+                    checkpoint.clear()
+                yield event
+
+    def summary_checkpoint(self, video_id, cache_fields):
+        '''Returns the checkpoint of the part summaries of a video (see `CheckpointStore`), so that an interrupted summary resumes from the completed parts.'''
+        model, destination_language, summary_version = cache_fields
+        return self.checkpoint_store.checkpoint(video_id, "summary", model, f"{destination_language}|{summary_version}")
+
+    def tts_step(self, translated_text, input_url, video_id, destination_language, openai_key = None):
+        use_openai = openai_key is not None and len(openai_key) > 2
+        generator_name = 'openai' if use_openai else 'gtts'
+        tts_generator = self.tts_generators[generator_name]
+        # the audio is keyed by the text it reads, so a summary regenerated with another model or prompt is never given the old audio
+        text_hash = hashlib.sha256(translated_text.encode("utf-8")).hexdigest()[:16]
+        cache_fields = (f"{generator_name}_{tts_generator.settings_name()}", destination_language, text_hash)
+        cached_audio = self.stage_cache.get("audio", video_id, *cache_fields)
+        if cached_audio is not None:
+            print('audio loaded from cache')
+            return cached_audio["audio_path"]
+
+        with stage_timer("tts", generator=generator_name, language=destination_language):
+            if use_openai:
+                print('using openai tts since api key is not none')
+                translated_audio_path = tts_generator.generate_audio(translated_text,
+                                                                        destination_language,
+                                                                        input_url,
+                                                                        openai_key)
+            else:
+                print('using g tts since api key is none')
+                translated_audio_path = tts_generator.generate_audio(translated_text,
+                                                                    destination_language,
+                                                                    input_url)
+
+        self.stage_cache.put("audio", video_id, {"audio_path": translated_audio_path, "files": [translated_audio_path]}, *cache_fields)
+        return translated_audio_path
@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+
+
+class VideoMetadataStore():
+    '''
+    Local store of the metadata of the downloaded videos (title, duration, chosen audio stream itag and file size), stored in a SQLite database.
+    It allows to answer cached requests without building a `YouTube` object, hence without any network call.
+    '''
+
+    FIELDS = ("video_id", "title", "duration", "itag", "filesize", "updated_at")
+
+    def __init__(self, db_path: str = os.path.join("download_audio", "metadata.sqlite")):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS video_metadata (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    duration INTEGER,
+                    itag INTEGER,
+                    filesize INTEGER,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, video_id: str) -> dict:
+        """
+        Reads the metadata of a video.
+
+        Args:
+            video_id (str): The id of the YouTube video.
+
+        Returns:
+            dict: The metadata of the video with keys `VideoMetadataStore.FIELDS`, or None if the video is unknown.
+        """
+        with self._connect() as connection:
+            row = connection.execute(f"SELECT {', '.join(self.FIELDS)} FROM video_metadata WHERE video_id = ?", (video_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(self.FIELDS, row))
+
+    def put(self, video_id: str, title: str, duration: int = None, itag: int = None, filesize: int = None):
+        """
+        Stores (or replaces) the metadata of a video.
+
+        Args:
+            video_id (str): The id of the YouTube video.
+            title (str): The title of the video.
+            duration (int, optional): The length of the video in seconds.
+            itag (int, optional): The itag of the audio stream chosen for the download.
+            filesize (int, optional): The size in bytes of the chosen audio stream.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO video_metadata (video_id, title, duration, itag, filesize, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, title, duration, itag, filesize, time.time()),
+            )
@@ -0,0 +1,246 @@
+'''
+Instrumentation of the pipeline: process-wide metrics (counters and latency histograms, exported as Prometheus text or JSON)
+and per-request traces (the timing of every stage and the costs of a single summarization, appended to a JSONL file).
+
+The trace of the request being processed is kept in a context variable, so the steps record into it without passing it around.
+Thread pools must submit work with `submit_with_context` to keep recording into the trace of the request that started them.
+'''
+from contextlib import contextmanager
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+STAGE_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TRACES_PATH = os.environ.get("TRACES_PATH", os.path.join("metrics", "traces.jsonl"))
+# the traces file is rotated when it reaches TRACES_MAX_BYTES, keeping TRACES_BACKUPS older files (traces.jsonl.1 is the most recent)
+TRACES_MAX_BYTES = int(os.environ.get("TRACES_MAX_BYTES", 64 * 1024**2))
+TRACES_BACKUPS = int(os.environ.get("TRACES_BACKUPS", 3))
+_traces_lock = threading.Lock()
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class MetricsRegistry():
+    '''Thread-safe store of counters and histograms, identified by name and labels.'''
+
+    def __init__(self, buckets: tuple = STAGE_SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        '''Adds `value` to a counter.'''
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        '''Records an observation (e.g. a duration in seconds) in a histogram.'''
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(key, {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)})
+            histogram["count"] += 1
+            histogram["sum"] += value
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][idx] += 1
+
+    def reset(self):
+        '''Drops all the counters and histograms (e.g. between the runs of a benchmark).'''
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_dict(self) -> dict:
+        """
+        Returns a JSON-serializable snapshot of the metrics.
+
+        Returns:
+            dict: {"counters": [...], "histograms": [...]}, each item with its name, labels and values.
+        """
+        with self.lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()],
+                "histograms": [{"name": name, "labels": dict(labels), "count": histogram["count"], "sum": histogram["sum"],
+                                "buckets": dict(zip(map(str, self.buckets), histogram["buckets"]))}
+                               for (name, labels), histogram in self.histograms.items()],
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        def format_labels(labels, extra = ()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{str(value)}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (counter_name, labels), value in self.counters.items():
+                    if counter_name == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in self.histograms.items():
+                    if histogram_name != name:
+                        continue
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+class Trace():
+    '''Record of a single request: the spans of its stages and its counters (bytes uploaded, tokens, cache hits/misses, retries).'''
+
+    def __init__(self, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.seconds = None
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, stage, seconds, **attributes):
+        with self.lock:
+            self.spans.append(dict(stage=stage, seconds=round(seconds, 4), **attributes))
+
+    def add_count(self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self.lock:
+            return {"trace_id": self.trace_id, "started_at": self.started_at, "seconds": self.seconds,
+                    **self.attributes, "spans": list(self.spans), "counters": dict(self.counters)}
+
+
+@contextmanager
+def start_trace(**attributes):
+    """
+    Context manager that collects the trace of a request. When the block exits, the trace is appended to `TRACES_PATH` (set the
+    environment variable TRACES_PATH to an empty string to disable it), rotated beyond `TRACES_MAX_BYTES`. A trace already active is reused, so nested calls produce a single record.
+
+    Args:
+        **attributes: Attributes of the request stored in the record, e.g. url and language.
+
+    Yields:
+        Trace: The trace of the request.
+    """
+    active_trace = _current_trace.get()
+    if active_trace is not None:
+        yield active_trace
+        return
+
+    trace = Trace(**attributes)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.seconds = round(time.perf_counter() - start, 4)
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # a generator resumed from another thread runs in another context
+            _current_trace.set(None)
+        METRICS.observe("polysummary_request_seconds", trace.seconds)
+        write_trace(trace)
+
+
+def write_trace(trace: Trace):
+    if not TRACES_PATH:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False) + "\n"
+    with _traces_lock:
+        os.makedirs(os.path.dirname(TRACES_PATH) or ".", exist_ok=True)
+        try:
+            if os.path.getsize(TRACES_PATH) + len(line) > TRACES_MAX_BYTES:
+                rotate_traces()
+        except FileNotFoundError:
+            pass
+        with open(TRACES_PATH, "a", encoding="utf-8") as traces_file:
+            traces_file.write(line)
+
+
+def rotate_traces():
+    '''Shifts the traces files (traces.jsonl -> traces.jsonl.1 -> traces.jsonl.2 ...), deleting the oldest beyond `TRACES_BACKUPS`.'''
+    if TRACES_BACKUPS <= 0:
+        os.remove(TRACES_PATH)
+        return
+    for idx in range(TRACES_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{TRACES_PATH}.{idx}"):
+            os.replace(f"{TRACES_PATH}.{idx}", f"{TRACES_PATH}.{idx + 1}")
+    os.replace(TRACES_PATH, f"{TRACES_PATH}.1")
+
+
+@contextmanager
+def stage_timer(stage: str, **attributes):
+    """
+    Context manager that measures the wall time of a stage, recording it in the `polysummary_stage_seconds` histogram and as a span of the current trace.
+
+    Args:
+        stage (str): The name of the stage, e.g. "download" or "chunk_summary".
+        **attributes: Extra attributes stored in the span (not used as metric labels).
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        METRICS.observe("polysummary_stage_seconds", seconds, stage=stage, status=status)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(stage, seconds, status=status, **attributes)
+
+
+def record(name: str, value: float = 1, **labels):
+    """
+    Increments a counter, both in the process-wide metrics and in the current trace.
+
+    Args:
+        name (str): The name of the counter, e.g. "polysummary_upload_bytes_total".
+        value (float, optional): The increment.
+        **labels: The labels of the counter.
+    """
+    METRICS.inc(name, value, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace_name = name + "".join(f".{value}" for _, value in sorted(labels.items()))
+        trace.add_count(trace_name, value)
+
+
+def record_cache(stage: str, hit: bool):
+    '''Counts a lookup of a cache for the given stage.'''
+    record("polysummary_cache_lookups_total", stage=stage, result="hit" if hit else "miss")
+
+
+def submit_with_context(executor, function, *args, **kwargs):
+    '''Submits `function` to `executor` running it in a copy of the current context, so that it records into the current trace.'''
+    context = contextvars.copy_context()
+    return executor.submit(context.run, function, *args, **kwargs)
@@ -0,0 +1,59 @@
+'''
+Prompt templates of the summaries.
+
+Every request starts with the same system prompt: `SYSTEM_PREFIX`, shared by all the tasks, followed by the fixed instructions of the task.
+Everything that changes from request to request (destination language, title, part number, text, target length) is in the user message.
+The system prompt of a task is then byte-identical for all the chunks, videos and languages. Note that at about 100 tokens it is far
+below the minimum prefix cached by the providers (about 1024 tokens), so it brings no prompt caching benefit by itself.
+'''
+
+SYSTEM_PREFIX = ('You are an AI assistant that summarizes the content of Youtube videos, so that no information is lost and the relevant content '
+                 'can be understood without watching the original video. You always write in the language requested by the user and you return '
+                 'the summary only, do not write any other thing.')
+
+TASK_INSTRUCTIONS = {
+    "single": 'You will receive the title and the transcription of a Youtube video. Summarize this content.',
+    "chunk": ('You will receive the title of a Youtube video and one part of its transcription, which was split in parts since it is very long. '
+              'Summarize this part only: the summaries of the parts will be read one after the other, in order.'),
+    "merge": ('You will receive the title of a Youtube video and the partial summaries of its content, in order. Merge them into a single '
+              'coherent summary, removing repetitions without losing relevant information.'),
+}
+
+USER_TEMPLATES = {
+    "single": ('Language of the summary: {language}.{length}\n'
+               'Original youtube title: {title}\n'
+               'Transcription of original video: "{text}"\n'
+               'Summarize it in {language}:'),
+    "chunk": ('Language of the summary: {language}.\n'
+              'Original video title: {title}\n'
+              'Part {part} of {n_parts} of the transcription of original video: "{text}"\n'
+              'Summarize it in {language}:'),
+    "merge": ('Language of the summary: {language}.{length}\n'
+              'Original video title: {title}\n'
+              'Partial summaries:\n{text}\n'
+              'Merge them in {language}:'),
+}
+
+
+def system_prompt(task: str) -> str:
+    '''Returns the system prompt of a task ("single", "chunk" or "merge"): the shared prefix followed by the fixed instructions of the task.'''
+    return f"{SYSTEM_PREFIX}\n{TASK_INSTRUCTIONS[task]}"
+
+
+def build_prompts(task: str, destination_language: str, original_title: str, text: str, length: str = "", **fields) -> tuple:
+    """
+    Builds the prompts of a request.
+
+    Args:
+        task (str): The task, a key of `TASK_INSTRUCTIONS` ("single", "chunk" or "merge").
+        destination_language (str): The language of the summary.
+        original_title (str): The title of the original video.
+        text (str): The text to summarize (a transcription, a part of it, or the joined partial summaries).
+        length (str, optional): The instruction on the length of the summary, if any.
+        **fields: The other fields of the template of the task (e.g. part and n_parts for "chunk").
+
+    Returns:
+        tuple: The (system_prompt, user_prompt) of the request.
+    """
+    user_prompt = USER_TEMPLATES[task].format(language=destination_language, title=original_title, text=text, length=length, **fields)
+    return system_prompt(task), user_prompt
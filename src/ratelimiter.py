@@ -0,0 +1,228 @@
+'''
+Client-side rate limiting and retries of the requests to the APIs (GROQ transcriptions and chat completions, OpenAI TTS).
+
+Every API key (and model, since the providers set their limits per model) has a `RateLimiter` shared by all the threads of the process:
+a request waits until both its requests-per-minute and tokens-per-minute buckets allow it, so bursts of concurrent chunks are smoothed
+instead of being rejected. The buckets follow the rate-limit headers of the responses (remaining tokens, reset times, retry-after),
+so the limiter converges to the real limits of the account. Failed requests (429, 5xx, timeouts, connection errors) are retried
+with jittered exponential backoff.
+'''
+import os
+import random
+import re
+import threading
+import time
+from metrics import record
+
+RATE_LIMITS = {
+    "groq": {
+        "requests_per_minute": float(os.environ.get("GROQ_REQUESTS_PER_MINUTE", 30)),
+        "tokens_per_minute": float(os.environ.get("GROQ_TOKENS_PER_MINUTE", 6000)),
+    },
+    "openai": {
+        "requests_per_minute": float(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 50)),
+        "tokens_per_minute": None,
+    },
+}
+MAX_RETRIES = int(os.environ.get("RATE_LIMITER_MAX_RETRIES", 6))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+RETRYABLE_ERROR_NAMES = ("APIConnectionError", "APITimeoutError", "TransportError")
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parses the durations of the rate-limit headers, e.g. "7.66s", "2m59.56s", "120ms" or a plain number of seconds.
+
+    Args:
+        value (str): The header value.
+
+    Returns:
+        float: The duration in seconds, or None if it cannot be parsed.
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def is_retryable(error: Exception) -> bool:
+    '''True if the request that raised `error` can be retried: rate limited, server errors, timeouts and connection errors.'''
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class TokenBucket():
+    '''
+    Bucket refilled continuously at `per_minute / 60` units per second, holding at most `per_minute` units. A `per_minute` of None means no limit.
+    Not thread-safe: it is used under the lock of its `RateLimiter`.
+    '''
+
+    def __init__(self, per_minute: float = None):
+        self.per_minute = per_minute
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        if self.per_minute is not None:
+            self.level = min(self.per_minute, self.level + (now - self.updated_at) * self.per_minute / 60)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        '''Seconds to wait before `amount` units are available (requests larger than the bucket wait for a full bucket).'''
+        if self.per_minute is None or amount <= 0:
+            return 0.0
+        missing = min(amount, self.per_minute) - self.level
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def consume(self, amount: float):
+        if self.per_minute is not None:
+            self.level -= min(amount, self.per_minute)
+
+    def set_limit(self, per_minute: float):
+        if self.per_minute is None:
+            self.level = per_minute
+        self.per_minute = per_minute
+        self.level = min(self.level, per_minute)
+
+
+class RateLimiter():
+    '''
+    Requests-per-minute and tokens-per-minute limits of an API key, shared by all the threads that use the key.
+
+    Attributes:
+        service (str): The name of the service, used in the metrics and messages.
+        max_retries (int): The max number of retries of a failed request.
+    '''
+
+    def __init__(self, service: str, requests_per_minute: float = None, tokens_per_minute: float = None, max_retries: int = MAX_RETRIES):
+        self.service = service
+        self.max_retries = max_retries
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 0):
+        """
+        Waits until a request of `tokens` estimated tokens fits in the limits, then takes it from the buckets.
+
+        Args:
+            tokens (float, optional): The estimated tokens of the request (prompt and completion).
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(self.blocked_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    break
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            record("polysummary_ratelimit_wait_seconds_total", waited, service=self.service)
+
+    def update_from_headers(self, headers):
+        """
+        Adjusts the buckets to the rate-limit headers of a response: the token limit and remaining tokens, and a pause when
+        the remaining requests are exhausted or the response asks to retry after some time.
+
+        Args:
+            headers (Mapping): The headers of the response.
+        """
+        if not headers:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens.refill(now)
+            limit_tokens = headers.get("x-ratelimit-limit-tokens")
+            if limit_tokens is not None:
+                self.tokens.set_limit(float(limit_tokens))
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            if remaining_tokens is not None and self.tokens.per_minute is not None:
+                self.tokens.level = min(self.tokens.level, float(remaining_tokens))
+
+            pause = None
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            if remaining_requests is not None and float(remaining_requests) <= 0:
+                pause = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            retry_after = parse_duration(headers.get("retry-after"))
+            if retry_after is not None:
+                pause = max(pause or 0.0, retry_after)
+            if pause:
+                self.blocked_until = max(self.blocked_until, now + pause)
+
+    def call(self, function, tokens: float = 0):
+        """
+        Runs an API request within the limits, retrying it with jittered exponential backoff when it fails with a retryable error.
+        If `function` returns a raw response (the `with_raw_response` variant of the SDK methods), its headers update the limits
+        and the parsed response is returned.
+
+        Args:
+            function (callable): A function without arguments sending the request.
+            tokens (float, optional): The estimated tokens of the request.
+
+        Returns:
+            The (parsed) response of the request.
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                response = function()
+            except Exception as error:
+                error_response = getattr(error, "response", None)
+                self.update_from_headers(getattr(error_response, "headers", None))
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                attempt += 1
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                record("polysummary_retries_total", service=self.service, status=str(getattr(error, "status_code", type(error).__name__)))
+                print(f'{self.service} request failed ({error}), retry {attempt}/{self.max_retries} in {delay:.1f}s')
+                time.sleep(delay)
+                continue
+
+            if hasattr(response, "headers") and hasattr(response, "parse"):
+                self.update_from_headers(response.headers)
+                return response.parse()
+            return response
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(service: str, api_key: str, model: str = None) -> RateLimiter:
+    """
+    Returns the `RateLimiter` of an API key and model, building it at the first call with the limits of `RATE_LIMITS[service]`.
+
+    Args:
+        service (str): The service, a key of `RATE_LIMITS` ("groq" or "openai").
+        api_key (str): The API key.
+        model (str, optional): The model, since the limits of the providers are per model.
+
+    Returns:
+        RateLimiter: The limiter shared by all the users of the key and model.
+    """
+    registry_key = (service, api_key, model)
+    with _rate_limiters_lock:
+        if registry_key not in _rate_limiters:
+            _rate_limiters[registry_key] = RateLimiter(service, **RATE_LIMITS[service])
+        return _rate_limiters[registry_key]
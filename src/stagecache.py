@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from metrics import record_cache
+
+
+class StageCache():
+    '''
+    Persistent cache of the results of each step of the pipeline (download, transcript, summary, audio), stored in a SQLite database.
+    Each entry is content-addressed by the hash of its stage, video id, model, language and prompt version, so that changing any of them
+    produces a new entry instead of reusing a stale one. Entries older than `max_age_seconds` are dropped, and the least recently used
+    entries are evicted when the stored payloads exceed `max_bytes`.
+    '''
+
+    def __init__(self, db_path: str = os.path.join("cache", "stage_cache.sqlite"), max_bytes: int = 256 * 1024 * 1024,
+                 max_age_seconds: float = 30 * 24 * 3600):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS stage_cache (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS stage_cache_last_access ON stage_cache (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def make_key(stage: str, video_id: str, model: str = None, language: str = None, prompt_version: str = None) -> str:
+        """
+        Computes the content address of a cache entry.
+
+        Args:
+            stage (str): The step of the pipeline, e.g. "transcript".
+            video_id (str): The id of the YouTube video.
+            model (str, optional): The model (or backend) that produced the result.
+            language (str, optional): The destination language of the result.
+            prompt_version (str, optional): The version of the prompts used to produce the result.
+
+        Returns:
+            str: The hex digest identifying the entry.
+        """
+        key_fields = json.dumps([stage, video_id, model, language, prompt_version])
+        return hashlib.sha256(key_fields.encode("utf-8")).hexdigest()
+
+    def get(self, stage: str, video_id: str, model: str = None, language: str = None, prompt_version: str = None, record: bool = True) -> dict:
+        """
+        Reads an entry from the cache. Entries that are expired, or that reference files no longer on disk, are removed and reported as missing.
+
+        Args:
+            stage (str): The step of the pipeline.
+            video_id (str): The id of the YouTube video.
+            model (str, optional): The model (or backend) that produced the result.
+            language (str, optional): The destination language of the result.
+            prompt_version (str, optional): The version of the prompts used to produce the result.
+            record (bool, optional): If False, the lookup is not counted in the cache metrics, e.g. when the step only plans
+                or prefetches the work of a later step, which counts its own lookup.
+
+        Returns:
+            dict: The cached value, or None if the entry is not available.
+        """
+        key = self.make_key(stage, video_id, model, language, prompt_version)
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute("SELECT value, created_at FROM stage_cache WHERE key = ?", (key,)).fetchone()
+            value = None
+            if row is not None:
+                value = json.loads(row[0])
+                expired = now - row[1] > self.max_age_seconds
+                missing_files = any(not os.path.isfile(path) for path in value.get("files", []))
+                if expired or missing_files:
+                    connection.execute("DELETE FROM stage_cache WHERE key = ?", (key,))
+                    value = None
+                else:
+                    connection.execute("UPDATE stage_cache SET last_access = ? WHERE key = ?", (now, key))
+        if record:
+            record_cache(stage, value is not None)
+        return value
+
+    def contains(self, stage: str, video_id: str, model: str = None, language: str = None, prompt_version: str = None) -> bool:
+        '''True if the entry is available (see `get`). The check is not counted in the cache metrics.'''
+        return self.get(stage, video_id, model, language, prompt_version, record=False) is not None
+
+    def put(self, stage: str, video_id: str, value: dict, model: str = None, language: str = None, prompt_version: str = None):
+        """
+        Stores an entry in the cache, then evicts old entries if needed.
+
+        Args:
+            stage (str): The step of the pipeline.
+            video_id (str): The id of the YouTube video.
+            value (dict): The JSON-serializable result. Paths listed under the "files" key are checked for existence on every read.
+            model (str, optional): The model (or backend) that produced the result.
+            language (str, optional): The destination language of the result.
+            prompt_version (str, optional): The version of the prompts used to produce the result.
+        """
+        key = self.make_key(stage, video_id, model, language, prompt_version)
+        payload = json.dumps(value)
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO stage_cache (key, stage, video_id, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, stage, video_id, payload, len(payload.encode("utf-8")), now, now),
+            )
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the expired entries, then the least recently used ones until the total size of the payloads fits in `self.max_bytes`.
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM stage_cache WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM stage_cache").fetchone()[0]
+            if total_size <= self.max_bytes:
+                return
+
+            evicted_keys = []
+            for key, size in connection.execute("SELECT key, size FROM stage_cache ORDER BY last_access ASC").fetchall():
+                if total_size <= self.max_bytes:
+                    break
+                evicted_keys.append((key,))
+                total_size -= size
+            connection.executemany("DELETE FROM stage_cache WHERE key = ?", evicted_keys)
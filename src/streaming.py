@@ -0,0 +1,165 @@
+'''
+Streaming transcription: the audio is transcribed while it is being downloaded, instead of after the download.
+
+The chunks of the audio stream are written to the download cache file and, at the same time, piped into an ffmpeg segment muxer
+that cuts them into fixed-length segments (16 kHz mono FLAC, lossless and kept on the local disk only). As soon as ffmpeg closes a segment,
+it is preprocessed like a downloaded file (compressed to Opus, sections without speech cut, see `AudioPreprocessor`) and sent to the
+transcriptor, so the time to transcript approaches max(download, transcription) instead of their sum. Only one download chunk and the segments
+being uploaded are held in memory; the segments waiting for a worker stay on disk.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
+import tempfile
+from checkpoints import ChunkCheckpoint
+from metrics import submit_with_context
+
+# well under the segment length of the Groq transcriptor (600 seconds), so that a streamed segment is always uploaded in one request and never split again
+STREAM_SEGMENT_SECONDS = 300
+
+
+class SegmentStreamer():
+    '''
+    Cuts an audio stream into segments while it is received, with an ffmpeg segment muxer reading from a pipe.
+    The segments completed so far are read from the segment list written by ffmpeg.
+    '''
+
+    def __init__(self, segments_folder: str, segment_seconds: float = STREAM_SEGMENT_SECONDS):
+        self.segments_folder = segments_folder
+        self.list_path = os.path.join(segments_folder, "segments.csv")
+        self.reported_segments = 0
+        self.fed_bytes = 0
+        self.failed = False
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-vn", "-ac", "1", "-ar", "16000", "-c:a", "flac",
+             "-f", "segment", "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+             "-segment_list", self.list_path, "-segment_list_type", "csv",
+             os.path.join(segments_folder, "segment_%05d.flac")],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    def feed(self, chunk: bytes):
+        '''Pipes a chunk of the audio stream to ffmpeg. If ffmpeg stopped (e.g. unsupported format), the streamer is marked as failed.'''
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(chunk)
+            self.fed_bytes += len(chunk)
+        except (BrokenPipeError, OSError):
+            self.failed = True
+
+    def completed_segments(self) -> list:
+        """
+        Returns the segments completed since the previous call, in order.
+
+        Returns:
+            list: The paths of the new segments.
+        """
+        try:
+            with open(self.list_path, "r", encoding="utf-8") as list_file:
+                names = [line.split(",")[0] for line in list_file.read().splitlines() if line.strip()]
+        except FileNotFoundError:
+            return []
+        new_names = names[self.reported_segments:]
+        self.reported_segments = len(names)
+        return [os.path.join(self.segments_folder, name) for name in new_names]
+
+    def close(self) -> list:
+        """
+        Ends the stream and waits for ffmpeg to write the last segment.
+
+        Returns:
+            list: The paths of the segments completed since the previous call to `completed_segments`.
+        """
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        if self.process.wait() != 0:
+            self.failed = True
+        return self.completed_segments()
+
+    def abort(self):
+        '''Stops ffmpeg without waiting for the pending segments.'''
+        self.process.kill()
+        self.process.wait()
+
+
+def stream_transcript(videodownloader, videotranscriptor, input_url: str, groq_api_key: str = None,
+                      segment_seconds: float = STREAM_SEGMENT_SECONDS, max_workers: int = 4, audio_preprocessor = None,
+                      checkpoint: ChunkCheckpoint = None) -> tuple:
+    """
+    Downloads the audio of a video and transcribes it at the same time, segment by segment.
+
+    Args:
+        videodownloader (PytubeFix_VideoDownloader): A downloader supporting `download_audio(url, on_chunk=...)`.
+        videotranscriptor (VideoTranscriptor): The transcriptor of the segments.
+        input_url (str): The URL of the video.
+        groq_api_key (str, optional): The API key passed to the transcriptor.
+        segment_seconds (float, optional): The length of the segments, in seconds.
+        max_workers (int, optional): The max number of segments transcribed at the same time.
+        audio_preprocessor (AudioPreprocessor, optional): If given, every segment is preprocessed by it before the upload.
+        checkpoint (ChunkCheckpoint, optional): If given, the transcription of every segment is saved in it, keyed by the index of the segment,
+            as soon as it is completed; the segments found in it are not transcribed again when the video is streamed after a failure.
+
+    Returns:
+        tuple: (transcript_result, download_result). The transcript result is {"text": <transcription>, "video_title": <title>},
+        or None if the audio was already downloaded or could not be segmented while streaming: the downloaded file is then
+        to be transcribed as usual. The download result is the one of `download_audio`.
+    """
+    with tempfile.TemporaryDirectory() as segments_folder, ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        streamer = SegmentStreamer(segments_folder, segment_seconds)
+        futures = []
+        # the segments are cut at fixed times of the same stream, so their indices are stable across attempts
+        completed_segments = checkpoint.load() if checkpoint is not None else {}
+
+        def transcript_segment(segment_idx, segment_path):
+            segment_key = f"stream/{segment_seconds}/{segment_idx}"
+            upload_path = segment_path
+            try:
+                if segment_key in completed_segments:
+                    return completed_segments[segment_key]
+                if audio_preprocessor is not None:
+                    upload_path = audio_preprocessor.preprocess_segment(segment_path)
+                text = videotranscriptor.transcript_video(upload_path, groq_api_key)
+                if checkpoint is not None:
+                    checkpoint.save(segment_key, segment_idx, text)
+                return text
+            finally:
+                for path in {segment_path, upload_path}:
+                    os.remove(path)
+
+        def submit_segments(segment_paths):
+            for segment_path in segment_paths:
+                futures.append(submit_with_context(executor, transcript_segment, len(futures), segment_path))
+
+        def on_chunk(chunk):
+            streamer.feed(chunk)
+            if not streamer.failed:
+                submit_segments(streamer.completed_segments())
+
+        try:
+            download_result = videodownloader.download_audio(input_url, on_chunk=on_chunk)
+        except BaseException:
+            streamer.abort()
+            raise
+
+        if streamer.fed_bytes == 0:
+            # the audio was already cached: nothing was streamed
+            streamer.abort()
+            return None, download_result
+
+        submit_segments(streamer.close())
+        if streamer.failed or not futures:
+            print('unable to segment the audio while streaming, transcribing the downloaded file')
+            for future in futures:
+                future.cancel()
+            return None, download_result
+
+        print(f'transcribing {len(futures)} audio segments streamed during the download'
+              + (f' ({len(completed_segments)} already transcribed)' if completed_segments else ''))
+        segment_texts = [future.result().strip() for future in futures]
+
+    transcript_result = {"text": " ".join(text for text in segment_texts if text),
+                         "video_title": download_result["video_title"]}
+    return transcript_result, download_result
@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from metrics import record_cache
+
+NORMALIZE_PATTERN = re.compile(r'[^\w]+')
+
+
+class SummaryMemo():
+    '''
+    Local memo of the summaries of transcription texts, stored in a SQLite database. Each summary is keyed by the hash of the normalized
+    text (lowercase, without punctuation and extra whitespace), the destination language, the model and the prompt version - not by the video,
+    so that the same or nearly the same text (a re-uploaded or mirrored video, an intro, a sponsor segment or an outro reused across a channel)
+    is summarized only once. The least recently used summaries are evicted beyond `max_entries`.
+    '''
+
+    def __init__(self, db_path: str = os.path.join("cache", "summary_memo.sqlite"), max_entries: int = 100000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS summary_memo (
+                    key TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS summary_memo_last_access ON summary_memo (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        '''Lowercases the text and drops punctuation and extra whitespace, which change between two transcriptions of the same speech.'''
+        return " ".join(NORMALIZE_PATTERN.sub(" ", text.lower()).split())
+
+    @staticmethod
+    def make_key(text: str, language: str, model: str, prompt_version: str) -> str:
+        """
+        Computes the key of a summary.
+
+        Args:
+            text (str): The summarized text, normalized by `normalize_text` before hashing.
+            language (str): The destination language of the summary.
+            model (str): The model that produced the summary.
+            prompt_version (str): The version of the prompts (and any setting changing the summary, e.g. the target length).
+
+        Returns:
+            str: The hex digest identifying the summary.
+        """
+        payload = "\x1f".join([SummaryMemo.normalize_text(text), language, model, prompt_version])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, language: str, model: str, prompt_version: str) -> str:
+        '''Returns the summary of the text, or None if it was never summarized with the same language, model and prompt version.'''
+        key = self.make_key(text, language, model, prompt_version)
+        with self._connect() as connection:
+            row = connection.execute("SELECT summary FROM summary_memo WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE summary_memo SET last_access = ? WHERE key = ?", (time.time(), key))
+        record_cache("summary_memo", row is not None)
+        return row[0] if row is not None else None
+
+    def put(self, text: str, language: str, model: str, prompt_version: str, summary: str):
+        '''Stores (or replaces) the summary of the text, then evicts the least recently used summaries beyond `max_entries`.'''
+        key = self.make_key(text, language, model, prompt_version)
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO summary_memo (key, summary, last_access) VALUES (?, ?, ?)", (key, summary, time.time()))
+            connection.execute(
+                """DELETE FROM summary_memo WHERE key IN (
+                       SELECT key FROM summary_memo ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,),
+            )
@@ -1,6 +1,26 @@
 from abc import ABC, abstractmethod
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from clients import get_groq_client
+import hashlib
 import os
+from chunker import TranscriptChunker, estimate_tokens
+from metrics import record, stage_timer, submit_with_context
+from ratelimiter import get_rate_limiter
+from checkpoints import ChunkCheckpoint
+from prompts import build_prompts
+from summarymemo import SummaryMemo
+
+
+class ChunkSummaryError(Exception):
+    '''
+    Raised when some parts of a long transcription could not be summarized. It carries the summaries of the parts that succeeded,
+    keyed by `Groq_Translator.chunk_key`, so that they can be passed back as `completed_chunks` to summarize only the missing parts.
+    '''
+
+    def __init__(self, message, completed_chunks: dict, failed_chunks: list):
+        super().__init__(message)
+        self.completed_chunks = completed_chunks
+        self.failed_chunks = failed_chunks
 
 
 class Translator(ABC):
@@ -17,12 +37,35 @@ class Groq_Translator(Translator):
     allowing translation of the given `original_text` from one language to another specified by `destination_language`.
     
     '''
-    def __init__(self, model_name:str = "llama-3.1-70b-versatile"):
+    # Version of the prompts below: bump it whenever they change, so that cached summaries produced with older prompts are not reused.
+    PROMPT_VERSION = "2"
+    # tokens reserved in the tokens-per-minute limit for the completion of each request, on top of the prompt
+    expected_completion_tokens = 500
+    # average speed of the TTS voices, used to convert a target reading time into a target length
+    READING_CHARS_PER_SECOND = 15
+    CHARS_PER_WORD = 6
+
+    def __init__(self, model_name:str = "llama-3.1-70b-versatile", max_workers:int = 4, merge_summaries:bool = False,
+                 chunk_tokens:int = 2000, overlap_tokens:int = 50, target_summary_chars:int = None, target_reading_seconds:float = None,
+                 merge_fan_in:int = 4, summary_memo: SummaryMemo = None, memoize_summaries:bool = True, content_defined_chunks:bool = False):
         self.model = model_name #"llama3-8b-8192",
-        self.char_limits = 1000
+        self.chunk_tokens = chunk_tokens # max estimated tokens of transcription sent in a single request
+        # with content_defined_chunks the passages shared by several transcriptions are cut into the same chunks, so the memo also serves
+        # the repeated passages of different videos; the chunks are then shorter on average, hence more requests for every new video
+        self.chunker = TranscriptChunker(chunk_tokens, overlap_tokens, model_name, content_defined=content_defined_chunks)
+        self.max_workers = max_workers # max number of chunk requests in flight at the same time, 1 means sequential
+        self.merge_summaries = merge_summaries # if True, the partial summaries are merged in a final reduce step
+        if target_summary_chars is None and target_reading_seconds is not None:
+            target_summary_chars = int(target_reading_seconds * self.READING_CHARS_PER_SECOND)
+        self.target_summary_chars = target_summary_chars # if set, the partial summaries are merged level by level (tree reduce) until the summary fits
+        self.merge_fan_in = max(2, merge_fan_in) # number of summaries merged by each request of the tree reduce
+        if summary_memo is None and memoize_summaries:
+            summary_memo = SummaryMemo()
+        self.summary_memo = summary_memo # summaries of the texts already summarized, reused for repeated or near-duplicate chunks
         
 
-    def translate_transcription(self, transcription: str, original_title: str, destination_language: str, groq_api_key:str = None) -> str:
+    def translate_transcription(self, transcription: str, original_title: str, destination_language: str, groq_api_key:str = None, transcription_chunks: list = None,
+                                completed_chunks: dict = None, checkpoint: ChunkCheckpoint = None) -> str:
         '''
         This method is responsible for the translation of the transcription already generated. It is based on the GROQ API, using the LLM chosen as attribute self.model while initializing this subclass.
         
@@ -31,20 +74,23 @@ class Groq_Translator(Translator):
             original_title (str): The title of the original content, used for contextual information.
             destination_language (str): The language to which the transcription should be translated.
             groq_api_key (str, optional): The API key for accessing the GROQ service, if needed.
+            transcription_chunks (list, optional): The transcription already split by `split_transcription`, to avoid splitting it again when the same transcription is translated in many languages.
+            completed_chunks (dict, optional): The summaries of the parts already completed by a previous failed attempt, see `ChunkSummaryError`.
+            checkpoint (ChunkCheckpoint, optional): Persistent store of the part summaries: the parts found in it are not summarized again,
+                and every new part summary is saved in it as soon as it is completed.
         
         Returns:
             str: The translated transcription.
         '''
-        if len(transcription) < self.char_limits:
+        if estimate_tokens(transcription, self.model) <= self.chunk_tokens:
             print('using directly a single translation step')
-            assistant_prompt = f'You are an AI assistant that will receive the title and the transcription of a Youtube video. Your goal is to summarize this content in {destination_language} such that no information are lost without needing of watching the original video to understand the relevant content. You have to return the summary in {destination_language} only, do not write any other thing'
-            translate_prompt = f'Original youtube title: {original_title}. \n Transcription of original video: "{transcription}".\n Summarize it in {destination_language}:'
-
-            final_translation = self.translate_completion(assistant_prompt, translate_prompt, groq_api_key)
+            assistant_prompt, translate_prompt = self.single_step_prompts(transcription, original_title, destination_language)
+            final_translation = self.memoized_completion("single", transcription, destination_language, assistant_prompt, translate_prompt, groq_api_key)
         
         else:
             print('using multiple step translation')
-            final_translation = self.multiple_translation(transcription, original_title, destination_language, groq_api_key)
+            final_translation = self.multiple_translation(transcription, original_title, destination_language, groq_api_key, transcription_chunks, completed_chunks,
+                                                          checkpoint)
         print('text translation completed')
         return final_translation
     
@@ -64,7 +110,7 @@ class Groq_Translator(Translator):
         if groq_api_key is None:
             groq_api_key = os.environ['GROQ_API_KEY']
         
-        self.groq_client = Groq(api_key=groq_api_key)
+        groq_client = get_groq_client(groq_api_key)
         messages_list = [
                 {
                     "role": "system",
@@ -76,78 +122,419 @@ class Groq_Translator(Translator):
                 }
             ]
 
-        chat_completion = self.groq_client.chat.completions.create(
-            messages = messages_list,
-            model= self.model,
-            temperature=0.5,
-            top_p=1,
-            stop=None,
-            stream=False,
-            )
-        
+        rate_limiter = get_rate_limiter("groq", groq_api_key, self.model)
+        with stage_timer("llm_request", model=self.model):
+            chat_completion = rate_limiter.call(
+                lambda: groq_client.chat.completions.with_raw_response.create(
+                    messages = messages_list,
+                    model= self.model,
+                    temperature=0.5,
+                    top_p=1,
+                    stop=None,
+                    stream=False,
+                    ),
+                self.request_tokens(assistant_prompt, translate_prompt))
+        self.record_usage(chat_completion.usage)
+
         return chat_completion.choices[0].message.content
     
     
-    def multiple_translation(self, transcription: str, original_title: str, destination_language: str, groq_api_key:str = None) -> str:
+    def multiple_translation(self, transcription: str, original_title: str, destination_language: str, groq_api_key:str = None, transcription_chunks: list = None,
+                             completed_chunks: dict = None, checkpoint: ChunkCheckpoint = None) -> str:
         """
         Translates and summarizes a long transcription in multiple parts to avoid loss of information, using the GROQ API.
+        The parts are sent concurrently, with at most `self.max_workers` requests in flight, and the results are kept in the original order.
+        A part that fails (after the retries of the rate limiter) does not stop the others: once all are done, a `ChunkSummaryError`
+        with the completed summaries is raised.
 
         Args:
             transcription (str): The full transcription text to be translated and summarized.
             original_title (str): The title of the original video for context in the translated summarization.
             destination_language (str): The target language for the summary translation.
             groq_api_key (str, optional): The API key for accessing the GROQ service. Defaults to the environment variable 'GROQ_API_KEY' if not provided.
+            transcription_chunks (list, optional): The transcription already split by `split_transcription`. If not provided, the transcription is split here.
+            completed_chunks (dict, optional): The summaries of the parts already completed by a previous failed attempt, see `ChunkSummaryError`.
+            checkpoint (ChunkCheckpoint, optional): Persistent store of the part summaries, see `translate_transcription`.
 
         Returns:
             str: The concatenated translated and summarized text in the specified destination language.
         """
 
-        final_text = ""
+        transcription_list = transcription_chunks if transcription_chunks is not None else self.split_transcription(transcription)
+        n_chunks = len(transcription_list)
+        chunk_keys = [self.chunk_key(transcription_chunk, idx, n_chunks) for idx, transcription_chunk in enumerate(transcription_list)]
+        completed_chunks = self.resume_chunks(chunk_keys, completed_chunks, checkpoint)
+        if completed_chunks:
+            print(f'resuming: {len(completed_chunks)} of {n_chunks} parts already summarized')
+        failed_chunks = []
+        last_error = None
 
-        transcription_list = self.split_transcription(transcription)
-        for idx, transcription_chunk in enumerate(transcription_list):
-            assistant_prompt = f'You are an AI assistant that will receive the title of a Youtube Video with its transcription splitted in {len(transcription_list)} parts, since it is very long. Your goal is to translate summarize this content in {destination_language} part by part, in order to avoid losing information without needing of watching the original video to understand the relevant content. You have to return the summary in {destination_language} only, do not write any other thing'
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            futures = {
+                submit_with_context(executor, self.translate_chunk, transcription_chunk, idx, n_chunks, original_title, destination_language, groq_api_key,
+                                    checkpoint, chunk_keys[idx]): idx
+                for idx, transcription_chunk in enumerate(transcription_list) if chunk_keys[idx] not in completed_chunks
+            }
+            for completed, future in enumerate(as_completed(futures), start=n_chunks - len(futures) + 1):
+                idx = futures[future]
+                try:
+                    completed_chunks[chunk_keys[idx]] = future.result()
+                except Exception as e:
+                    failed_chunks.append(idx)
+                    last_error = e
+                print_progress_bar(completed, n_chunks)
+        print()
 
-            translate_prompt =  f'Original video title: {original_title}.\n Part number {idx+1}° of the transcription of original video: "{transcription_chunk}".\n Summarize it in {destination_language}:'
+        if failed_chunks:
+            raise ChunkSummaryError(f"{len(failed_chunks)} of {n_chunks} parts could not be summarized: {last_error}",
+                                    completed_chunks, sorted(failed_chunks)) from last_error
+        results = [completed_chunks[key] for key in chunk_keys]
 
-            result_text = self.translate_completion(assistant_prompt, translate_prompt, groq_api_key)
+        return self.reduce_summaries(results, original_title, destination_language, groq_api_key)
 
-            percentage = ((idx + 1) / len(transcription_list)) * 100
-            bar_length = 30  # Length of the progress bar
-            filled_length = int(bar_length * (idx + 1) / len(transcription_list))
-            bar = '=' * filled_length + '-' * (bar_length - filled_length)
-            # Print percentage and bar, using \r to overwrite each time
-            print(f"{percentage:.2f}% [{bar}]", end="\r")
 
-            final_text = final_text + result_text + " "
-        print()
-        return final_text
-    
+    def translate_chunk(self, transcription_chunk: str, idx: int, n_chunks: int, original_title: str, destination_language: str, groq_api_key:str = None,
+                        checkpoint: ChunkCheckpoint = None, chunk_key: str = None) -> str:
+        """
+        Summarizes a single part of a long transcription.
+
+        Args:
+            transcription_chunk (str): The part of the transcription to be summarized.
+            idx (int): The position of the part in the transcription (0-based).
+            n_chunks (int): The total number of parts of the transcription.
+            original_title (str): The title of the original video.
+            destination_language (str): The target language for the summary.
+            groq_api_key (str, optional): The API key for accessing the GROQ service.
+            checkpoint (ChunkCheckpoint, optional): If given, the summary is saved in it under `chunk_key` as soon as it is completed.
+            chunk_key (str, optional): The key of the part, see `chunk_key`.
+
+        Returns:
+            str: The summary of the given part.
+        """
+        assistant_prompt, translate_prompt = self.chunk_prompts(transcription_chunk, idx, n_chunks, original_title, destination_language)
+        with stage_timer("chunk_summary", chunk=idx):
+            summary = self.memoized_completion("chunk", transcription_chunk, destination_language, assistant_prompt, translate_prompt, groq_api_key)
+        if checkpoint is not None:
+            checkpoint.save(chunk_key, idx, summary)
+        return summary
+
+
+    def memoized_completion(self, task: str, text: str, destination_language: str, assistant_prompt: str, translate_prompt: str,
+                            groq_api_key:str = None) -> str:
+        """
+        Same as `translate_completion`, but the summary of a text already summarized (even in another video) is taken from `self.summary_memo`.
+
+        Args:
+            task (str): The prompt template of the request, "single" or "chunk" (see `prompts.py`).
+            text (str): The summarized text, used as key of the memo.
+            destination_language (str): The target language for the summary.
+            assistant_prompt (str): The system-level instruction or context for LLM.
+            translate_prompt (str): The the text to be translated.
+            groq_api_key (str, optional): The API key for accessing the GROQ service.
+
+        Returns:
+            str: The summary of the text.
+        """
+        if self.summary_memo is None:
+            return self.translate_completion(assistant_prompt, translate_prompt, groq_api_key)
+        memo_fields = (text, destination_language, self.model, self.memo_version(task))
+        summary = self.summary_memo.get(*memo_fields)
+        if summary is None:
+            summary = self.translate_completion(assistant_prompt, translate_prompt, groq_api_key)
+            self.summary_memo.put(*memo_fields, summary)
+        return summary
+
+
+    def memoized_stream_completion(self, task: str, text: str, destination_language: str, assistant_prompt: str, translate_prompt: str,
+                                   groq_api_key:str = None):
+        '''Streaming version of `memoized_completion`: a memoized summary is yielded in a single piece.'''
+        memo_fields = (text, destination_language, self.model, self.memo_version(task))
+        summary = self.summary_memo.get(*memo_fields) if self.summary_memo is not None else None
+        if summary is not None:
+            yield summary
+            return
+        pieces = []
+        for piece in self.stream_completion(assistant_prompt, translate_prompt, groq_api_key):
+            pieces.append(piece)
+            yield piece
+        if self.summary_memo is not None:
+            self.summary_memo.put(*memo_fields, "".join(pieces))
+
+
+    def memo_version(self, task: str) -> str:
+        '''Identifies the prompts producing a memoized summary: the summaries of single transcriptions also depend on the target length.'''
+        if task == "single":
+            return f"{task}-{self.summary_version()}"
+        return f"{task}-{self.PROMPT_VERSION}"
+
+
+    def resume_chunks(self, chunk_keys: list, completed_chunks: dict = None, checkpoint: ChunkCheckpoint = None) -> dict:
+        '''Returns the part summaries already available (from a previous attempt or from the checkpoint) for the parts in `chunk_keys`.'''
+        available_chunks = dict(checkpoint.load()) if checkpoint is not None else {}
+        available_chunks.update(completed_chunks or {})
+        return {key: summary for key, summary in available_chunks.items() if key in chunk_keys}
+
+
+    def chunk_key(self, transcription_chunk: str, idx: int, n_chunks: int) -> str:
+        '''Identifies the summary of a part: its prompt depends on the text of the part, its position and the number of parts.'''
+        chunk_hash = hashlib.sha256(transcription_chunk.encode("utf-8")).hexdigest()
+        return f"{idx}/{n_chunks}/{chunk_hash}"
+
+
+    def request_tokens(self, assistant_prompt: str, translate_prompt: str) -> int:
+        '''Estimates the tokens of a request (prompts and completion) counted in the tokens-per-minute limit.'''
+        return estimate_tokens(assistant_prompt + translate_prompt, self.model) + self.expected_completion_tokens
+
+
+    def single_step_prompts(self, transcription: str, original_title: str, destination_language: str) -> tuple:
+        '''Returns the (assistant_prompt, translate_prompt) used to summarize a short transcription in a single request.'''
+        return build_prompts("single", destination_language, original_title, transcription, self.length_instruction())
+
+
+    def chunk_prompts(self, transcription_chunk: str, idx: int, n_chunks: int, original_title: str, destination_language: str) -> tuple:
+        '''Returns the (assistant_prompt, translate_prompt) used to summarize the part `idx` of a long transcription.'''
+        return build_prompts("chunk", destination_language, original_title, transcription_chunk, part=idx + 1, n_parts=n_chunks)
+
+
+    def merge_partial_summaries(self, summaries: list, original_title: str, destination_language: str, groq_api_key:str = None) -> str:
+        """
+        Reduce step: merges the ordered partial summaries of a long video into a single coherent summary.
+
+        Args:
+            summaries (list): The partial summaries, in the order of the original video.
+            original_title (str): The title of the original video.
+            destination_language (str): The target language for the summary.
+            groq_api_key (str, optional): The API key for accessing the GROQ service.
+
+        Returns:
+            str: The merged summary.
+        """
+        print('merging partial summaries')
+        joined_summaries = "\n".join(f'Part {idx+1}: "{summary}"' for idx, summary in enumerate(summaries))
+        assistant_prompt, translate_prompt = build_prompts("merge", destination_language, original_title, joined_summaries, self.length_instruction())
+
+        return self.translate_completion(assistant_prompt, translate_prompt, groq_api_key)
+
+
+    def reduce_summaries(self, summaries: list, original_title: str, destination_language: str, groq_api_key:str = None) -> str:
+        """
+        Joins the ordered partial summaries of a long video into the final summary: tree reduce when `self.target_summary_chars` is set,
+        a single merge request when `self.merge_summaries` is enabled, plain concatenation otherwise.
+        """
+        if self.target_summary_chars is not None:
+            return self.tree_reduce_summaries(summaries, original_title, destination_language, groq_api_key)
+        if self.merge_summaries and len(summaries) > 1:
+            return self.merge_partial_summaries(summaries, original_title, destination_language, groq_api_key)
+        return " ".join(summaries) + " "
+
+
+    def tree_reduce_summaries(self, summaries: list, original_title: str, destination_language: str, groq_api_key:str = None) -> str:
+        """
+        Hierarchical reduce: the partial summaries are merged in groups of `self.merge_fan_in`, all the groups of a level concurrently,
+        then the merged summaries are merged again, until the joined summaries fit in `self.target_summary_chars`.
+        A long video needs log(n_chunks) levels, and the length of the final summary does not grow with the length of the video.
+
+        Args:
+            summaries (list): The partial summaries, in the order of the original video.
+            original_title (str): The title of the original video.
+            destination_language (str): The target language for the summary.
+            groq_api_key (str, optional): The API key for accessing the GROQ service.
+
+        Returns:
+            str: The final summary.
+        """
+        level = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            while len(" ".join(summaries)) > self.target_summary_chars:
+                if len(summaries) == 1 and level > 0:
+                    # a merge already asked for the target length: condensing it again would only lose information
+                    break
+                level += 1
+                groups = [summaries[start:start + self.merge_fan_in] for start in range(0, len(summaries), self.merge_fan_in)]
+                print(f'merging {len(summaries)} summaries into {len(groups)} (level {level})')
+                futures = [submit_with_context(executor, self.merge_partial_summaries, group, original_title, destination_language, groq_api_key)
+                           if len(group) > 1 or len(groups) == 1 else None
+                           for group in groups]
+                with stage_timer("summary_merge", level=level, n_summaries=len(summaries)):
+                    summaries = [future.result() if future is not None else group[0] for future, group in zip(futures, groups)]
+        return " ".join(summaries) + " "
+
+
+    def length_instruction(self) -> str:
+        '''The sentence asking for the target length of the summary, added to the user prompts of the final summaries (empty without a target).'''
+        if self.target_summary_chars is None:
+            return ''
+        return f' The summary must be at most {max(1, self.target_summary_chars // self.CHARS_PER_WORD)} words long.'
+
+
+    def summary_version(self) -> str:
+        '''Identifies the prompts and the reduce settings that produced a summary, to be used as the prompt version of its cache entry.'''
+        if self.target_summary_chars is not None:
+            return f"{self.PROMPT_VERSION}-tree{self.target_summary_chars}x{self.merge_fan_in}"
+        if self.merge_summaries:
+            return f"{self.PROMPT_VERSION}-merge"
+        return self.PROMPT_VERSION
+
+
+    def stream_completion(self, assistant_prompt: str, translate_prompt: str, groq_api_key:str = None):
+        """
+        Same as `translate_completion`, but the completion is streamed: the text is yielded piece by piece as it is generated.
+
+        Args:
+            assistant_prompt (str): The system-level instruction or context for LLM.
+            translate_prompt (str): The the text to be translated.
+            groq_api_key (str, optional): The API key for accessing the GROQ service. If not provided, it defaults to the environment variable 'GROQ_API_KEY'.
+
+        Yields:
+            str: The pieces of the translation, in order.
+        """
+        if groq_api_key is None:
+            groq_api_key = os.environ['GROQ_API_KEY']
+
+        groq_client = get_groq_client(groq_api_key)
+        messages_list = [
+                {
+                    "role": "system",
+                    "content": assistant_prompt
+                },
+                {
+                    "role": "user",
+                    "content": translate_prompt,
+                }
+            ]
+
+        # only the request is retried: once the first pieces are yielded, a broken stream cannot be replayed
+        stream = get_rate_limiter("groq", groq_api_key, self.model).call(
+            lambda: groq_client.chat.completions.with_raw_response.create(
+                messages = messages_list,
+                model= self.model,
+                temperature=0.5,
+                top_p=1,
+                stop=None,
+                stream=True,
+                ),
+            self.request_tokens(assistant_prompt, translate_prompt))
+
+        with stage_timer("llm_request", model=self.model, streaming=True):
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # GROQ sends the usage of a streamed completion in the x_groq field of the last chunk
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                    self.record_usage(x_groq.usage)
+
+
+    def record_usage(self, usage):
+        '''Records the tokens consumed by a completion in the metrics.'''
+        if usage is None:
+            return
+        record("polysummary_llm_tokens_total", usage.prompt_tokens or 0, model=self.model, kind="prompt")
+        record("polysummary_llm_tokens_total", usage.completion_tokens or 0, model=self.model, kind="completion")
+
+
+    def translate_transcription_stream(self, transcription: str, original_title: str, destination_language: str, groq_api_key:str = None, transcription_chunks: list = None,
+                                       completed_chunks: dict = None, checkpoint: ChunkCheckpoint = None):
+        """
+        Streaming version of `translate_transcription`. For a long transcription, the summary of the first part is streamed token by token
+        while the other parts are summarized concurrently in the background; their summaries are then yielded in order as soon as they are ready.
+
+        Args:
+            transcription (str): The transcription text to be translated.
+            original_title (str): The title of the original content, used for contextual information.
+            destination_language (str): The language to which the transcription should be translated.
+            groq_api_key (str, optional): The API key for accessing the GROQ service, if needed.
+            transcription_chunks (list, optional): The transcription already split by `split_transcription`.
+            completed_chunks (dict, optional): The summaries of the parts already completed by a previous failed attempt, see `ChunkSummaryError`.
+            checkpoint (ChunkCheckpoint, optional): Persistent store of the part summaries, see `translate_transcription`.
+
+        Yields:
+            dict: {"type": "delta", "text": <piece>} for every new piece of the summary, then a last {"type": "final", "text": <summary>}
+            with the complete summary (which differs from the concatenated pieces when `self.merge_summaries` or `self.target_summary_chars` is set).
+        """
+        if estimate_tokens(transcription, self.model) <= self.chunk_tokens:
+            assistant_prompt, translate_prompt = self.single_step_prompts(transcription, original_title, destination_language)
+            pieces = []
+            for piece in self.memoized_stream_completion("single", transcription, destination_language, assistant_prompt, translate_prompt, groq_api_key):
+                pieces.append(piece)
+                yield {"type": "delta", "text": piece}
+            yield {"type": "final", "text": "".join(pieces)}
+            return
+
+        transcription_list = transcription_chunks if transcription_chunks is not None else self.split_transcription(transcription)
+        n_chunks = len(transcription_list)
+        chunk_keys = [self.chunk_key(transcription_chunk, idx, n_chunks) for idx, transcription_chunk in enumerate(transcription_list)]
+        completed_chunks = self.resume_chunks(chunk_keys, completed_chunks, checkpoint)
+        failed_chunks = []
+        last_error = None
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            futures = {
+                idx: submit_with_context(executor, self.translate_chunk, transcription_chunk, idx, n_chunks, original_title, destination_language, groq_api_key,
+                                         checkpoint, chunk_keys[idx])
+                for idx, transcription_chunk in enumerate(transcription_list[1:], start=1) if chunk_keys[idx] not in completed_chunks
+            }
+
+            if chunk_keys[0] in completed_chunks:
+                yield {"type": "delta", "text": completed_chunks[chunk_keys[0]]}
+            else:
+                assistant_prompt, translate_prompt = self.chunk_prompts(transcription_list[0], 0, n_chunks, original_title, destination_language)
+                pieces = []
+                try:
+                    for piece in self.memoized_stream_completion("chunk", transcription_list[0], destination_language, assistant_prompt, translate_prompt,
+                                                                 groq_api_key):
+                        pieces.append(piece)
+                        yield {"type": "delta", "text": piece}
+                    completed_chunks[chunk_keys[0]] = "".join(pieces)
+                    if checkpoint is not None:
+                        checkpoint.save(chunk_keys[0], 0, completed_chunks[chunk_keys[0]])
+                except Exception as e:
+                    failed_chunks.append(0)
+                    last_error = e
+
+            for idx in range(1, n_chunks):
+                if idx in futures:
+                    try:
+                        completed_chunks[chunk_keys[idx]] = futures[idx].result()
+                    except Exception as e:
+                        failed_chunks.append(idx)
+                        last_error = e
+                # after a failure the other parts are still collected, but the streamed text stops at the gap
+                if not failed_chunks:
+                    yield {"type": "delta", "text": " " + completed_chunks[chunk_keys[idx]]}
+
+        if failed_chunks:
+            raise ChunkSummaryError(f"{len(failed_chunks)} of {n_chunks} parts could not be summarized: {last_error}",
+                                    completed_chunks, failed_chunks) from last_error
+        results = [completed_chunks[key] for key in chunk_keys]
+
+        yield {"type": "final", "text": self.reduce_summaries(results, original_title, destination_language, groq_api_key)}
+
 
     def split_transcription(self, transcription: str) -> list:
         """
-        Splits a long transcription into smaller chunks, each approximately 90% of the character limit set while initializing the object. 
-        The split is not based on the string indices directly in order to avoid cutting word; rather the chunks are splitted at words-level, using as splitting word the one closer to the `self.char_limits` value
+        Splits a long transcription into chunks of at most `self.chunk_tokens` estimated tokens for `self.model`, using the `TranscriptChunker` set while initializing the object.
+        The chunks are cut at sentence boundaries when possible (at word boundaries otherwise) and the whole transcription is kept, including the final partial chunk.
 
         Args:
             transcription (str): The full transcription text that needs to be split.
 
         Returns:
-            list: A list of strings, where each string is a chunk of the original transcription, split by word boundaries.
+            list: A list of strings, where each string is a chunk of the original transcription.
         """
+        return self.chunker.split(transcription)
 
-        cut_level = self.char_limits * 0.9
-        final_list = []
-
-        word_split = transcription.split(" ")
 
-        newtxt = ""
-        for i in range(len(word_split)):
-            newtxt = newtxt + word_split[i] + " "
-            if len(newtxt) > cut_level:
-                final_list.append(newtxt)
-                newtxt = ""
+def print_progress_bar(completed: int, total: int, bar_length: int = 30):
+    """
+    Prints a progress bar on a single line, using \r to overwrite it at each call.
 
-        return final_list
-        
-        
\ No newline at end of file
+    Args:
+        completed (int): The number of completed steps.
+        total (int): The total number of steps.
+        bar_length (int, optional): The length of the bar in characters.
+    """
+    percentage = (completed / total) * 100
+    filled_length = int(bar_length * completed / total)
+    bar = '=' * filled_length + '-' * (bar_length - filled_length)
+    print(f"{percentage:.2f}% [{bar}]", end="\r")
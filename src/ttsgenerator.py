@@ -1,10 +1,30 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
 import time
-from openai import OpenAI
-from gtts import gTTS
+import uuid
+from clients import get_openai_client
+from audiosegmenter import concatenate_audio
+from diskcache import get_disk_cache
+from metrics import record, stage_timer, submit_with_context
+from ratelimiter import get_rate_limiter
+from chunker import TranscriptChunker, chars_per_token
+from utils import get_video_id
 
 class TTSGenerator(ABC):
+    '''
+    Base class of the TTS generators. The text is synthesized in sentence-aligned segments of at most `max_segment_chars` characters,
+    up to `max_workers` at the same time, and the segments are joined into a single audio file. Every segment is cached by the hash of
+    its content (and of the generator settings), so a sentence already synthesized is never sent again.
+    Both the final audio files and the segments are kept within a byte budget by a `DiskCacheManager`.
+    '''
+    max_segment_chars = 1000
+    max_workers = 4
+    translated_folder = 'translated_audio'
+    segments_folder = os.path.join('translated_audio', 'segments')
+    max_cache_bytes = int(os.environ.get("TRANSLATED_CACHE_MAX_BYTES", 512 * 1024**2))
+    max_segments_cache_bytes = int(os.environ.get("TTS_SEGMENTS_CACHE_MAX_BYTES", 512 * 1024**2))
 
     @abstractmethod
     def generate_audio(self, text):
@@ -19,21 +39,86 @@ class TTSGenerator(ABC):
         """
         pass
 
-    def translated_path_check(self, input_url, destination_language, generatorname):
+    def settings_name(self) -> str:
+        '''Identifies the settings of the generator that change the synthesized audio (e.g. model and voice), to be used in the cache keys.'''
+        return ""
+
+    def translated_path_check(self, input_url, destination_language, generatorname, text = None):
+        '''Returns the path of the final audio. With `text`, the name includes its hash, so that a different summary of the same video
+        (e.g. with another target length or prompt version) never gets the audio of the previous one.'''
         timestamp = int(time.time())
-        os.makedirs('translated_audio', exist_ok = True)
+        os.makedirs(self.translated_folder, exist_ok = True)
         if input_url is None:
             timestamp = int(time.time())
-            translated_path = os.path.join('translated_audio', f"{timestamp}.wav")
+            translated_path = os.path.join(self.translated_folder, f"{timestamp}.wav")
         else:
-            if "?v=" in input_url:
-                video_name = input_url.split("?v=")[-1].split("&")[0] + ".mp3"
-            elif "shorts" in input_url:
-                video_name = input_url.split("/")[-1].split(".")[0] + ".mp3"
-            translated_path = os.path.join('translated_audio', f"translated_{generatorname}_{destination_language}_{video_name}.wav")
+            video_name = get_video_id(input_url) + ".mp3"
+            text_hash = f"_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}" if text is not None else ""
+            translated_path = os.path.join(self.translated_folder, f"translated_{generatorname}_{destination_language}{text_hash}_{video_name}.wav")
         
         return translated_path
 
+    def translated_cache(self):
+        return get_disk_cache(self.translated_folder, self.max_cache_bytes)
+
+    def segments_cache(self):
+        return get_disk_cache(self.segments_folder, self.max_segments_cache_bytes)
+
+    def split_segments(self, text: str) -> list:
+        """
+        Splits the text into segments of at most `self.max_segment_chars` characters, cut at sentence boundaries when possible.
+
+        Args:
+            text (str): The text to be synthesized.
+
+        Returns:
+            list: The segments, in order.
+        """
+        return TranscriptChunker(self.max_segment_chars / chars_per_token()).split(text)
+
+    def synthesize_segmented(self, text: str, translated_path: str, cache_namespace: str, synthesize_segment) -> str:
+        """
+        Synthesizes the text segment by segment, concurrently, reusing the segments already cached, and joins them into `translated_path`.
+
+        Args:
+            text (str): The text to be synthesized.
+            translated_path (str): The path of the final audio file.
+            cache_namespace (str): The settings that change the audio of a segment (e.g. generator, language, voice), included in the cache key.
+            synthesize_segment (callable): A function (segment_text, output_path) that synthesizes a single segment into an MP3 file.
+
+        Returns:
+            str: The path of the final audio file.
+        """
+        segments_cache = self.segments_cache()
+        segments = self.split_segments(text)
+        segment_paths = [
+            os.path.join(self.segments_folder, hashlib.sha256(f"{cache_namespace}\n{segment}".encode("utf-8")).hexdigest() + ".mp3")
+            for segment in segments
+        ]
+        missing_segments = {segment_path: segment for segment, segment_path in zip(segments, segment_paths)
+                            if not segments_cache.lookup(os.path.basename(segment_path))}
+        print(f'synthesizing {len(missing_segments)} of {len(segments)} audio segments')
+
+        def synthesize_to_cache(segment_path):
+            temporary_path = f"{segment_path}.{uuid.uuid4().hex}.tmp"
+            segment_text = missing_segments[segment_path]
+            record("polysummary_tts_characters_total", len(segment_text), generator=cache_namespace.split("_")[0])
+            with stage_timer("tts_segment", chars=len(segment_text)):
+                synthesize_segment(segment_text, temporary_path)
+            os.replace(temporary_path, segment_path)
+            segments_cache.add(os.path.basename(segment_path))
+
+        with ThreadPoolExecutor(max_workers = max(1, self.max_workers)) as executor:
+            futures = [submit_with_context(executor, synthesize_to_cache, segment_path) for segment_path in missing_segments]
+            for future in futures:
+                future.result()
+
+        temporary_path = f"{translated_path}.{uuid.uuid4().hex}.tmp"
+        concatenate_audio(segment_paths, temporary_path)
+        os.replace(temporary_path, translated_path)
+        self.translated_cache().add(os.path.basename(translated_path))
+        return translated_path
+
 
 class Mock_TTSGenerator(TTSGenerator):
     
@@ -43,7 +128,16 @@ class Mock_TTSGenerator(TTSGenerator):
     
 
 class OpenAI_TTSGenerator(TTSGenerator):
-    
+    # tts-1 rejects inputs longer than 4096 characters, the segments stay well below it
+    max_segment_chars = 1500
+
+    def __init__(self, model: str = "tts-1", voice: str = "alloy"):
+        self.model = model
+        self.voice = voice
+
+    def settings_name(self) -> str:
+        return f"{self.model}_{self.voice}"
+
     def generate_audio(self, text: str, destination_language:str = None, input_url:str = None, openai_key:str = None) -> str:
         """
         Generates audio from the provided text using the OpenAI TTS API.
@@ -60,18 +154,25 @@ class OpenAI_TTSGenerator(TTSGenerator):
         if openai_key is None:
             openai_key = os.environ['OPENAI_API_KEY']
         
-        translated_path = self.translated_path_check(input_url, destination_language, 'openai')
-
-        if not os.path.isfile(translated_path):
-            client = OpenAI(api_key = openai_key)
-            response = client.audio.speech.create(
-                model = "tts-1",
-                voice = "alloy",
-                input = text
-                )
-            
-            with open(translated_path, "wb") as f:
-                f.write(response.content)
+        translated_path = self.translated_path_check(input_url, destination_language, f'openai_{self.settings_name()}', text)
+
+        if not self.translated_cache().lookup(os.path.basename(translated_path)):
+            client = get_openai_client(openai_key)
+            rate_limiter = get_rate_limiter("openai", openai_key, self.model)
+
+            def synthesize_segment(segment_text, segment_path):
+                response = rate_limiter.call(
+                    lambda: client.audio.speech.with_raw_response.create(
+                        model = self.model,
+                        voice = self.voice,
+                        input = segment_text,
+                        response_format = "mp3"
+                        ))
+
+                with open(segment_path, "wb") as f:
+                    f.write(response.content)
+
+            self.synthesize_segmented(text, translated_path, f"openai_{self.settings_name()}", synthesize_segment)
 
         print('TTS generation completed')
         return translated_path
@@ -79,7 +180,9 @@ class OpenAI_TTSGenerator(TTSGenerator):
 
 
 class g_TTSGenerator(TTSGenerator):
-    
+    # gTTS sends requests of ~100 characters one after the other, so shorter segments give more parallelism
+    max_segment_chars = 500
+
     def generate_audio(self, text: str, destination_language: str, input_url: str = None) -> str:
         """
         Generates audio locally using the gTTS library.
@@ -102,12 +205,16 @@ class g_TTSGenerator(TTSGenerator):
         if len(destination_language) > 2:
             destination_language = convert_language[destination_language]
         
-        translated_path = self.translated_path_check(input_url, destination_language, 'gtts')
+        translated_path = self.translated_path_check(input_url, destination_language, 'gtts', text)
 
-        if not os.path.isfile(translated_path):
+        if not self.translated_cache().lookup(os.path.basename(translated_path)):
             print('starting gTTS..')
-            response = gTTS(text, lang = destination_language)
-            response.save(translated_path)
+            from gtts import gTTS
+
+            def synthesize_segment(segment_text, segment_path):
+                gTTS(segment_text, lang = destination_language).save(segment_path)
+
+            self.synthesize_segmented(text, translated_path, f"gtts_{destination_language}", synthesize_segment)
         print('TTS generation completed')
         return translated_path
     
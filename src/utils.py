@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+import hashlib
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def get_video_id(url: str) -> str:
+    """
+    Extracts the YouTube video id from a video URL, supporting both the "watch?v=" and the "shorts" formats.
+
+    Args:
+        url (str): The URL of the video.
+
+    Returns:
+        str: The id of the video.
+    """
+    if "?v=" in url:
+        return url.split("?v=")[-1].split("&")[0]
+    elif "shorts" in url:
+        return url.split("/")[-1].split(".")[0].split("?")[0]
+    raise Exception(f"Unable to extract the video id from URL: {url}")
+
+
+# (lock folder, key) -> [lock, number of threads holding or waiting for it], the entry is removed when the last thread leaves
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def single_flight(lock_folder: str, key: str):
+    """
+    Context manager that lets only one thread, in any process, run the guarded block for the same key at a time.
+    Threads of the same process are serialized by an in-memory lock of the key, kept only while some thread uses it;
+    processes by an exclusive `flock` on the lock file of the key (on platforms without `fcntl` only the in-memory lock is used).
+    Different keys never wait for each other.
+
+    Args:
+        lock_folder (str): The folder of the lock files, shared by all the processes.
+        key (str): The key identifying the guarded resource, e.g. a video id.
+    """
+    lock_key = (lock_folder, key)
+    with _thread_locks_guard:
+        lock_entry = _thread_locks.setdefault(lock_key, [threading.Lock(), 0])
+        lock_entry[1] += 1
+
+    try:
+        with lock_entry[0]:
+            if fcntl is None:
+                yield
+                return
+
+            os.makedirs(lock_folder, exist_ok=True)
+            # the key is hashed into the file name, since it may hold characters that are not valid in one
+            lock_name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".lock"
+            with open(os.path.join(lock_folder, lock_name), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        with _thread_locks_guard:
+            lock_entry[1] -= 1
+            if lock_entry[1] == 0:
+                del _thread_locks[lock_key]
@@ -1,11 +1,26 @@
-from pytubefix import YouTube
+from collections import OrderedDict
 import os
+import threading
+import uuid
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from diskcache import get_disk_cache
+from metadatastore import VideoMetadataStore
+from metrics import stage_timer
+from utils import get_video_id, single_flight
+
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get("DOWNLOAD_CACHE_MAX_BYTES", 2 * 1024**3))
+# the lowest bitrate of the downloaded audio streams: speech recognition needs only 16 kHz mono, the audio is preprocessed before the upload
+MIN_AUDIO_KBPS = int(os.environ.get("MIN_AUDIO_KBPS", 32))
 
 class VideoDownloader(ABC):
-    def __init__(self, output_folder="download_audio"):
+    # True if `download_audio` accepts an `on_chunk` callback receiving the audio while it is downloaded (see `streaming.py`)
+    supports_streaming = False
+
+    def __init__(self, output_folder="download_audio", max_cache_bytes=DOWNLOAD_CACHE_MAX_BYTES):
         self.output_folder = output_folder
         os.makedirs(self.output_folder, exist_ok=True)
+        self.disk_cache = get_disk_cache(self.output_folder, max_cache_bytes)
 
     @abstractmethod
     def download_audio(self, url: str) -> dict:
@@ -13,26 +28,63 @@ class VideoDownloader(ABC):
         Abstract method to download audio from a video URL.
         Args:
             url (str): The URL of the video.
-        
+
         Returns:
             dict: Dictionary with video title and file path.
                 Example: {"video_title": <title>, "video_path": <path_to_audio>}
         """
         pass
 
-    def check_existing_download(self, video_name):
-        videos_list = os.listdir(self.output_folder)
-        return video_name in videos_list
+    def get_youtube(self, url: str):
+        '''Returns the pytubefix `YouTube` object of a video, to read its metadata, streams or captions.'''
+        from pytubefix import YouTube
+        return YouTube(url)
+
+    def check_existing_download(self, video_name, record_stats=True):
+        # downloads are renamed into place only once complete, so an indexed file is always a complete one
+        return self.disk_cache.lookup(video_name, record_stats)
 
 
 class PytubeFix_VideoDownloader(VideoDownloader):
+    '''
+    Downloads the audio of YouTube videos using pytubefix. The metadata of every downloaded video is kept in a `VideoMetadataStore`,
+    so that a request for an already downloaded video is answered without any network call.
+    The `YouTube` objects of the last `max_youtube_objects` videos are kept, so that the captions, metadata and audio of a video
+    are all read from the same object, which fetches the watch page of the video only once.
+    '''
+    supports_streaming = True
+    max_youtube_objects = 16
 
-    def download_audio(self, url: str) -> dict:
+    def __init__(self, output_folder="download_audio", max_cache_bytes=DOWNLOAD_CACHE_MAX_BYTES):
+        super().__init__(output_folder, max_cache_bytes)
+        self.metadata_store = VideoMetadataStore(os.path.join(self.output_folder, "metadata.sqlite"))
+        self.youtube_objects = OrderedDict()
+        self.youtube_objects_lock = threading.Lock()
+
+    def get_youtube(self, url: str):
+        video_id = get_video_id(url)
+        with self.youtube_objects_lock:
+            yt = self.youtube_objects.get(video_id)
+            if yt is not None:
+                self.youtube_objects.move_to_end(video_id)
+                return yt
+        # built outside the lock, two threads may build it at the same time: the first one stored is kept
+        yt = super().get_youtube(url)
+        with self.youtube_objects_lock:
+            yt = self.youtube_objects.setdefault(video_id, yt)
+            self.youtube_objects.move_to_end(video_id)
+            while len(self.youtube_objects) > self.max_youtube_objects:
+                self.youtube_objects.popitem(last=False)
+        return yt
+
+    def download_audio(self, url: str, on_chunk = None) -> dict:
         """
         Download audio from a video URL.
         Args:
             url (str): The URL of the video.
-        
+            on_chunk (callable, optional): If given, the audio is downloaded in chunks and `on_chunk(chunk)` is called with each of them,
+                while it is written to the cache. Not called if the audio is already cached.
+
         Returns:
             dict: Dictionary with video title and file path.
                 Example: {"video_title": <title>, "video_path": <path_to_audio>}
@@ -40,24 +92,154 @@ class PytubeFix_VideoDownloader(VideoDownloader):
         if not "youtube.com" in url:
             raise Exception(f"The provided is not a valid youtube URL - URL: {url}")
 
-        if "?v=" in url:
-            video_name = url.split("?v=")[-1].split("&")[0] + ".mp3"
-        elif "shorts" in url:
-            video_name = url.split("/")[-1].split(".")[0] + ".mp3"
-        yt = YouTube(url)
-        existing_video = self.check_existing_download(video_name)
-        if not existing_video:
-            ys = yt.streams.filter(only_audio=True).first()
-            ys.download(output_path = self.output_folder, filename = video_name)
-        else:
-            print("video already cached")
-
-        return {"video_title": yt.title,
+        video_id = get_video_id(url)
+        video_name = video_id + ".mp3"
+        video_path = os.path.join(self.output_folder, video_name)
+
+        cached_result = self.get_cached_download(video_id, video_name)
+        if cached_result is not None:
+            return cached_result
+
+        # only one worker (thread or process) downloads a given video, the others wait and then find it cached
+        with single_flight(os.path.join(self.output_folder, ".locks"), video_id):
+            cached_result = self.get_cached_download(video_id, video_name, record_stats=False)
+            if cached_result is not None:
+                return cached_result
+
+            with stage_timer("metadata"):
+                yt = self.get_youtube(url)
+                video_title = yt.title
+            if not self.check_existing_download(video_name, record_stats=False):
+                ys = self.select_audio_stream(yt)
+                with stage_timer("audio_download", itag=ys.itag, streaming=on_chunk is not None):
+                    if on_chunk is None:
+                        self.download_stream(ys, video_name)
+                    else:
+                        self.download_stream_chunks(ys, video_name, on_chunk)
+                self.metadata_store.put(video_id, video_title, yt.length, ys.itag, ys.filesize)
+            else:
+                # downloaded before the metadata store existed: only the title is fetched, the stream is unknown
+                print("video already cached")
+                self.metadata_store.put(video_id, video_title, yt.length, None, os.path.getsize(video_path))
+
+        return {"video_title": video_title,
+                "video_path": video_path}
+
+    def get_cached_download(self, video_id, video_name, record_stats=True):
+        if not self.check_existing_download(video_name, record_stats):
+            return None
+        metadata = self.metadata_store.get(video_id)
+        if metadata is None:
+            return None
+        print("video already cached")
+        return {"video_title": metadata["title"],
                 "video_path": os.path.join(self.output_folder, video_name)}
 
+    def download_stream(self, ys, video_name):
+        """
+        Downloads a stream atomically: the data is written to a temporary file, renamed to `video_name` only once the download is complete.
+
+        Args:
+            ys (Stream): The pytubefix stream to be downloaded.
+            video_name (str): The final filename in the output folder.
+        """
+        temporary_name = f"{video_name}.{uuid.uuid4().hex}.part"
+        temporary_path = os.path.join(self.output_folder, temporary_name)
+        try:
+            downloaded_path = ys.download(output_path = self.output_folder, filename = temporary_name)
+            os.replace(downloaded_path or temporary_path, os.path.join(self.output_folder, video_name))
+            self.disk_cache.add(video_name)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def download_stream_chunks(self, ys, video_name, on_chunk):
+        """
+        Same as `download_stream`, but the stream is downloaded in chunks (HTTP ranges) and each chunk is also passed to `on_chunk`.
+
+        Args:
+            ys (Stream): The pytubefix stream to be downloaded.
+            video_name (str): The final filename in the output folder.
+            on_chunk (callable): Called with every chunk of data, in order.
+        """
+        from pytubefix import request
+
+        temporary_path = os.path.join(self.output_folder, f"{video_name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(temporary_path, "wb") as audio_file:
+                for chunk in request.stream(ys.url):
+                    audio_file.write(chunk)
+                    on_chunk(chunk)
+            os.replace(temporary_path, os.path.join(self.output_folder, video_name))
+            self.disk_cache.add(video_name)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def select_audio_stream(self, yt):
+        '''Picks the smallest audio stream with a bitrate of at least `MIN_AUDIO_KBPS` (the first audio stream if the bitrates are unknown).'''
+        streams = list(yt.streams.filter(only_audio=True))
+        usable_streams = [stream for stream in streams if audio_kbps(stream) >= MIN_AUDIO_KBPS] or streams
+        return min(usable_streams, key=audio_kbps) if usable_streams else None
+
+    def fetch_metadata(self, url: str) -> dict:
+        """
+        Fetches the metadata of a video from YouTube (without downloading it) and stores it in the metadata store.
+
+        Args:
+            url (str): The URL of the video.
+
+        Returns:
+            dict: The metadata of the video, see `VideoMetadataStore.get`.
+        """
+        video_id = get_video_id(url)
+        yt = self.get_youtube(url)
+        ys = self.select_audio_stream(yt)
+        self.metadata_store.put(video_id, yt.title, yt.length, ys.itag, ys.filesize)
+        return self.metadata_store.get(video_id)
+
+    def prefetch_metadata(self, urls: list, max_workers: int = 8) -> dict:
+        """
+        Fetches concurrently the metadata of a list of videos, skipping the ones already in the metadata store.
+        Failures are reported and skipped, so that a single unavailable video does not stop the prefetch.
+
+        Args:
+            urls (list): The URLs of the videos.
+            max_workers (int, optional): The max number of concurrent requests to YouTube.
+
+        Returns:
+            dict: The metadata of each video, keyed by video id.
+        """
+        results = {}
+        missing_urls = []
+        for url in urls:
+            video_id = get_video_id(url)
+            metadata = self.metadata_store.get(video_id)
+            if metadata is not None:
+                results[video_id] = metadata
+            else:
+                missing_urls.append(url)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.fetch_metadata, url): url for url in missing_urls}
+            for future, url in futures.items():
+                try:
+                    metadata = future.result()
+                    results[metadata["video_id"]] = metadata
+                except Exception as e:
+                    print(f"unable to fetch metadata for {url}: {e}")
+
+        return results
+
+
+def audio_kbps(stream) -> int:
+    '''Returns the bitrate of a pytubefix audio stream in kbps, from its `abr` (e.g. "48kbps"), or 0 if unknown.'''
+    digits = "".join(character for character in (getattr(stream, "abr", None) or "") if character.isdigit())
+    return int(digits) if digits else 0
+
 
 if __name__ == "__main__":
     downloader = PytubeFix_VideoDownloader()
     url = ""
     result = downloader.download_audio(url)
-    print(result)
\ No newline at end of file
+    print(result)
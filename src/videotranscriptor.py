@@ -1,59 +1,380 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 import os
-from groq import Groq
+import re
+import tempfile
+import threading
+from clients import get_groq_client
+from metrics import record, stage_timer, submit_with_context
+from ratelimiter import get_rate_limiter
+from checkpoints import ChunkCheckpoint
+from audiosegmenter import ffmpeg_available, get_audio_duration, detect_silences, plan_segments, extract_segment, merge_overlapping_texts
 
 
 class VideoTranscriptor(ABC):
     @abstractmethod
-    def transcript_video(self, audio_path: str) -> str:
+    def transcript_video(self, audio_path: str, groq_api_key: str = None, checkpoint: ChunkCheckpoint = None) -> str:
         """
         Abstract method to read an audio file from a path and return its transcription as string.
         Args:
             audio_path (str): The path of the audio file.
-        
+            groq_api_key (str, optional): The API key of the backend, if it needs one.
+            checkpoint (ChunkCheckpoint, optional): Persistent store of the transcriptions of the audio segments, for the backends that split the audio.
+
         Returns:
             str: A string containing the transcription of the audio.
         """
 
+    def transcript_url(self, input_url: str) -> dict:
+        """
+        Transcribes a video from its URL without downloading its audio, if the backend can (e.g. from its captions).
+        By default it cannot, and the audio is downloaded and passed to `transcript_video`.
+
+        Args:
+            input_url (str): The URL of the video.
+
+        Returns:
+            dict: {"text": <transcription>, "video_title": <title>}, or None if the video must be transcribed from its audio.
+        """
+        return None
+
+    def warmup(self):
+        '''Prepares the backend before the first request (e.g. loads a local model), so that it does not pay the startup latency. Nothing by default.'''
+        pass
+
 
-   
 class Groq_Transcriptor(VideoTranscriptor):
     """
     A class that handles video transcription using the GROQ API.
+    Audio longer than `segment_seconds` is split (at silences when possible) into overlapping segments, which are
+    uploaded concurrently and stitched back together. Segmenting requires ffmpeg; without it the whole file is uploaded at once.
 
     Attributes:
         model (str): The model name used for transcription, defaulting to "whisper-large-v3-turbo".
+        segment_seconds (float): The max length of each uploaded segment, in seconds.
+        overlap_seconds (float): The audio shared by consecutive segments, in seconds.
+        max_workers (int): The max number of segments uploaded at the same time.
     """
 
-    def __init__(self, model_name = "whisper-large-v3-turbo"):
+    def __init__(self, model_name = "whisper-large-v3-turbo", segment_seconds = 600, overlap_seconds = 2, max_workers = 4):
         self.model = model_name
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        self.max_workers = max_workers
 
-    def transcript_video(self, audio_path, groq_api_key = None):
+    def transcript_video(self, audio_path, groq_api_key = None, checkpoint = None):
         """
         Transcribes audio from a audio file path using the GROQ API.
 
         Args:
             audio_path (str): The file path to the audio file that needs to be transcribed.
             groq_api_key (str, optional): The API key for accessing the GROQ service. If not provided, take as default the value of the environment variable 'GROQ_API_KEY'.
+            checkpoint (ChunkCheckpoint, optional): If given, the transcription of every segment is saved in it as soon as it is completed,
+                and the segments found in it are not transcribed again.
 
         Returns:
             str: The transcribed text from the audio file.
 
         Behavior:
             - Initializes the GROQ client with the provided or environment API key.
-            - Reads the audio file and sends it to the GROQ API for transcription.
+            - If the audio is longer than `self.segment_seconds`, splits it into segments and transcribes them concurrently.
+            - Otherwise, reads the audio file and sends it to the GROQ API for transcription.
             - Returns the transcription text received from the API.
         """
 
         if groq_api_key is None:
             groq_api_key = os.environ['GROQ_API_KEY']
 
-        self.groq_client = Groq(api_key=groq_api_key)
+        if ffmpeg_available():
+            duration = get_audio_duration(audio_path)
+            if duration > self.segment_seconds:
+                return self.transcript_segments(audio_path, duration, groq_api_key, checkpoint)
+
+        return self.transcript_file(audio_path, groq_api_key)
+
+    def transcript_file(self, audio_path, groq_api_key):
+        """
+        Sends a whole audio file to the GROQ API in a single request, paced and retried by the rate limiter of the API key.
+
+        Args:
+            audio_path (str): The file path to the audio file.
+            groq_api_key (str): The API key for accessing the GROQ service.
+
+        Returns:
+            str: The transcribed text from the audio file.
+        """
+        groq_client = get_groq_client(groq_api_key)
 
         with open(audio_path, 'rb') as file:
-            transcription = self.groq_client.audio.transcriptions.create(
-                file = (audio_path, file.read()),
-                model = self.model
-            )
-        
+            audio_bytes = file.read()
+        record("polysummary_upload_bytes_total", len(audio_bytes), service="groq_transcription")
+        rate_limiter = get_rate_limiter("groq", groq_api_key, self.model)
+        with stage_timer("transcription_request", model=self.model, bytes=len(audio_bytes)):
+            transcription = rate_limiter.call(
+                lambda: groq_client.audio.transcriptions.with_raw_response.create(
+                    file = (os.path.basename(audio_path), audio_bytes),
+                    model = self.model
+                ))
+
         return transcription.text
+
+    def transcript_segments(self, audio_path, duration, groq_api_key, checkpoint = None):
+        """
+        Splits a long audio file into overlapping segments, transcribes them concurrently and stitches the texts, removing the words duplicated by the overlap.
+        Each worker extracts and uploads one segment at a time, so at most `self.max_workers` segments are on disk or in memory at once.
+
+        Args:
+            audio_path (str): The file path to the audio file.
+            duration (float): The duration of the audio, in seconds.
+            groq_api_key (str): The API key for accessing the GROQ service.
+            checkpoint (ChunkCheckpoint, optional): Persistent store of the transcriptions of the segments.
+
+        Returns:
+            str: The transcribed text from the audio file.
+        """
+        segments = plan_segments(duration, self.segment_seconds, self.overlap_seconds, detect_silences(audio_path))
+        # the segments depend only on the audio and the settings, so their keys are stable across attempts
+        segment_keys = [f"{idx}/{len(segments)}/{start:.3f}-{end:.3f}" for idx, (start, end) in enumerate(segments)]
+        completed_segments = checkpoint.load() if checkpoint is not None else {}
+        print(f'transcribing {len(segments)} audio segments' + (f' ({len(completed_segments)} already transcribed)' if completed_segments else ''))
+
+        # a preprocessed audio is already mono 16 kHz and compressed: its segments are cut without re-encoding
+        extension, codec_args = (".ogg", ["-c:a", "copy"]) if audio_path.endswith(".ogg") else (".flac", None)
+
+        with tempfile.TemporaryDirectory() as segments_folder:
+            def transcript_segment(idx):
+                if segment_keys[idx] in completed_segments:
+                    return completed_segments[segment_keys[idx]]
+                start, end = segments[idx]
+                segment_path = extract_segment(audio_path, start, end, os.path.join(segments_folder, f"segment_{idx}{extension}"), codec_args)
+                try:
+                    segment_text = self.transcript_file(segment_path, groq_api_key)
+                finally:
+                    os.remove(segment_path)
+                if checkpoint is not None:
+                    checkpoint.save(segment_keys[idx], idx, segment_text)
+                return segment_text
+
+            with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+                futures = [submit_with_context(executor, transcript_segment, idx) for idx in range(len(segments))]
+                segment_texts = [future.result() for future in futures]
+
+        transcription = segment_texts[0]
+        for segment_text in segment_texts[1:]:
+            if self.overlap_seconds > 0:
+                transcription = merge_overlapping_texts(transcription, segment_text)
+            else:
+                transcription = transcription + " " + segment_text
+        return transcription
+
+
+SRT_TIMESTAMP_PATTERN = re.compile(r"^\d{2}:\d{2}:\d{2}[,.]\d{3}\s*-->")
+CAPTION_TAG_PATTERN = re.compile(r"<[^>]+>|\{[^}]+\}")
+# non-speech annotations of the captions, e.g. [Music], [Applause], (laughs), ♪
+CAPTION_ANNOTATION_PATTERN = re.compile(r"\[[^\]]*\]|\([^)]*\)|♪+")
+
+
+def clean_captions(srt_captions: str) -> str:
+    """
+    Converts captions in SRT format into plain text: cue numbers, timestamps, formatting tags and non-speech annotations are removed,
+    and the lines repeated by consecutive cues (as in the rolling auto-generated captions) are kept once.
+
+    Args:
+        srt_captions (str): The captions, in SRT format.
+
+    Returns:
+        str: The text of the captions, on a single line.
+    """
+    lines = []
+    for line in srt_captions.splitlines():
+        line = line.strip()
+        if not line or line.isdigit() or SRT_TIMESTAMP_PATTERN.match(line):
+            continue
+        line = CAPTION_ANNOTATION_PATTERN.sub(" ", CAPTION_TAG_PATTERN.sub("", line))
+        line = " ".join(line.split())
+        if line and (not lines or line != lines[-1]):
+            lines.append(line)
+    return " ".join(lines)
+
+
+class Caption_Transcriptor(VideoTranscriptor):
+    """
+    Caption-first transcription: the transcription is taken from the captions of the video on YouTube (manual tracks preferred over
+    the auto-generated ones), so neither the audio download nor the upload to Whisper are needed. Videos without usable captions
+    are transcribed from their audio by `fallback_transcriptor`.
+
+    Attributes:
+        fallback_transcriptor (VideoTranscriptor): The backend used for the videos without usable captions.
+        model (str): Identifies the backend in the cache keys, e.g. "captions+whisper-large-v3-turbo".
+        preferred_languages (list): Language codes of the caption tracks to try first, e.g. ["en"]. Any track is used otherwise.
+        min_words_per_minute (float): Tracks with fewer words per minute of video are considered unusable (e.g. only lyrics or annotations).
+        videodownloader (VideoDownloader): If given, the captions are read from its `YouTube` object of the video (see `VideoDownloader.get_youtube`),
+            so that the watch page fetched for the captions is reused by the download of the audio.
+    """
+
+    def __init__(self, fallback_transcriptor: VideoTranscriptor = None, preferred_languages: list = None, min_words_per_minute: float = 20,
+                 videodownloader: "VideoDownloader" = None):
+        self.fallback_transcriptor = fallback_transcriptor if fallback_transcriptor is not None else Groq_Transcriptor()
+        self.model = f"captions+{self.fallback_transcriptor.model}"
+        self.preferred_languages = preferred_languages or []
+        self.min_words_per_minute = min_words_per_minute
+        self.videodownloader = videodownloader
+
+    def transcript_url(self, input_url):
+        try:
+            if self.videodownloader is not None:
+                yt = self.videodownloader.get_youtube(input_url)
+            else:
+                from pytubefix import YouTube
+                yt = YouTube(input_url)
+            caption = self.select_caption(yt.captions)
+            if caption is None:
+                print('no captions available')
+                record("polysummary_captions_total", result="missing")
+                return None
+            text = clean_captions(caption.generate_srt_captions())
+        except Exception as e:
+            # captions are an optimization: any failure falls back to the audio
+            print(f'unable to read the captions: {e}')
+            record("polysummary_captions_total", result="error")
+            return None
+
+        minutes = max(1, (yt.length or 0) / 60)
+        if len(text.split()) < self.min_words_per_minute * minutes:
+            print(f'captions {caption.code} too short to be used')
+            record("polysummary_captions_total", result="unusable")
+            return None
+
+        print(f'using the captions {caption.code} as transcription')
+        record("polysummary_captions_total", result="used")
+        return {"text": text, "video_title": yt.title}
+
+    def select_caption(self, captions):
+        """
+        Chooses the caption track to be used: a manual track in a preferred language, then any manual track,
+        then an auto-generated track (codes starting with "a.") in the same order.
+
+        Args:
+            captions (CaptionQuery): The caption tracks of the video.
+
+        Returns:
+            Caption: The selected track, or None if the video has no captions.
+        """
+        tracks = list(captions)
+        manual_tracks = [caption for caption in tracks if not caption.code.startswith("a.")]
+        auto_tracks = [caption for caption in tracks if caption.code.startswith("a.")]
+        for candidates in (manual_tracks, auto_tracks):
+            for language in self.preferred_languages:
+                for caption in candidates:
+                    if caption.code.removeprefix("a.").split("-")[0] == language:
+                        return caption
+            if candidates:
+                return candidates[0]
+        return None
+
+    def transcript_video(self, audio_path, groq_api_key = None, checkpoint = None):
+        return self.fallback_transcriptor.transcript_video(audio_path, groq_api_key, checkpoint)
+
+    def warmup(self):
+        self.fallback_transcriptor.warmup()
+
+
+LOCAL_WHISPER_MODEL = os.environ.get("LOCAL_WHISPER_MODEL", "small")
+
+# the model of a `Local_Transcriptor` worker process, loaded once by the pool initializer
+_local_model = None
+
+
+def _init_local_worker(model_size, compute_type, cpu_threads, language, beam_size):
+    '''Initializer of the worker processes: loads the model, then runs a first (slower) inference on one second of silence, before the worker takes any request.'''
+    global _local_model
+    import numpy as np
+    from faster_whisper import WhisperModel
+    _local_model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+    _transcribe_with_local_model(np.zeros(16000, dtype=np.float32), language or "en", beam_size)
+
+
+def _worker_ready():
+    pass
+
+
+def _transcribe_with_local_model(audio, language, beam_size):
+    segments, _ = _local_model.transcribe(audio, language=language, beam_size=beam_size, vad_filter=True)
+    return " ".join(segment.text.strip() for segment in segments)
+
+
+class Local_Transcriptor(VideoTranscriptor):
+    """
+    Transcribes the audio locally on the CPU with faster-whisper (CTranslate2, int8 quantization by default), without any API call.
+    The inference runs in a pool of `processes` worker processes, so several videos are transcribed in parallel on different cores;
+    every worker loads the model and runs a first inference when it starts, before taking any request, and keeps the model for all
+    the following requests. Call `warmup` at startup to start all the workers before the first request. Requires `pip install faster-whisper`.
+
+    Attributes:
+        model (str): Identifies the model in the cache keys, e.g. "faster-whisper-small-int8".
+        model_size (str): The faster-whisper model, e.g. "small", "medium" or "large-v3".
+        compute_type (str): The CTranslate2 quantization, e.g. "int8" or "float32".
+        processes (int): The number of worker processes, each holding a copy of the model.
+        cpu_threads (int): The threads of each worker (by default the cores are split among the workers).
+        language (str): The language of the audio, or None to detect it.
+        beam_size (int): The beam size of the decoding (1 is greedy, the fastest).
+    """
+
+    def __init__(self, model_size: str = LOCAL_WHISPER_MODEL, compute_type: str = "int8", processes: int = 2,
+                 cpu_threads: int = None, language: str = None, beam_size: int = 1):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.model = f"faster-whisper-{model_size}-{compute_type}"
+        self.processes = max(1, processes)
+        self.cpu_threads = cpu_threads if cpu_threads is not None else max(1, (os.cpu_count() or 1) // self.processes)
+        self.language = language
+        self.beam_size = beam_size
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def get_executor(self):
+        '''Returns the process pool, starting it at the first call.'''
+        with self.executor_lock:
+            if self.executor is None:
+                # CTranslate2 is not fork-safe: the workers are spawned
+                self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=_init_local_worker,
+                                                    initargs=(self.model_size, self.compute_type, self.cpu_threads, self.language, self.beam_size))
+            return self.executor
+
+    def warmup(self):
+        """
+        Starts all the worker processes and waits until they are ready, so that the first request does not wait for the model loading
+        nor for the first (slower) inference, which the initializer of every worker runs.
+        """
+        print(f'loading {self.model} in {self.processes} processes')
+        with stage_timer("transcription_warmup", model=self.model):
+            executor = self.get_executor()
+            # a new worker is started for every task submitted while no worker is idle, and the workers are all busy in their
+            # initializer until the model is loaded: one task for each process starts all of them
+            futures = [executor.submit(_worker_ready) for _ in range(self.processes)]
+            for future in futures:
+                future.result()
+
+    def transcript_video(self, audio_path, groq_api_key = None, checkpoint = None):
+        """
+        Transcribes an audio file with the local model.
+
+        Args:
+            audio_path (str): The file path to the audio file.
+            groq_api_key (str, optional): Unused, accepted for compatibility with the other backends.
+            checkpoint (ChunkCheckpoint, optional): Unused, the audio is transcribed in a single request.
+
+        Returns:
+            str: The transcribed text from the audio file.
+        """
+        with stage_timer("transcription_request", model=self.model):
+            return self.get_executor().submit(_transcribe_with_local_model, os.path.abspath(audio_path), self.language, self.beam_size).result()
+
+    def close(self):
+        '''Stops the worker processes.'''
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
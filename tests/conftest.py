@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+# the traces of the test requests are not worth keeping
+os.environ.setdefault('TRACES_PATH', '')
@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from chunker import TranscriptChunker, estimate_tokens, split_sentences
+
+WORDS = ["the", "video", "shows", "how", "a", "model", "learns", "from", "data", "and", "then", "we", "talk", "about", "results"]
+
+
+def make_transcription(n_sentences: int, seed: int = 0, punctuated: bool = True) -> str:
+    rng = random.Random(seed)
+    sentences = [" ".join(rng.choices(WORDS, k=rng.randint(3, 40))) + (rng.choice(".?!") if punctuated else "")
+                 for _ in range(n_sentences)]
+    return " ".join(sentences)
+
+
+def check_spans(chunker, transcription, spans):
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(transcription)
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        assert start < next_start <= end < next_end
+        if chunker.overlap_chars == 0:
+            assert next_start == end
+    assert all(end - start <= chunker.max_chars for start, end in spans)
+
+
+def ends_a_sentence(transcription, end):
+    return transcription[max(0, end - 100):end].rstrip()[-1] in ".?!"
+
+
+@pytest.mark.parametrize("overlap_tokens", [0, 50])
+@pytest.mark.parametrize("content_defined", [False, True])
+def test_spans_cover_the_whole_transcription(overlap_tokens, content_defined):
+    chunker = TranscriptChunker(200, overlap_tokens, "llama-3.1-70b-versatile", content_defined=content_defined)
+    transcription = make_transcription(500)
+
+    spans = chunker.split_spans(transcription)
+
+    assert len(spans) > 1
+    check_spans(chunker, transcription, spans)
+    # every cut falls on a sentence boundary, since all the sentences fit in a chunk
+    assert all(ends_a_sentence(transcription, end) for _, end in spans[:-1])
+
+
+@pytest.mark.parametrize("punctuated", [True, False])
+def test_multi_megabyte_transcription(punctuated):
+    chunker = TranscriptChunker(2000, 50, "llama-3.1-70b-versatile")
+    transcription = make_transcription(200000, seed=2, punctuated=punctuated)
+
+    spans = chunker.split_spans(transcription)
+
+    assert len(transcription) > 4 * 1024**2
+    check_spans(chunker, transcription, spans)
+    if punctuated:
+        assert all(ends_a_sentence(transcription, end) for _, end in spans[:-1])
+
+
+def test_overlap_repeats_the_end_of_the_previous_chunk():
+    chunker = TranscriptChunker(200, 50)
+    transcription = make_transcription(300)
+
+    spans = chunker.split_spans(transcription)
+
+    assert any(next_start < end for (_, end), (next_start, _) in zip(spans, spans[1:]))
+    for (_, end), (next_start, _) in zip(spans, spans[1:]):
+        assert end - next_start <= chunker.overlap_chars
+
+
+def test_tail_is_never_dropped():
+    chunker = TranscriptChunker(100)
+    transcription = make_transcription(60) + " and this is the final partial sentence"
+
+    chunks = chunker.split(transcription)
+
+    assert chunks[-1].endswith("and this is the final partial sentence")
+    assert "".join(chunks).replace(" ", "") == transcription.replace(" ", "")
+
+
+def test_unpunctuated_and_oversized_words_are_cut_within_the_budget():
+    chunker = TranscriptChunker(50)
+    transcription = make_transcription(100, punctuated=False) + " " + "x" * (3 * chunker.max_chars)
+
+    spans = chunker.split_spans(transcription)
+
+    check_spans(chunker, transcription, spans)
+    assert all(estimate_tokens(transcription[start:end]) <= chunker.max_tokens for start, end in spans)
+
+
+def test_short_and_empty_transcriptions():
+    chunker = TranscriptChunker(200)
+
+    assert chunker.split("") == []
+    assert chunker.split("   ") == []
+    assert chunker.split("Just one sentence.") == ["Just one sentence."]
+
+
+def test_overlap_must_be_smaller_than_the_chunk():
+    with pytest.raises(ValueError):
+        TranscriptChunker(100, 100)
+
+
+def test_split_sentences_gives_back_the_text():
+    transcription = make_transcription(50) + " no final punctuation"
+
+    assert "".join(split_sentences(transcription)) == transcription
+
+
+def test_content_defined_cuts_survive_a_shifted_start():
+    chunker = TranscriptChunker(500, 20, content_defined=True)
+    transcription = make_transcription(2000, seed=1)
+    # the same transcription without its first sentences, e.g. a re-upload with a shorter intro
+    shifted_transcription = transcription[sum(len(sentence) for sentence in split_sentences(transcription)[:23]):]
+
+    chunks, shifted_chunks = chunker.split(transcription), chunker.split(shifted_transcription)
+
+    assert len(set(chunks) & set(shifted_chunks)) >= 0.8 * len(shifted_chunks)
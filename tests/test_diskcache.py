@@ -0,0 +1,125 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import diskcache
+from diskcache import DiskCacheManager
+
+
+class FakeClock():
+    '''Replaces the clock of `diskcache`, so that the access times are all different.'''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(diskcache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def write_file(folder, name, size = 100):
+    with open(os.path.join(folder, name), "wb") as cached_file:
+        cached_file.write(b"x" * size)
+
+
+def add_file(cache, name, size = 100):
+    write_file(cache.folder, name, size)
+    cache.add(name)
+
+
+def cached_names(cache):
+    return {name for name in os.listdir(cache.folder) if not name.startswith(".")}
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = DiskCacheManager(str(tmp_path), max_bytes=250, policy="lru")
+    add_file(cache, "first.mp3")
+    add_file(cache, "second.mp3")
+    assert cache.lookup("first.mp3")
+
+    add_file(cache, "third.mp3")
+
+    assert cached_names(cache) == {"first.mp3", "third.mp3"}
+    assert not cache.lookup("second.mp3")
+
+
+def test_least_frequently_used_files_are_evicted(tmp_path):
+    cache = DiskCacheManager(str(tmp_path), max_bytes=250, policy="lfu")
+    add_file(cache, "first.mp3")
+    add_file(cache, "second.mp3")
+    assert cache.lookup("first.mp3")
+    assert cache.lookup("first.mp3")
+    # the most recent access, but a single hit
+    assert cache.lookup("second.mp3")
+
+    add_file(cache, "third.mp3")
+
+    assert cached_names(cache) == {"first.mp3", "third.mp3"}
+
+
+def test_the_added_file_is_kept_even_if_over_budget(tmp_path):
+    cache = DiskCacheManager(str(tmp_path), max_bytes=250)
+    add_file(cache, "small.mp3")
+
+    add_file(cache, "large.mp3", size=1000)
+
+    assert cached_names(cache) == {"large.mp3"}
+
+
+def test_missing_index_is_rebuilt_from_the_folder(tmp_path):
+    write_file(str(tmp_path), "first.mp3")
+    write_file(str(tmp_path), "second.mp3", size=50)
+    write_file(str(tmp_path), "download.part")
+    write_file(str(tmp_path), ".hidden")
+
+    cache = DiskCacheManager(str(tmp_path), max_bytes=1000)
+
+    stats = cache.stats()
+    assert (stats["files"], stats["total_bytes"]) == (2, 150)
+    assert cache.lookup("first.mp3")
+    assert not cache.lookup("download.part")
+
+
+def test_existing_index_is_not_rebuilt(tmp_path):
+    cache = DiskCacheManager(str(tmp_path), max_bytes=1000)
+    add_file(cache, "first.mp3")
+    # written without being added, e.g. by a process that crashed before `add`
+    write_file(str(tmp_path), "orphan.mp3")
+
+    reopened_cache = DiskCacheManager(str(tmp_path), max_bytes=1000)
+
+    assert reopened_cache.stats()["files"] == 1
+    assert reopened_cache.lookup("first.mp3")
+    assert not reopened_cache.lookup("orphan.mp3")
+
+
+def test_files_deleted_by_hand_are_forgotten(tmp_path):
+    cache = DiskCacheManager(str(tmp_path), max_bytes=1000)
+    add_file(cache, "first.mp3")
+
+    os.remove(os.path.join(str(tmp_path), "first.mp3"))
+
+    assert not cache.lookup("first.mp3")
+    assert cache.stats()["files"] == 0
+
+
+def test_stats_count_the_hits_and_misses(tmp_path):
+    cache = DiskCacheManager(str(tmp_path), max_bytes=1000)
+    add_file(cache, "first.mp3")
+
+    cache.lookup("first.mp3")
+    cache.lookup("missing.mp3")
+    cache.lookup("missing.mp3")
+    cache.lookup("first.mp3", record_stats=False)
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
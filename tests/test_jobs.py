@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager
+
+
+class FakeSummarizer():
+    '''
+    Runs the steps of `PolySummaryYT` locally, each taking `step_seconds`. The transcriptions are kept like in the stage cache,
+    and the max number of steps running at the same time is recorded for every stage.
+    '''
+
+    def __init__(self, step_seconds = 0.05, failing_videos = ()):
+        self.step_seconds = step_seconds
+        self.failing_videos = set(failing_videos)
+        self.transcripts = {}
+        self.transcribed = []
+        self.running = {}
+        self.max_running = {}
+        self.lock = threading.Lock()
+        # cleared to hold the jobs in the transcript step
+        self.transcript_gate = threading.Event()
+        self.transcript_gate.set()
+
+    def run_stage(self, stage):
+        with self.lock:
+            self.running[stage] = self.running.get(stage, 0) + 1
+            self.max_running[stage] = max(self.max_running.get(stage, 0), self.running[stage])
+        time.sleep(self.step_seconds)
+        with self.lock:
+            self.running[stage] -= 1
+
+    def fetch_step(self, input_url, video_id):
+        pass
+
+    def transcript_downloads(self, input_url, video_id):
+        return False
+
+    def transcript_step(self, input_url, video_id, groq_key_input = None):
+        self.transcript_gate.wait()
+        if video_id in self.failing_videos:
+            raise RuntimeError(f"transcription of {video_id} failed")
+        if video_id not in self.transcripts:
+            self.run_stage("transcript")
+            with self.lock:
+                self.transcribed.append(video_id)
+            self.transcripts[video_id] = {"text": f"transcription of {video_id}", "video_title": video_id}
+        return self.transcripts[video_id]
+
+    def summary_stream_step(self, input_url, video_id, destination_language, groq_key_input = None):
+        self.run_stage("summary")
+        yield {"type": "delta", "text": f"{destination_language} summary"}
+        yield {"type": "final", "text": f"{destination_language} summary of {video_id}"}
+
+    def tts_step(self, translated_text, input_url, video_id, destination_language, openai_key = None):
+        self.run_stage("tts")
+        return f"{video_id}_{destination_language}.mp3"
+
+
+def video_url(idx):
+    return f"https://www.youtube.com/watch?v=video{idx:06d}"
+
+
+@pytest.fixture
+def make_manager(tmp_path):
+    managers = []
+
+    def make_manager(summarizer, **kwargs):
+        manager = JobManager(summarizer, lock_folder=str(tmp_path / "locks"), **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield make_manager
+    for manager in managers:
+        manager.shutdown()
+
+
+def test_identical_requests_in_flight_are_merged(make_manager):
+    summarizer = FakeSummarizer()
+    summarizer.transcript_gate.clear()
+    manager = make_manager(summarizer)
+
+    job_id = manager.submit(video_url(1), "italian", "groq-key")
+    assert manager.submit(video_url(1), "🇮🇹 Italian", "groq-key") == job_id
+    assert manager.submit(video_url(1), "english", "groq-key") != job_id
+    # requests with other keys are never merged
+    assert manager.submit(video_url(1), "italian", "other-groq-key") != job_id
+
+    summarizer.transcript_gate.set()
+    assert manager.result(job_id, timeout=10) == {"audio_path": "video000001_italian.mp3", "text": "italian summary of video000001"}
+    # a finished job is not merged with the new requests
+    assert manager.submit(video_url(1), "italian", "groq-key") != job_id
+
+
+def test_video_is_transcribed_once_for_all_its_languages(make_manager):
+    summarizer = FakeSummarizer()
+    manager = make_manager(summarizer)
+
+    job_ids = [manager.submit(video_url(1), language) for language in ["italian", "english", "francais", "spanish", "deutsch"]]
+
+    for job_id in job_ids:
+        manager.result(job_id, timeout=10)
+    assert summarizer.transcribed == ["video000001"]
+
+
+def test_stages_run_within_their_limits(make_manager):
+    summarizer = FakeSummarizer(step_seconds=0.1)
+    manager = make_manager(summarizer, max_workers=8, stage_limits={"transcript": 2, "summary": 3, "tts": 1})
+
+    job_ids = [manager.submit(video_url(idx), language) for idx in range(4) for language in ["italian", "english"]]
+
+    for job_id in job_ids:
+        manager.result(job_id, timeout=10)
+    assert summarizer.max_running == {"transcript": 2, "summary": 3, "tts": 1}
+
+
+def test_failed_job_reports_its_error(make_manager):
+    summarizer = FakeSummarizer(failing_videos={"video000001"})
+    manager = make_manager(summarizer)
+
+    job_id = manager.submit(video_url(1), "italian")
+
+    with pytest.raises(Exception, match="transcription of video000001 failed"):
+        manager.result(job_id, timeout=10)
+    job_status = manager.status(job_id)
+    assert job_status["status"] == "error"
+    assert job_status["stage"] == "transcript"
+    assert job_status["error"] == "transcription of video000001 failed"
+    # the failed job is not merged with a retry of the request
+    assert manager.submit(video_url(1), "italian") != job_id
+
+
+def test_batch_status_follows_its_jobs(make_manager):
+    summarizer = FakeSummarizer(failing_videos={"video000002"})
+    manager = make_manager(summarizer)
+
+    batch_id = manager.submit_batch([video_url(1), video_url(2)], ["italian", "english"])
+    for job_status in manager.batch_status(batch_id)["jobs"]:
+        try:
+            manager.result(job_status["job_id"], timeout=10)
+        except Exception:
+            pass
+
+    batch_status = manager.batch_status(batch_id)
+    assert batch_status["status"] == "done"
+    assert batch_status["counts"] == {"done": 2, "error": 2}
@@ -0,0 +1,85 @@
+import os
+from types import SimpleNamespace
+
+from checkpoints import CheckpointStore
+from main import PolySummaryYT
+from metrics import METRICS
+from stagecache import StageCache
+from translator import Groq_Translator
+from ttsgenerator import TTSGenerator
+
+VIDEO_URL = "https://www.youtube.com/watch?v=abcdefghijk"
+VIDEO_ID = "abcdefghijk"
+
+
+class ModelTranslator(Groq_Translator):
+    '''Answers every request locally with a summary naming the model, so that another model gives another summary.'''
+
+    def translate_completion(self, assistant_prompt, translate_prompt, groq_api_key = None):
+        return f"summary by {self.model}"
+
+
+class RecordingTTSGenerator(TTSGenerator):
+    '''Writes the text to the audio file and records every text it synthesizes.'''
+
+    def __init__(self, output_folder):
+        self.translated_folder = output_folder
+        self.synthesized = []
+
+    def generate_audio(self, text, destination_language = None, input_url = None):
+        self.synthesized.append(text)
+        translated_path = self.translated_path_check(input_url, destination_language, "recording", text)
+        with open(translated_path, "w") as audio_file:
+            audio_file.write(text)
+        return translated_path
+
+
+def transcript_url(input_url):
+    return {"text": "A short transcription.", "video_title": "Fake video"}
+
+
+def build_summarizer(folder, translator = None, tts_generator = None):
+    '''The videos of the summarizer all have captions, so nothing is downloaded.'''
+    return PolySummaryYT(stage_cache=StageCache(os.path.join(folder, "stage_cache.sqlite")),
+                         videotranscriptor=SimpleNamespace(model="fake-whisper", transcript_url=transcript_url),
+                         translator=translator,
+                         tts_generators={"gtts": tts_generator},
+                         checkpoint_store=CheckpointStore(os.path.join(folder, "checkpoints.sqlite")),
+                         preprocess_audio=False)
+
+
+def cache_lookups(stage):
+    return {counter["labels"]["result"]: counter["value"] for counter in METRICS.to_dict()["counters"]
+            if counter["name"] == "polysummary_cache_lookups_total" and counter["labels"]["stage"] == stage}
+
+
+def test_regenerated_summary_gets_new_audio(tmp_path):
+    translator = ModelTranslator(model_name="model-a", memoize_summaries=False)
+    tts_generator = RecordingTTSGenerator(str(tmp_path / "audio"))
+    summarizer = build_summarizer(str(tmp_path), translator, tts_generator)
+
+    first = summarizer.summarize_video(VIDEO_URL, "english")
+    assert summarizer.summarize_video(VIDEO_URL, "english") == first
+    assert tts_generator.synthesized == ["summary by model-a"]
+
+    translator.model = "model-b"
+    second = summarizer.summarize_video(VIDEO_URL, "english")
+
+    assert second["text"] == "summary by model-b"
+    assert tts_generator.synthesized == ["summary by model-a", "summary by model-b"]
+    assert second["audio_path"] != first["audio_path"]
+    with open(second["audio_path"]) as audio_file:
+        assert audio_file.read() == "summary by model-b"
+
+
+def test_prefetched_stages_count_one_cache_lookup(tmp_path):
+    summarizer = build_summarizer(str(tmp_path))
+    METRICS.reset()
+
+    assert not summarizer.transcript_downloads(VIDEO_URL, VIDEO_ID)
+    summarizer.fetch_step(VIDEO_URL, VIDEO_ID)
+    assert summarizer.transcript_step(VIDEO_URL, VIDEO_ID) == transcript_url(VIDEO_URL)
+
+    assert cache_lookups("transcript") == {"miss": 1}
+    assert cache_lookups("captions") == {"hit": 1}
+    assert cache_lookups("download") == {}
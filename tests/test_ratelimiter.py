@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ratelimiter
+from ratelimiter import RateLimiter, parse_duration
+
+
+class FakeClock():
+    '''Replaces the clock of `ratelimiter`: sleeping only moves the time forward.'''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RawResponse():
+    '''Stands for the object returned by the `with_raw_response` methods of the SDKs.'''
+
+    def __init__(self, value, headers = None):
+        self.value = value
+        self.headers = headers or {}
+
+    def parse(self):
+        return self.value
+
+
+class APIStatusError(Exception):
+    def __init__(self, status_code, headers = None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class FakeEndpoint():
+    '''Raises the given errors at the first calls, then answers with a raw response.'''
+
+    def __init__(self, errors = (), headers = None):
+        self.errors = list(errors)
+        self.headers = headers
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return RawResponse("parsed", self.headers)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimiter, "time", SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    monkeypatch.setattr(ratelimiter, "BACKOFF_BASE_SECONDS", 0.0)
+    return clock
+
+
+def test_requests_are_paced_once_the_bucket_is_empty(clock):
+    limiter = RateLimiter("test", requests_per_minute=60)
+
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.now == 1000.0
+
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.now == pytest.approx(1002.0)
+
+
+def test_tokens_are_paced_by_their_bucket(clock):
+    limiter = RateLimiter("test", requests_per_minute=None, tokens_per_minute=600)
+
+    limiter.acquire(300)
+    limiter.acquire(300)
+    limiter.acquire(300)
+
+    # the third request waits for 300 tokens, refilled at 10 tokens per second
+    assert clock.now == pytest.approx(1030.0)
+
+
+def test_rate_limited_request_is_retried_after_retry_after(clock):
+    limiter = RateLimiter("test", requests_per_minute=None, max_retries=3)
+    endpoint = FakeEndpoint(errors=[APIStatusError(429, {"retry-after": "2"})])
+
+    assert limiter.call(endpoint) == "parsed"
+    assert endpoint.calls == 2
+    assert clock.now == pytest.approx(1002.0)
+
+
+def test_request_is_not_retried_on_a_client_error(clock):
+    limiter = RateLimiter("test", requests_per_minute=None)
+    endpoint = FakeEndpoint(errors=[APIStatusError(400)])
+
+    with pytest.raises(APIStatusError):
+        limiter.call(endpoint)
+    assert endpoint.calls == 1
+
+
+def test_retries_give_up_after_max_retries(clock):
+    limiter = RateLimiter("test", requests_per_minute=None, max_retries=2)
+    endpoint = FakeEndpoint(errors=[APIStatusError(503) for _ in range(5)])
+
+    with pytest.raises(APIStatusError):
+        limiter.call(endpoint)
+    assert endpoint.calls == 3
+
+
+def test_limits_follow_the_response_headers(clock):
+    limiter = RateLimiter("test", requests_per_minute=None, tokens_per_minute=6000)
+    endpoint = FakeEndpoint(headers={"x-ratelimit-limit-tokens": "1000", "x-ratelimit-remaining-tokens": "100"})
+
+    limiter.call(endpoint, tokens=0)
+    assert limiter.tokens.per_minute == 1000
+
+    # 300 tokens are missing, refilled at 1000 tokens per minute
+    limiter.acquire(400)
+    assert clock.now == pytest.approx(1018.0)
+
+
+def test_exhausted_requests_pause_until_the_reset(clock):
+    limiter = RateLimiter("test", requests_per_minute=30)
+    endpoint = FakeEndpoint(headers={"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m30s"})
+
+    limiter.call(endpoint)
+    limiter.acquire()
+
+    assert clock.now == pytest.approx(1090.0)
+
+
+@pytest.mark.parametrize("value, seconds", [("7.66s", 7.66), ("2m59.56s", 179.56), ("120ms", 0.12), ("3", 3.0), ("soon", None), (None, None)])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
@@ -0,0 +1,76 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import stagecache
+from stagecache import StageCache
+
+
+class FakeClock():
+    '''Replaces the clock of `stagecache`, so that the access times are all different.'''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(stagecache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def payload_size(value):
+    return len(json.dumps(value).encode("utf-8"))
+
+
+def test_entries_are_keyed_by_all_their_fields(tmp_path, clock):
+    cache = StageCache(str(tmp_path / "stage_cache.sqlite"))
+    cache.put("summary", "video", {"text": "italian summary"}, "model-a", "italian", "v1")
+
+    assert cache.get("summary", "video", "model-a", "italian", "v1") == {"text": "italian summary"}
+    assert cache.get("summary", "video", "model-a", "english", "v1") is None
+    assert cache.get("summary", "video", "model-b", "italian", "v1") is None
+    assert cache.get("summary", "video", "model-a", "italian", "v2") is None
+    assert cache.get("transcript", "video", "model-a", "italian", "v1") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    value = {"text": "x" * 100}
+    cache = StageCache(str(tmp_path / "stage_cache.sqlite"), max_bytes=2 * payload_size(value))
+    cache.put("transcript", "first", value)
+    cache.put("transcript", "second", value)
+    assert cache.get("transcript", "first") == value
+
+    cache.put("transcript", "third", value)
+
+    assert cache.contains("transcript", "first")
+    assert not cache.contains("transcript", "second")
+    assert cache.contains("transcript", "third")
+
+
+def test_expired_entries_are_missing(tmp_path, clock):
+    cache = StageCache(str(tmp_path / "stage_cache.sqlite"), max_age_seconds=10)
+    cache.put("transcript", "video", {"text": "transcription"})
+    assert cache.contains("transcript", "video")
+
+    clock.now += 60
+
+    assert cache.get("transcript", "video") is None
+
+
+def test_entries_of_deleted_files_are_missing(tmp_path, clock):
+    audio_path = tmp_path / "audio.mp3"
+    audio_path.write_bytes(b"audio")
+    cache = StageCache(str(tmp_path / "stage_cache.sqlite"))
+    cache.put("download", "video", {"video_path": str(audio_path), "files": [str(audio_path)]})
+    assert cache.contains("download", "video")
+
+    audio_path.unlink()
+
+    assert cache.get("download", "video") is None
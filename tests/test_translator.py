@@ -0,0 +1,176 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from checkpoints import CheckpointStore
+from summarymemo import SummaryMemo
+from translator import ChunkSummaryError, Groq_Translator
+
+SENTENCE_PATTERN = re.compile(r'sentence (\d+) of')
+
+
+def fake_summary(prompt: str) -> str:
+    '''The summary of a prompt names the first sentence of its text, so the summaries of different chunks are different.'''
+    return f"summary from {SENTENCE_PATTERN.search(prompt).group(1)}"
+
+
+class FakeTranslator(Groq_Translator):
+    '''Answers every request locally after a random delay; the requests whose summary is in `failing_summaries` fail.'''
+
+    def __init__(self, failing_summaries=(), max_delay=0.02, **kwargs):
+        kwargs.setdefault("memoize_summaries", False)
+        super().__init__(**kwargs)
+        self.failing_summaries = set(failing_summaries)
+        self.max_delay = max_delay
+        self.requested = []
+        self.lock = threading.Lock()
+
+    def translate_completion(self, assistant_prompt, translate_prompt, groq_api_key = None):
+        time.sleep(random.uniform(0, self.max_delay))
+        summary = fake_summary(translate_prompt)
+        with self.lock:
+            self.requested.append(summary)
+        if summary in self.failing_summaries:
+            raise RuntimeError(f"{summary} failed")
+        return summary
+
+
+def long_transcription(translator, n_chunks = 12):
+    '''A transcription of about `n_chunks` chunks, all with a different text.'''
+    n_sentences = n_chunks * translator.chunker.max_chars // len("This is sentence 000 of a long fake transcription. ")
+    return "".join(f"This is sentence {idx} of a long fake transcription. " for idx in range(n_sentences))
+
+
+def expected_summaries(translator, transcription):
+    return [fake_summary(chunk) for chunk in translator.split_transcription(transcription)]
+
+
+@pytest.mark.parametrize("max_workers", [1, 8])
+def test_multiple_translation_keeps_the_order_of_the_chunks(max_workers):
+    translator = FakeTranslator(max_workers=max_workers)
+    transcription = long_transcription(translator)
+    summaries = expected_summaries(translator, transcription)
+
+    summary = translator.translate_transcription(transcription, "title", "english")
+
+    assert len(summaries) > 1
+    assert summary == " ".join(summaries) + " "
+    assert sorted(translator.requested) == sorted(summaries)
+
+
+def test_short_transcription_is_a_single_request():
+    translator = FakeTranslator()
+
+    assert translator.translate_transcription("This is sentence 0 of a short transcription.", "title", "english") == "summary from 0"
+    assert translator.requested == ["summary from 0"]
+
+
+def test_failed_chunk_raises_with_the_completed_chunks():
+    translator = FakeTranslator(max_workers=4)
+    transcription = long_transcription(translator)
+    summaries = expected_summaries(translator, transcription)
+    translator.failing_summaries = {summaries[2]}
+
+    with pytest.raises(ChunkSummaryError) as error:
+        translator.translate_transcription(transcription, "title", "english")
+
+    # the other chunks are completed anyway, and a retry summarizes only the failed one
+    assert error.value.failed_chunks == [2]
+    assert len(error.value.completed_chunks) == len(summaries) - 1
+    translator.failing_summaries.clear()
+    translator.requested.clear()
+    summary = translator.translate_transcription(transcription, "title", "english", completed_chunks=error.value.completed_chunks)
+    assert translator.requested == [summaries[2]]
+    assert summary == " ".join(summaries) + " "
+
+
+def test_checkpoint_resumes_from_the_completed_chunks(tmp_path):
+    checkpoint = CheckpointStore(str(tmp_path / "checkpoints.sqlite")).checkpoint("video", "summary", "model", "english")
+    translator = FakeTranslator(max_workers=4)
+    transcription = long_transcription(translator)
+    summaries = expected_summaries(translator, transcription)
+    translator.failing_summaries = {summaries[1]}
+
+    with pytest.raises(ChunkSummaryError):
+        translator.translate_transcription(transcription, "title", "english", checkpoint=checkpoint)
+    assert len(checkpoint.load()) == len(summaries) - 1
+
+    resumed_translator = FakeTranslator(max_workers=4)
+    resumed_translator.translate_transcription(transcription, "title", "english", checkpoint=checkpoint)
+    assert resumed_translator.requested == [summaries[1]]
+
+
+def test_memoized_chunks_are_not_requested_again(tmp_path):
+    translator = FakeTranslator(summary_memo=SummaryMemo(str(tmp_path / "summary_memo.sqlite")), max_workers=4)
+    transcription = long_transcription(translator)
+
+    first_summary = translator.translate_transcription(transcription, "title", "english")
+    translator.requested.clear()
+    second_summary = translator.translate_transcription(transcription, "another title", "english")
+
+    assert translator.requested == []
+    assert second_summary == first_summary
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    '''Answers OpenAI-compatible chat completions like `FakeTranslator`, after a random delay; the summaries in `server.failing_summaries` fail.'''
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(random.uniform(0, 0.02))
+        summary = fake_summary(request["messages"][-1]["content"])
+        if summary in self.server.failing_summaries:
+            self.send_json(400, {"error": {"message": f"{summary} failed", "type": "invalid_request_error"}})
+            return
+        self.send_json(200, {
+            "id": "fake-completion", "object": "chat.completion", "created": int(time.time()), "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": summary}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+        })
+
+    def send_json(self, status, response):
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_groq(monkeypatch):
+    pytest.importorskip("groq")
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGroqHandler)
+    server.failing_summaries = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('GROQ_BASE_URL', f'http://127.0.0.1:{server.server_address[1]}')
+    # a key of its own, so that the client and the rate limiter of the key are built for this server and never throttle
+    api_key = f"fake-key-{server.server_address[1]}"
+    from ratelimiter import get_rate_limiter
+    rate_limiter = get_rate_limiter("groq", api_key, Groq_Translator(memoize_summaries=False).model)
+    rate_limiter.requests.per_minute = rate_limiter.tokens.per_minute = None
+    yield server, api_key
+    server.shutdown()
+
+
+def test_multiple_translation_against_the_fake_endpoint(fake_groq):
+    server, api_key = fake_groq
+    translator = Groq_Translator(max_workers=8, memoize_summaries=False)
+    transcription = long_transcription(translator)
+    summaries = expected_summaries(translator, transcription)
+
+    summary = translator.translate_transcription(transcription, "title", "english", api_key)
+    assert summary == " ".join(summaries) + " "
+
+    server.failing_summaries = {summaries[1]}
+    with pytest.raises(ChunkSummaryError) as error:
+        translator.translate_transcription(transcription, "title", "english", api_key)
+    assert error.value.failed_chunks == [1]